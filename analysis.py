@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+Waveform and loudness analysis of decoded audio with NumPy
+"""
+import shutil
+import subprocess
+from typing import Callable, Iterator, Optional, Tuple
+
+import numpy as np
+
+from database import TrackAnalysis, file_signature
+
+SAMPLE_RATE = 48000
+CHANNELS = 2
+# Loudness is measured on 400 ms blocks overlapping by 75%, i.e. stepping
+# by 100 ms, so audio is processed in 100 ms sub-blocks
+SUBBLOCK = SAMPLE_RATE // 10
+SUBBLOCKS_PER_BLOCK = 4
+# Sub-blocks decoded per read from ffmpeg (10 s of audio)
+READ_SUBBLOCKS = 100
+
+WAVEFORM_POINTS = 1000
+REFERENCE_LOUDNESS = -18.0
+ABSOLUTE_GATE = -70.0
+RELATIVE_GATE = -10.0
+
+# ITU-R BS.1770 K-weighting biquads at 48 kHz: a high shelf modelling the
+# head, then the RLB high-pass
+_SHELF = ([1.53512485958697, -2.69169618940638, 1.19839281085285],
+          [1.0, -1.69065929318241, 0.73248077421585])
+_HIGHPASS = ([1.0, -2.0, 1.0],
+             [1.0, -1.99004745483398, 0.99007225036621])
+
+
+class AnalysisError(RuntimeError):
+    """Raised when a file can't be decoded"""
+
+
+def _biquad_power(b, a, z: np.ndarray) -> np.ndarray:
+    """|H|^2 of a biquad evaluated at points on the unit circle"""
+    num = b[0] + b[1] / z + b[2] / z ** 2
+    den = a[0] + a[1] / z + a[2] / z ** 2
+    return np.abs(num / den) ** 2
+
+
+def _k_weights(n: int) -> np.ndarray:
+    """Per-bin weights turning |rfft|^2 of an n-sample block into its K-weighted mean square"""
+    z = np.exp(2j * np.pi * np.fft.rfftfreq(n))
+    weights = _biquad_power(*_SHELF, z) * _biquad_power(*_HIGHPASS, z)
+    # Parseval for a real signal: every bin but DC and Nyquist appears twice
+    weights[1:-1] *= 2
+    return weights / (n * n)
+
+
+_K_WEIGHTS = _k_weights(SUBBLOCK)
+
+
+def decode(path: str, chunk_frames: int = SUBBLOCK * READ_SUBBLOCKS) -> Iterator[np.ndarray]:
+    """Decode a file to 48 kHz stereo float32, yielding (frames, 2) blocks"""
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg is None:
+        raise AnalysisError("ffmpeg not found")
+    proc = subprocess.Popen(
+        [ffmpeg, "-nostdin", "-v", "error", "-i", path, "-vn",
+         "-ac", str(CHANNELS), "-ar", str(SAMPLE_RATE), "-f", "f32le", "-"],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    chunk_bytes = chunk_frames * CHANNELS * 4
+    try:
+        while True:
+            data = proc.stdout.read(chunk_bytes)
+            if not data:
+                break
+            usable = len(data) - len(data) % (CHANNELS * 4)
+            yield np.frombuffer(data[:usable], dtype="<f4").reshape(-1, CHANNELS)
+    finally:
+        proc.stdout.close()
+        stderr = proc.stderr.read()
+        proc.stderr.close()
+        returncode = proc.wait()
+    if returncode != 0:
+        raise AnalysisError(stderr.decode(errors="replace").strip() or "ffmpeg failed")
+
+
+def _subblock_stats(samples: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Per 100 ms sub-block: peak, mean square, K-weighted power and frame count"""
+    count = -(-len(samples) // SUBBLOCK)
+    padded = np.zeros((count * SUBBLOCK, CHANNELS), dtype=np.float32)
+    padded[:len(samples)] = samples
+    blocks = padded.reshape(count, SUBBLOCK, CHANNELS)
+
+    frames = np.full(count, SUBBLOCK)
+    frames[-1] = len(samples) - (count - 1) * SUBBLOCK
+    peaks = np.abs(blocks).max(axis=(1, 2))
+    mean_square = np.square(blocks).sum(axis=(1, 2)) / (frames * CHANNELS)
+
+    spectrum = np.fft.rfft(blocks, axis=1)
+    # Channel powers are summed with unit gains (front left/right)
+    weighted = (np.square(np.abs(spectrum)) * _K_WEIGHTS[None, :, None]).sum(axis=(1, 2))
+    return peaks, mean_square, weighted, frames
+
+
+def integrated_loudness(weighted: np.ndarray) -> Optional[float]:
+    """Gated integrated loudness (LUFS) from per-sub-block K-weighted power"""
+    if len(weighted) < SUBBLOCKS_PER_BLOCK:
+        return None
+    # Mean power of each 400 ms block, via a sliding window over sub-blocks
+    cumulative = np.concatenate(([0.0], np.cumsum(weighted, dtype=np.float64)))
+    power = (cumulative[SUBBLOCKS_PER_BLOCK:] - cumulative[:-SUBBLOCKS_PER_BLOCK]) / SUBBLOCKS_PER_BLOCK
+    with np.errstate(divide="ignore"):
+        loudness = -0.691 + 10 * np.log10(power)
+    gated = power[loudness > ABSOLUTE_GATE]
+    if not len(gated):
+        return None
+    relative_gate = -0.691 + 10 * np.log10(gated.mean()) + RELATIVE_GATE
+    gated = power[loudness > max(relative_gate, ABSOLUTE_GATE)]
+    return float(-0.691 + 10 * np.log10(gated.mean()))
+
+
+def downsample(peaks: np.ndarray, mean_square: np.ndarray, frames: np.ndarray,
+               points: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Reduce per-sub-block peaks/mean squares to at most `points` bins"""
+    points = max(1, min(points, len(peaks)))
+    starts = np.linspace(0, len(peaks), points + 1).astype(int)[:-1]
+    bin_peaks = np.maximum.reduceat(peaks, starts)
+    energy = np.add.reduceat(mean_square * frames, starts)
+    bin_rms = np.sqrt(energy / np.add.reduceat(frames, starts))
+    return bin_peaks, bin_rms
+
+
+def quantize(values: np.ndarray) -> bytes:
+    """0.0-1.0 floats to int8 (0-127)"""
+    return np.round(np.clip(values, 0.0, 1.0) * 127).astype(np.int8).tobytes()
+
+
+def dequantize(data: bytes) -> np.ndarray:
+    return np.frombuffer(data, dtype=np.int8).astype(np.float32) / 127
+
+
+def analyze_file(path: str, points: int = WAVEFORM_POINTS,
+                 on_samples: Optional[Callable[[np.ndarray], None]] = None) -> TrackAnalysis:
+    """Decode a file block by block and compute its waveform and loudness (blocking)
+
+    on_samples, if given, is also handed every decoded block, so other
+    per-track measurements (e.g. a fingerprint) can share the decode.
+    """
+    signature = file_signature(path)
+    if signature is None:
+        raise FileNotFoundError(f"File not found: {path}")
+
+    stats = [[], [], [], []]
+    pending = np.empty((0, CHANNELS), dtype=np.float32)
+    for samples in decode(path):
+        if on_samples is not None:
+            on_samples(samples)
+        # Keep sub-blocks aligned across reads
+        samples = np.concatenate((pending, samples)) if len(pending) else samples
+        whole = len(samples) - len(samples) % SUBBLOCK
+        pending = samples[whole:]
+        if whole:
+            for acc, values in zip(stats, _subblock_stats(samples[:whole])):
+                acc.append(values)
+    if len(pending):
+        # A trailing partial sub-block counts for the waveform, not loudness
+        for acc, values in zip(stats, _subblock_stats(pending)):
+            acc.append(values)
+    if not stats[0]:
+        raise AnalysisError(f"No audio decoded from {path}")
+
+    peaks, mean_square, weighted, frames = (np.concatenate(acc) for acc in stats)
+    if frames[-1] < SUBBLOCK:
+        weighted = weighted[:-1]
+
+    loudness = integrated_loudness(weighted)
+    peak = round(float(peaks.max()), 4)
+    gain = None
+    if loudness is not None:
+        gain = REFERENCE_LOUDNESS - loudness
+        if peak > 0:
+            # Never boost a track past the point where it would clip
+            gain = min(gain, -20 * np.log10(peak))
+        gain = round(float(gain), 2)
+
+    bin_peaks, bin_rms = downsample(peaks, mean_square, frames, points)
+    mtime, size = signature
+    return TrackAnalysis(
+        path=path,
+        mtime=mtime,
+        size=size,
+        loudness=round(loudness, 2) if loudness is not None else None,
+        peak=peak,
+        gain=gain,
+        peaks=quantize(bin_peaks),
+        rms=quantize(bin_rms),
+    )
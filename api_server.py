@@ -6,34 +6,115 @@ import os
 import sys
 import asyncio
 import threading
-from typing import List, Optional, Dict, Any
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from contextlib import asynccontextmanager
+from dataclasses import asdict, replace
+from typing import BinaryIO, List, Optional, Dict, Any, Tuple
 from pathlib import Path
 
-from fastapi import FastAPI, HTTPException, UploadFile, File, BackgroundTasks
+from fastapi import APIRouter, Depends, FastAPI, HTTPException, UploadFile, File, Query, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, Response
 from fastapi.staticfiles import StaticFiles
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+from starlette.websockets import WebSocketClose
 import uvicorn
 
 # Import our existing player functionality
 try:
     import vlc
-    from music_player import MusicPlayer as BaseMusicPlayer
+    from music_player import MusicPlayer as BaseMusicPlayer, probe_file, probe_instance, shared_instance
+    from artwork import (
+        DEFAULT_VARIANT_SIZE, VARIANT_FORMATS, VARIANT_SIZES, ArtworkCache, ArtworkError, ArtworkStore, variant_size,
+    )
+    from database import (
+        COMPACT_AFTER, AnalysisStore, DownloadJobStore, FingerprintStore, MediaIndex, MediaObject, MetadataCache,
+        PlaylistStore, PublishedStatus, SavedPlayer, StatusBoard, TrackMetadata, UploadSessionStore,
+    )
+    from downloader import DownloadManager, DownloadPolicy
+    from media_store import MediaStore
+    from scanner import LibraryScanner, ScanJob
+    from search import SearchIndex
+    from streaming import (
+        MAX_BITRATE, MIN_BITRATE, TRANSCODE_FORMATS, RangeFileResponse, RangeNotSatisfiable,
+        TranscodeCache, TranscodeError, content_type, parse_range,
+    )
+    from uploads import CHUNK_SIZE as UPLOAD_CHUNK_SIZE, UploadBusyError, UploadSessionManager, is_audio_file, store_stream
+    from events import EventBus
+    import ipc
+    from metrics import REGISTRY, fold, sample_stacks, timed
+    from playlist import IndexedPlaylist, PlaylistEdit
+    from replica import OwnerProxy, ReplicaEvents, current_role, owner_only, owner_url
+    from zones import DEFAULT_ZONE, ZONE_NAME, PlayerPool, ZoneLimitError
+    import workers
 except ImportError:
     print("VLC not found. Please install python-vlc: pip install python-vlc")
     sys.exit(1)
 
+# Largest page a client can ask /playlist for
+MAX_PAGE_SIZE = 1000
+
+# Seconds between event loop lag measurements
+LAG_INTERVAL = 0.5
+
+# The sampling profiler is only exposed when explicitly switched on
+PROFILING_ENABLED = os.environ.get("MUSIC_PLAYER_PROFILING") == "1"
+
+# This process's part in a multi-process deployment (see replica.py)
+ROLE = current_role()
+
+# Seconds between checks for zone state to publish to replicas (owner only)
+STATUS_PUBLISH_INTERVAL = 0.1
+
+# Replicas extrapolate the published position while a track plays; the
+# owner only republishes it when it drifts further than this (e.g. a seek)
+POSITION_DRIFT = 1.0
+
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    "music_http_request_seconds",
+    "HTTP request latency by route template",
+    ("method", "route", "status"),
+)
+EVENT_LOOP_LAG = REGISTRY.histogram(
+    "music_event_loop_lag_seconds",
+    "How late the event loop resumed a task sleeping for LAG_INTERVAL",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+PLAYBACK_UNDERRUNS = REGISTRY.counter(
+    "music_playback_underruns_total",
+    "Times playback stalled mid-track to refill its buffer",
+)
+ANALYSIS_DEFERRED = REGISTRY.counter(
+    "music_analysis_deferred_total",
+    "Tracks put in the analysis backlog because the analysis queue was full",
+)
+
 # Models for API requests/responses
 class TrackInfo(BaseModel):
     id: int
     title: str
     filename: str
     path: str
+    sha256: Optional[str] = None
     duration: Optional[float] = None
+    codec: Optional[str] = None
+    bitrate: Optional[int] = None
+    artist: Optional[str] = None
+    album: Optional[str] = None
+    genre: Optional[str] = None
+    # Name of the track's cover; fetch it from /track/{id}/art?v=<artwork>
+    artwork: Optional[str] = None
 
 class PlaylistResponse(BaseModel):
     tracks: List[TrackInfo]
     current_index: Optional[int] = None
+    total: int = 0
+    offset: int = 0
+    next_cursor: Optional[int] = None
+    version: Optional[str] = None
 
 class PlayerStatus(BaseModel):
     is_playing: bool
@@ -42,85 +123,576 @@ class PlayerStatus(BaseModel):
     position: float = 0.0
     duration: float = 0.0
     volume: int = 80
+    normalize: bool = False
 
 class DownloadRequest(BaseModel):
     url: str
 
+class BatchDownloadRequest(BaseModel):
+    urls: List[str]
+    expand_playlists: bool = True
+
+class DownloadJobInfo(BaseModel):
+    id: str
+    url: str
+    status: str
+    attempts: int
+    error: Optional[str] = None
+    path: Optional[str] = None
+    created_at: float
+    updated_at: float
+    downloaded_bytes: int = 0
+    total_bytes: Optional[int] = None
+    percent: Optional[float] = None
+    speed: Optional[float] = None
+    eta: Optional[int] = None
+
+class UploadSessionRequest(BaseModel):
+    filename: str
+    size: int
+
+class UploadSessionInfo(BaseModel):
+    id: str
+    filename: str
+    size: int
+    offset: int
+
+class ReorderRequest(BaseModel):
+    track_id: int
+    position: int
+
+class PlaybackSettings(BaseModel):
+    gapless: bool = False
+    prebuffer_seconds: float = Field(5.0, ge=0.5, le=60.0)
+    crossfade_seconds: float = Field(0.0, ge=0.0, le=15.0)
+    repeat: bool = False
+
 class VolumeRequest(BaseModel):
     volume: int
+    normalize: Optional[bool] = None
 
-# Enhanced Music Player class for API
-class APIPlayer(BaseMusicPlayer):
-    def __init__(self):
-        super().__init__()
+class WaveformResponse(BaseModel):
+    id: int
+    points: int
+    peaks: List[float]
+    rms: List[float]
+    loudness: Optional[float] = None
+    peak: float
+    gain: Optional[float] = None
+
+class DuplicateTrack(BaseModel):
+    path: str
+    title: str
+    artist: Optional[str] = None
+    album: Optional[str] = None
+    duration: Optional[float] = None
+    codec: Optional[str] = None
+    bitrate: Optional[int] = None
+    size: Optional[int] = None
+
+class DuplicateGroup(BaseModel):
+    tracks: List[DuplicateTrack]
+    # Lowest similarity among the matched pairs in the group
+    similarity: float
+
+class DuplicateReport(BaseModel):
+    fingerprinted: int
+    groups: List[DuplicateGroup]
+
+class LibraryScanRequest(BaseModel):
+    paths: List[str]
+    add_to_playlist: bool = True
+
+class AddTracksRequest(BaseModel):
+    paths: List[str]
+
+class NamedPlaylistRequest(BaseModel):
+    name: str = Field(..., min_length=1, max_length=100)
+
+class SearchResult(BaseModel):
+    path: str
+    title: str
+    artist: Optional[str] = None
+    album: Optional[str] = None
+    genre: Optional[str] = None
+    duration: Optional[float] = None
+    # The track's ID in the zone's playlist, if it is queued there
+    track_id: Optional[int] = None
+    score: float
+    # Only matched after correcting a misspelt word
+    fuzzy: bool = False
+
+class SearchResponse(BaseModel):
+    query: str
+    results: List[SearchResult]
+    took_ms: float
+
+class ScanJobInfo(BaseModel):
+    id: str
+    roots: List[str]
+    status: str
+    discovered: int = 0
+    unchanged: int = 0
+    to_probe: int = 0
+    probed: int = 0
+    failed: int = 0
+    removed: int = 0
+    added: int = 0
+    error: Optional[str] = None
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+class PlaylistReads:
+    """Playlist reads shared by the zone players and their API replicas
+
+    Expects `playlist`, `current_id`, `current_index`, `metadata`, `media`
+    and track_metadata() from the class it is mixed into.
+    """
+
+    def _track_info(self, track_id: int, file_path: str, check_file: bool = True) -> TrackInfo:
+        """Build a TrackInfo from cached metadata
+
+        With check_file=False the cache is read without touching the
+        filesystem and a miss falls back to filename-only info.
+        """
+        try:
+            meta = self.track_metadata(file_path) if check_file else self.metadata.peek(file_path)
+        except FileNotFoundError:
+            meta = None
+        filename = self.media.display_name(file_path)
+        stored = self.media.lookup_path(file_path)
+        sha256 = stored.sha256 if stored is not None else None
+        if meta is None:
+            return TrackInfo(
+                id=track_id,
+                title=os.path.splitext(filename)[0],
+                filename=filename,
+                path=file_path,
+                sha256=sha256,
+            )
+        return TrackInfo(
+            id=track_id,
+            title=meta.title,
+            filename=filename,
+            path=file_path,
+            sha256=sha256,
+            duration=meta.duration,
+            codec=meta.codec,
+            bitrate=meta.bitrate,
+            artist=meta.artist,
+            album=meta.album,
+            genre=meta.genre,
+            artwork=meta.artwork,
+        )
+
+    def playlist_version(self) -> str:
+        """Changes whenever the playlist or the current track changes"""
+        return f"{self.playlist.version}-{self.current_id}"
+
+    def _matches(self, path: str, query: str) -> bool:
+        """Case-insensitive substring match on title, tags or filename"""
+        filename = self.media.display_name(path)
+        meta = self.metadata.peek(path)
+        if meta is None:
+            fields = (os.path.splitext(filename)[0], filename)
+        else:
+            fields = (meta.title, meta.artist or "", meta.album or "", filename)
+        return any(query in field.lower() for field in fields)
+
+    def get_playlist(self, offset: int = 0, limit: Optional[int] = None,
+                     cursor: Optional[int] = None, query: Optional[str] = None) -> PlaylistResponse:
+        """Get a page of the playlist
+
+        `cursor` is the ID of the last track of the previous page and takes
+        precedence over `offset`. `query` filters by title or filename, in
+        which case offsets and cursors count matching tracks only.
+        """
+        matches = None
+        if query:
+            query = query.lower()
+            matches = [
+                (track_id, path) for track_id, path in self.playlist.items()
+                if self._matches(path, query)
+            ]
+        if cursor is not None:
+            if matches is None:
+                position = self.playlist.position_of(cursor) if self.playlist.has_id(cursor) else None
+            else:
+                position = next((i for i, (track_id, _) in enumerate(matches) if track_id == cursor), None)
+            if position is None:
+                raise HTTPException(status_code=400, detail="Unknown cursor")
+            offset = position + 1
+        offset = max(0, offset)
+        stop = None if limit is None else offset + limit
+
+        if matches is None:
+            total = len(self.playlist)
+            entries = list(self.playlist.items(offset, stop))
+        else:
+            total = len(matches)
+            entries = matches[offset:stop]
+
+        # Read-through only: tracks are probed when they are added, never here
+        tracks = [self._track_info(track_id, path, check_file=False) for track_id, path in entries]
+        has_more = stop is not None and stop < total
         
+        return PlaylistResponse(
+            tracks=tracks,
+            current_index=self.current_index if self.playlist else None,
+            total=total,
+            offset=offset,
+            next_cursor=tracks[-1].id if has_more and tracks else None,
+            version=self.playlist_version(),
+        )
+
+# Enhanced Music Player class for API
+class APIPlayer(PlaylistReads, BaseMusicPlayer):
+    def __init__(self, zone: str = DEFAULT_ZONE, instance: Optional["vlc.Instance"] = None,
+                 metadata: Optional[MetadataCache] = None, media: Optional[MediaStore] = None,
+                 analysis: Optional[AnalysisStore] = None, store: Optional[PlaylistStore] = None,
+                 board: Optional[StatusBoard] = None):
+        """A player for one zone; zones share the libVLC instance and library stores
+
+        libVLC itself is started by the first playback call of any zone. The
+        zone's playlist, current track, position and settings are restored
+        from the playlist store. With a status board, publish_status() shares
+        the zone's state with API replicas.
+        """
+        super().__init__(instance=instance, instance_factory=shared_instance)
+        self.zone = zone
+        # Follow-up work from libVLC callbacks (auto-advance, preloading)
+        # runs on the same control thread as the API calls
+        self.dispatch = workers.control.submit
+        self.metadata = metadata if metadata is not None else MetadataCache()
+        self.analysis = analysis if analysis is not None else AnalysisStore()
+        self.media = media if media is not None else MediaStore()
+        self.store = store if store is not None else PlaylistStore()
+        self.board = board
+        self._published: Optional[PublishedStatus] = None
+        self._current_track: Optional[TrackInfo] = None
+        self.events = EventBus()
+        self._stalled = False
+        self._attach_events()
+        # Every zone starts on a playlist named after itself
+        self.playlist_name = zone
+        self._checkpointed: Optional[SavedPlayer] = None
+        self.restore()
+
+    def _attach_events(self):
+        """Forward libVLC player events to the event bus"""
+        states = {
+            vlc.EventType.MediaPlayerPlaying: (True, False),
+            vlc.EventType.MediaPlayerPaused: (False, True),
+            vlc.EventType.MediaPlayerStopped: (False, False),
+            vlc.EventType.MediaPlayerEndReached: (False, False),
+        }
+
+        def on_state(event):
+            is_playing, is_paused = states[event.type]
+            self.events.publish("state", is_playing=is_playing, is_paused=is_paused)
+
+        def on_time_changed(event):
+            length = self.player.get_length()
+            self.events.publish(
+                "position",
+                position=max(event.u.new_time, 0) / 1000.0,
+                duration=length / 1000.0 if length > 0 else 0.0,
+            )
+
+        def on_buffering(event):
+            # The initial fill happens before the first time change; buffering
+            # after that means the input couldn't keep up
+            if event.u.new_cache < 100:
+                if not self._stalled and self.player.get_time() > 0:
+                    self._stalled = True
+                    PLAYBACK_UNDERRUNS.inc()
+            else:
+                self._stalled = False
+
+        for event_type in states:
+            self.on(event_type, on_state)
+        self.on(vlc.EventType.MediaPlayerTimeChanged, on_time_changed)
+        self.on(vlc.EventType.MediaPlayerBuffering, on_buffering)
+
+    def restore(self):
+        """Reopen the playlist and player state the zone had at its last checkpoint"""
+        saved = self.store.load_player(self.zone)
+        self.open_playlist(saved.playlist if saved is not None else self.zone)
+        if saved is not None:
+            settings = saved.settings
+            if self.playlist.has_id(saved.current_id):
+                self.current_id = saved.current_id
+                self._resume_ms = saved.position_ms
+            self.gapless = settings.get("gapless", self.gapless)
+            self.prebuffer_seconds = settings.get("prebuffer_seconds", self.prebuffer_seconds)
+            self.crossfade_seconds = settings.get("crossfade_seconds", self.crossfade_seconds)
+            self.repeat = settings.get("repeat", self.repeat)
+            super().set_volume(settings.get("volume", self.volume), settings.get("normalize", self.normalize))
+            self._checkpointed = saved
+        self.checkpoint()
+
+    def open_playlist(self, name: str):
+        """Switch to a stored playlist, creating it empty if it doesn't exist yet
+
+        The snapshot is rebuilt in one pass and only the edits journaled
+        since are replayed, so a long playlist opens in O(n) rather than
+        one insert per track.
+        """
+        stored = self.store.load(name)
+        self.stop()
+        self._discard_preload()
+        if self.vlc_started:
+            self.player.set_media(None)
+        self._resume_ms = 0
+        self._current_track = None
+        if stored is None:
+            self.playlist.restore([], self.playlist.next_id, self.playlist.version)
+            self.store.write(name, [], self.playlist.next_id, self.playlist.version)
+        else:
+            self.playlist.restore(stored.items, stored.next_id, stored.version)
+            for edit in stored.edits:
+                try:
+                    self.playlist.apply(edit)
+                except (KeyError, ValueError):
+                    # An edit that no longer applies can't be recovered; skip it
+                    continue
+        self.current_index = 0
+        self.playlist_name = name
+
+    def playlist_edited(self, edits: List[PlaylistEdit]):
+        """Journal the edits; a clear makes the journal moot, so it is compacted instead"""
+        if any(op == "clear" for op, _, _, _ in edits):
+            self.compact()
+            return
+        self.store.record(
+            self.playlist_name, edits, len(self.playlist), self.playlist.next_id, self.playlist.version
+        )
+
+    def compact(self):
+        """Replace the playlist's snapshot and journal with a fresh snapshot"""
+        self.store.write(
+            self.playlist_name, list(self.playlist.items()), self.playlist.next_id, self.playlist.version
+        )
+
+    def checkpoint(self, compact: bool = False):
+        """Save the current track, position and settings if any of them changed
+
+        Runs every few seconds, so it relies on the store committing
+        without an fsync. Also compacts the playlist once its journal is
+        long, or whenever asked to and there is anything to compact.
+        """
+        saved = SavedPlayer(
+            zone=self.zone,
+            playlist=self.playlist_name,
+            current_id=self.current_id,
+            position_ms=self.resume_position() if self.current_id is not None else 0,
+            settings={
+                "volume": self.volume,
+                "normalize": self.normalize,
+                "gapless": self.gapless,
+                "prebuffer_seconds": self.prebuffer_seconds,
+                "crossfade_seconds": self.crossfade_seconds,
+                "repeat": self.repeat,
+            },
+        )
+        if saved != self._checkpointed:
+            self.store.save_player(saved)
+            self._checkpointed = saved
+        journal = self.store.journal_length(self.playlist_name)
+        if journal >= COMPACT_AFTER or (compact and journal):
+            self.compact()
+
+    def _check_not_in_use(self, name: str):
+        if any(zone != self.zone for zone in self.store.zones_using(name)):
+            raise HTTPException(status_code=409, detail="Playlist is in use by another zone")
+
+    def save_playlist(self, name: str):
+        """Store a copy of the playlist under a name"""
+        self._check_not_in_use(name)
+        self.store.write(name, list(self.playlist.items()), self.playlist.next_id, self.playlist.version)
+
+    def load_playlist(self, name: str):
+        """Switch the zone to a named playlist, stopping playback"""
+        if not self.store.exists(name):
+            raise HTTPException(status_code=404, detail="Playlist not found")
+        self._check_not_in_use(name)
+        self.open_playlist(name)
+        self.checkpoint()
+        self.events.publish("playlist", action="reload", version=self.playlist_version())
+        self.track_changed()
+
+    def publish_status(self):
+        """Publish the zone's status and settings to the status board if they changed
+
+        Replicas extrapolate the position of a playing track, so a position
+        that merely moved on with the clock isn't republished.
+        """
+        if self.board is None:
+            return
+        now = time.time()
+        status = self.get_status().model_dump()
+        settings = {
+            **self.get_playback_settings().model_dump(),
+            "volume": self.volume,
+            "normalize": self.normalize,
+        }
+        last = self._published
+        if last is not None and last.playlist == self.playlist_name and last.settings == settings \
+                and {**last.status, "position": None} == {**status, "position": None}:
+            elapsed = now - last.published_at if status["is_playing"] else 0.0
+            if abs(status["position"] - last.status["position"] - elapsed) <= POSITION_DRIFT:
+                return
+        self._published = PublishedStatus(self.zone, self.playlist_name, status, settings, now)
+        self.board.publish(self._published)
+
+    def release(self):
+        """Checkpoint and compact, then free the libVLC players"""
+        self.checkpoint(compact=True)
+        super().release()
+
+    def track_metadata(self, file_path: str) -> TrackMetadata:
+        """Get metadata for a file, probing it only if the cache is stale
+
+        Probing uses the calling thread's own libVLC instance, so the probe
+        pool never shares one with the players on the control thread.
+        """
+        meta = self.metadata.get(file_path)
+        if meta is None:
+            with timed("probe"):
+                meta = probe_file(probe_instance(), file_path, self.media.display_name(file_path))
+            if meta is None:
+                raise FileNotFoundError(f"File not found: {file_path}")
+            self.metadata.put(meta)
+        return meta
+
     def add_track(self, file_path: str) -> TrackInfo:
         """Add a track to the playlist"""
         if not os.path.exists(file_path):
             raise FileNotFoundError(f"File not found: {file_path}")
             
+        # Probe once up front so later playlist reads hit the cache
+        self.track_metadata(file_path)
+
         # Add to base class playlist
-        self.add_single(file_path)
-        
-        track_id = len(self.playlist) - 1
-        filename = os.path.basename(file_path)
-        title = os.path.splitext(filename)[0]
-        
-        # Try to get duration
-        media = self.instance.media_new(file_path)
-        media.parse()
-        duration = media.get_duration() / 1000.0 if media.get_duration() > 0 else None
-        
-        track = TrackInfo(
-            id=track_id,
-            title=title,
-            filename=filename,
-            path=file_path,
-            duration=duration
-        )
+        is_new = not self.contains(file_path)
+        track_id = self.add_single(file_path)
         
+        track = self._track_info(track_id, file_path)
+        if is_new:
+            self.events.publish("playlist", action="add", track=track.model_dump())
         return track
     
-    def get_playlist(self) -> PlaylistResponse:
-        """Get current playlist"""
-        tracks = []
-        for i, path in enumerate(super().get_playlist()):
-            filename = os.path.basename(path)
-            title = os.path.splitext(filename)[0]
-            
-            # Try to get duration
-            media = self.instance.media_new(path)
-            media.parse()
-            duration = media.get_duration() / 1000.0 if media.get_duration() > 0 else None
-            
-            track = TrackInfo(
-                id=i,
-                title=title,
-                filename=filename,
-                path=path,
-                duration=duration
-            )
-            tracks.append(track)
-        
-        return PlaylistResponse(
-            tracks=tracks,
-            current_index=self.current_index if tracks else None
+    def add_tracks(self, file_paths: List[str]) -> List[int]:
+        """Add many already-probed files at once; returns the new track IDs
+
+        Clients are told to reload rather than sent one event per track.
+        """
+        track_ids = self.add(file_paths)
+        if track_ids:
+            self.events.publish("playlist", action="reload", version=self.playlist_version())
+        return track_ids
+
+    def remove_id(self, track_id: int) -> Optional[str]:
+        """Remove track by ID; returns its path"""
+        path = super().remove_id(track_id)
+        if path is not None:
+            self.events.publish("playlist", action="remove", id=track_id)
+        return path
+
+    def move_track(self, track_id: int, position: int) -> bool:
+        """Move a track to a new position"""
+        if not super().move_track(track_id, position):
+            return False
+        self.events.publish(
+            "playlist", action="move", id=track_id, position=self.playlist.position_of(track_id)
         )
-    
-    def play_track(self, index: int = None):
-        """Play track at specific index or current index"""
-        playlist = super().get_playlist()
-        if not playlist:
+        return True
+
+    def clear_playlist(self):
+        """Clear the playlist"""
+        super().clear_playlist()
+        self._current_track = None
+        self.events.publish("playlist", action="clear")
+
+    def set_volume(self, volume: int, normalize: Optional[bool] = None):
+        """Set volume (0-100), optionally switching normalization"""
+        super().set_volume(volume, normalize)
+        self.events.publish("volume", volume=self.volume, normalize=self.normalize)
+
+    def is_idle(self) -> bool:
+        """Idle players with live event subscribers are still in use"""
+        return super().is_idle() and not self.events.has_subscribers()
+
+    def track_gain(self, file_path: str) -> Optional[float]:
+        return self.analysis.gain(file_path)
+
+    def analyze(self, file_path: str, on_samples=None) -> bool:
+        """Compute and store a track's waveform and loudness unless already current
+
+        Returns whether the file was decoded (and on_samples fed).
+        """
+        # NumPy is only imported once there is something to analyse
+        from analysis import analyze_file
+
+        if self.analysis.is_current(file_path):
+            return False
+        with timed("analysis"):
+            result = analyze_file(file_path, on_samples=on_samples)
+        self.analysis.put(result)
+        track_id = self.playlist.id_of_path(file_path)
+        if track_id is not None:
+            self.events.publish("analysis", id=track_id)
+        if self.normalize and file_path == self.get_current_track():
+            # Apply the new gain to the track that is already playing
+            self.dispatch(self.set_volume, self.volume)
+        return True
+
+    def play_track(self, index: int = None, track_id: int = None):
+        """Play track at specific index, by ID, or current index"""
+        if not self.playlist:
             raise HTTPException(status_code=400, detail="Playlist is empty")
             
-        if index is not None:
-            if 0 <= index < len(playlist):
+        if track_id is not None:
+            if not self.playlist.has_id(track_id):
+                raise HTTPException(status_code=404, detail="Track not found")
+            self.play_id(track_id)
+        elif index is not None:
+            if 0 <= index < len(self.playlist):
                 self.play_index(index)
             else:
                 raise HTTPException(status_code=400, detail="Invalid track index")
         else:
             self.play()
     
+    def track_changed(self):
+        """Capture the new track's metadata for /status and announce it"""
+        current_path = self.get_current_track()
+        track = None
+        if current_path:
+            track = self._track_info(self.current_id, current_path, check_file=False)
+        self._current_track = track
+        self.events.publish(
+            "track",
+            current_track=track.model_dump() if track else None,
+            current_index=self.current_index,
+        )
+
+    def get_playback_settings(self) -> "PlaybackSettings":
+        return PlaybackSettings(
+            gapless=self.gapless,
+            prebuffer_seconds=self.prebuffer_seconds,
+            crossfade_seconds=self.crossfade_seconds,
+            repeat=self.repeat,
+        )
+
+    def set_playback_settings(self, settings: "PlaybackSettings"):
+        if not settings.gapless:
+            self._discard_preload()
+        self.gapless = settings.gapless
+        self.prebuffer_seconds = settings.prebuffer_seconds
+        self.crossfade_seconds = settings.crossfade_seconds if settings.gapless else 0.0
+        self.repeat = settings.repeat
+
     def next_track(self):
         """Play next track"""
         self.next()
@@ -134,27 +706,24 @@ class APIPlayer(BaseMusicPlayer):
         is_playing = self.is_playing()
         is_paused = self.is_paused()
         
-        current_track = None
+        # Served from the track captured in play_index(); only rebuilt
+        # (from the in-memory cache, no file I/O) when the current track changed
+        current_track = self._current_track
         current_path = self.get_current_track()
-        if current_path:
-            filename = os.path.basename(current_path)
-            title = os.path.splitext(filename)[0]
-            
-            # Try to get duration
-            media = self.instance.media_new(current_path)
-            media.parse()
-            duration = media.get_duration() / 1000.0 if media.get_duration() > 0 else None
-            
-            current_track = TrackInfo(
-                id=self.current_index,
-                title=title,
-                filename=filename,
-                path=current_path,
-                duration=duration
-            )
+        if current_path is None:
+            current_track = None
+        elif current_track is None or current_track.path != current_path:
+            track_id = self.playlist.id_of_path(current_path)
+            current_track = self._track_info(track_id, current_path, check_file=False)
+            self._current_track = current_track
         
-        position = self.get_position() * (current_track.duration or 0) if current_track else 0
-        duration = current_track.duration or 0 if current_track else 0
+        # Position and length come from the live MediaPlayer
+        position = 0.0
+        duration = 0.0
+        if current_track:
+            length = self.get_length()
+            duration = length / 1000.0 if length > 0 else (current_track.duration or 0.0)
+            position = max(self.get_time(), 0) / 1000.0
         
         return PlayerStatus(
             is_playing=is_playing,
@@ -162,11 +731,246 @@ class APIPlayer(BaseMusicPlayer):
             current_track=current_track,
             position=position,
             duration=duration,
-            volume=self.volume
+            volume=self.volume,
+            normalize=self.normalize,
         )
 
+class ReplicaPlayer(PlaylistReads):
+    """A zone as an API replica sees it (see replica.py)
+
+    Reads are served from what the owner publishes: the zone's status and
+    settings from the status board, and its playlist from the playlist
+    store, rebuilt whenever the stored version moves on. Writes run in the
+    owner's player over its control socket. refresh() brings the copy up
+    to date and runs on the control thread before each request.
+    """
+
+    def __init__(self, zone: str, metadata: MetadataCache, media: MediaStore,
+                 store: PlaylistStore, board: StatusBoard):
+        self.zone = zone
+        self.metadata = metadata
+        self.media = media
+        self.store = store
+        self.board = board
+        self.events = ReplicaEvents(zone)
+        self.playlist = IndexedPlaylist()
+        self.playlist_name = zone
+        self.current_id: Optional[int] = None
+        # (playlist name, stored version) the copy was built from
+        self._loaded: Optional[tuple] = None
+        self._published: Optional[PublishedStatus] = None
+        self._client: Optional["ipc.IPCClient"] = None
+
+    @property
+    def current_index(self) -> int:
+        if self.current_id is None or not self.playlist.has_id(self.current_id):
+            return 0
+        return self.playlist.position_of(self.current_id)
+
+    def refresh(self):
+        """Pick up the owner's latest status and playlist edits"""
+        since = self._published.published_at if self._published is not None else None
+        published = self.board.read(self.zone, since)
+        if published is not None:
+            self._published = published
+            self.playlist_name = published.playlist
+            track = published.status.get("current_track")
+            self.current_id = track["id"] if track else None
+        version = self.store.version(self.playlist_name)
+        if (self.playlist_name, version) == self._loaded:
+            return
+        playlist = IndexedPlaylist()
+        stored = self.store.load(self.playlist_name)
+        if stored is not None:
+            playlist.restore(stored.items, stored.next_id, stored.version)
+            for edit in stored.edits:
+                try:
+                    playlist.apply(edit)
+                except (KeyError, ValueError):
+                    continue
+        self.playlist = playlist
+        self._loaded = (self.playlist_name, version)
+
+    def playlist_version(self) -> str:
+        # The owner's version as stored, so every replica sends the same ETag
+        version = self._loaded[1] if self._loaded is not None else None
+        return f"{self.playlist_name}.{version}-{self.current_id}"
+
+    def track_metadata(self, file_path: str) -> TrackMetadata:
+        """Metadata the owner has cached; replicas never probe files themselves"""
+        meta = self.metadata.peek(file_path)
+        if meta is None:
+            raise FileNotFoundError(f"File not found: {file_path}")
+        return meta
+
+    def get_status(self) -> PlayerStatus:
+        if self._published is None:
+            return PlayerStatus(is_playing=False, is_paused=False)
+        status = PlayerStatus(**self._published.status)
+        if status.is_playing:
+            status.position += time.time() - self._published.published_at
+            if status.duration:
+                status.position = min(status.position, status.duration)
+        return status
+
+    def get_playback_settings(self) -> PlaybackSettings:
+        if self._published is None:
+            return PlaybackSettings()
+        return PlaybackSettings(**{
+            name: value for name, value in self._published.settings.items()
+            if name in PlaybackSettings.model_fields
+        })
+
+    def _call(self, method: str, *args) -> Any:
+        """Run a player method in the owner, raising its HTTP errors here"""
+        try:
+            if self._client is None or not self._client.connected:
+                client = ipc.IPCClient.connect()
+                if client is None:
+                    raise ConnectionError("Player owner is not listening")
+                client.call("use_zone", self.zone)
+                self._client = client
+            reply = self._client.call("call", method, *args)
+        except (ConnectionError, TimeoutError, ipc.IPCError) as e:
+            raise HTTPException(status_code=502, detail=f"Player owner is unavailable: {e}")
+        if reply["status"] is not None:
+            raise HTTPException(status_code=reply["status"], detail=reply["detail"])
+        # The owner published before replying, so this reads its own write
+        self.refresh()
+        return reply["result"]
+
+    def play_track(self, index: int = None, track_id: int = None):
+        self._call("play_track", index, track_id)
+
+    def pause(self):
+        self._call("pause")
+
+    def stop(self):
+        self._call("stop")
+
+    def next_track(self):
+        self._call("next_track")
+
+    def previous_track(self):
+        self._call("previous_track")
+
+    def set_volume(self, volume: int, normalize: Optional[bool] = None):
+        self._call("set_volume", volume, normalize)
+
+    def set_playback_settings(self, settings: PlaybackSettings):
+        self._call("set_playback_settings", settings.model_dump())
+
+    def add_tracks(self, file_paths: List[str]) -> List[int]:
+        return self._call("add_tracks", file_paths)
+
+    def remove_id(self, track_id: int) -> Optional[str]:
+        return self._call("remove_id", track_id)
+
+    def move_track(self, track_id: int, position: int) -> bool:
+        return self._call("move_track", track_id, position)
+
+    def clear_playlist(self):
+        self._call("clear_playlist")
+
+    def save_playlist(self, name: str):
+        self._call("save_playlist", name)
+
+    def load_playlist(self, name: str):
+        self._call("load_playlist", name)
+
+    def release(self):
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+
+# Paths answered while the server is still starting up
+ALWAYS_AVAILABLE = ("/", "/health", "/ready", "/workers", "/metrics", "/debug/profile")
+
+# Library state shared by every zone, the zone players and the background
+# services; all of them are created by initialize() once the server is
+# listening, so startup doesn't wait on the library database
+metadata: Optional[MetadataCache] = None
+media_store: Optional[MediaStore] = None
+analysis_store: Optional[AnalysisStore] = None
+fingerprint_store: Optional[FingerprintStore] = None
+playlist_store: Optional[PlaylistStore] = None
+search_index: Optional[SearchIndex] = None
+players: Optional[PlayerPool] = None
+player: Optional[APIPlayer] = None
+transcode_cache: Optional[TranscodeCache] = None
+artwork_store: Optional[ArtworkStore] = None
+artwork_cache: Optional[ArtworkCache] = None
+library_scanner: Optional[LibraryScanner] = None
+downloads: Optional[DownloadManager] = None
+upload_sessions: Optional[UploadSessionManager] = None
+# Shared zone state: published by an owner, read by replicas
+status_board: Optional[StatusBoard] = None
+# Replicas only: their view of each zone, and the way to the owner
+replicas: Dict[str, ReplicaPlayer] = {}
+owner_proxy: Optional[OwnerProxy] = None
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start listening right away and bring the library up in the background"""
+    app.state.ready = False
+    app.state.startup_error = None
+    app.state.started_at = time.monotonic()
+    app.state.ready_after = None
+    app.state.zone_sweeper = None
+    app.state.checkpointer = None
+    app.state.analyzer = None
+    app.state.ipc = None
+    app.state.publisher = None
+    app.state.lag_monitor = asyncio.create_task(monitor_event_loop())
+    app.state.initializer = asyncio.create_task(
+        initialize_replica(app) if ROLE == "replica" else initialize(app)
+    )
+    try:
+        yield
+    finally:
+        await shutdown(app)
+
 # Initialize FastAPI app
-app = FastAPI(title="Music Player API", version="1.0.0")
+app = FastAPI(title="Music Player API", version="1.0.0", lifespan=lifespan)
+
+class ReadinessMiddleware:
+    """Answers 503 (or closes WebSockets) until the library and players are up"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] in ("http", "websocket") and not scope["app"].state.ready \
+                and scope["path"] not in ALWAYS_AVAILABLE:
+            if scope["type"] == "websocket":
+                response = WebSocketClose(code=1013)
+            else:
+                response = JSONResponse(
+                    {"detail": "Server is starting up"},
+                    status_code=503,
+                    headers={"Retry-After": "1"},
+                )
+            await response(scope, receive, send)
+            return
+        await self.app(scope, receive, send)
+
+class ReplicaMiddleware:
+    """In a replica, hands requests that need the owner's state to the owner"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and owner_proxy is not None \
+                and owner_only(scope["method"], scope["path"], scope["query_string"].decode("latin-1")):
+            await owner_proxy(scope, receive, send)
+            return
+        await self.app(scope, receive, send)
+
+app.add_middleware(ReplicaMiddleware)
+
+# Innermost but for the replica hand-over, so that even 503s carry CORS headers
+app.add_middleware(ReadinessMiddleware)
 
 # Enable CORS for React frontend
 app.add_middleware(
@@ -175,160 +979,1362 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],
+)
+
+class APIGZipMiddleware(GZipMiddleware):
+    """GZip for API responses; audio streams and artwork are sent as-is"""
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and (scope["path"].startswith("/stream/") or scope["path"].endswith("/art")):
+            # Compressing audio or images gains nothing and would break byte ranges
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
+
+# Compress large responses such as full playlists
+app.add_middleware(APIGZipMiddleware, minimum_size=1024)
+
+class MetricsMiddleware:
+    """Records each HTTP request's latency under its route template"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status = 500
+        start = asyncio.get_running_loop().time()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # Templates rather than raw paths keep the label set bounded
+            route = scope.get("route")
+            HTTP_REQUEST_SECONDS.observe(
+                asyncio.get_running_loop().time() - start,
+                method=scope["method"],
+                route=route.path if route is not None else "unmatched",
+                status=status,
+            )
+
+# Outermost, so latency includes compression and the other middleware
+app.add_middleware(MetricsMiddleware)
+
+def _collect_pools(field: str):
+    return lambda: [({"pool": name}, stats[field]) for name, stats in workers.stats().items()]
+
+REGISTRY.collected("music_worker_queued", "Jobs waiting in each worker pool", "gauge", _collect_pools("queued"))
+REGISTRY.collected("music_worker_active", "Jobs running in each worker pool", "gauge", _collect_pools("active"))
+REGISTRY.collected("music_worker_completed_total", "Jobs each worker pool finished without an error", "counter",
+                   _collect_pools("completed"))
+REGISTRY.collected("music_worker_failed_total", "Jobs that raised in each worker pool", "counter",
+                   _collect_pools("failed"))
+
+def _cache_lookups() -> Dict[str, tuple]:
+    """(hits, misses) per cache, for the caches that exist yet"""
+    lookups = {}
+    if metadata is not None:
+        lookups["metadata"] = (metadata.hits, metadata.misses)
+    if transcode_cache is not None:
+        stats = transcode_cache.stats()
+        lookups["transcode"] = (stats["hits"], stats["misses"])
+    if artwork_cache is not None:
+        stats = artwork_cache.stats()
+        lookups["artwork"] = (stats["hits"], stats["misses"])
+    return lookups
+
+def _collect_cache_lookups():
+    for cache, (hits, misses) in _cache_lookups().items():
+        yield {"cache": cache, "result": "hit"}, hits
+        yield {"cache": cache, "result": "miss"}, misses
+
+def _collect_cache_ratios():
+    for cache, (hits, misses) in _cache_lookups().items():
+        if hits + misses:
+            yield {"cache": cache}, hits / (hits + misses)
+
+REGISTRY.collected("music_cache_lookups_total", "Cache lookups by cache and result", "counter",
+                   _collect_cache_lookups)
+REGISTRY.collected("music_cache_hit_ratio", "Share of cache lookups that hit since startup", "gauge",
+                   _collect_cache_ratios)
+REGISTRY.collected(
+    "music_transcode_cache_bytes", "Size of the transcode cache on disk", "gauge",
+    lambda: [({}, transcode_cache.total_bytes)] if transcode_cache is not None else [],
+)
+REGISTRY.collected(
+    "music_artwork_cache_bytes", "Size of the resized artwork cache on disk", "gauge",
+    lambda: [({}, artwork_cache.total_bytes)] if artwork_cache is not None else [],
+)
+REGISTRY.collected(
+    "music_analysis_backlog", "Tracks waiting for room in the analysis queue", "gauge",
+    lambda: [({}, len(analysis_backlog))],
 )
+REGISTRY.collected(
+    "music_zones_active", "Zones with a live player", "gauge",
+    lambda: [({}, len(players.live()))] if players is not None else [],
+)
+
+def create_player(zone: str) -> APIPlayer:
+    return APIPlayer(zone, None, metadata, media_store, analysis_store, playlist_store, status_board)
+
+def replica_player(zone: str) -> ReplicaPlayer:
+    """A replica's up-to-date view of a zone (on the control thread)"""
+    metadata.refresh()
+    replica = replicas.get(zone)
+    if replica is None:
+        replica = replicas[zone] = ReplicaPlayer(zone, metadata, media_store, playlist_store, status_board)
+    replica.refresh()
+    return replica
+
+# Seconds between sweeps for idle zones to evict
+ZONE_SWEEP_INTERVAL = 60.0
+
+# Seconds between checkpoints of every live zone's track, position and
+# settings; a crash loses at most this much of the playback position
+CHECKPOINT_INTERVAL = 5.0
+
+async def zone_player(zone: str = DEFAULT_ZONE) -> APIPlayer:
+    """The player for a zone, created (or restored) on first use"""
+    if not ZONE_NAME.match(zone):
+        raise HTTPException(status_code=400, detail="Invalid zone name")
+    if ROLE == "replica":
+        return await workers.control.run(replica_player, zone)
+    live = players.peek(zone)
+    if live is not None:
+        return live
+    try:
+        return await workers.control.run(players.get, zone)
+    except ZoneLimitError as e:
+        raise HTTPException(status_code=503, detail=str(e))
 
-# Initialize player
-player = APIPlayer()
+# Playback routes, served both for the default zone at the top level and
+# for every zone under /zones/{zone}
+zone_router = APIRouter()
 
 # Create directories
 os.makedirs("uploads", exist_ok=True)
 os.makedirs("downloads", exist_ok=True)
 
-# Mount static files
-app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
-app.mount("/downloads", StaticFiles(directory="downloads"), name="downloads")
+# LSH index over the stored fingerprints; built on first use, as it needs NumPy
+duplicates: Optional["DuplicateIndex"] = None
+_duplicates_lock = threading.Lock()
+
+def duplicate_index() -> "DuplicateIndex":
+    global duplicates
+    with _duplicates_lock:
+        if duplicates is None:
+            from fingerprint import DuplicateIndex
+            duplicates = DuplicateIndex(fingerprint_store)
+        return duplicates
+
+def analyze_track(file_path: str):
+    """Waveform, loudness and fingerprint of a track, from a single decode
+
+    A track whose fingerprint nearly matches others already in the
+    library is announced with a "duplicate" event.
+    """
+    from fingerprint import Fingerprinter, fingerprint_file, to_record
+
+    fingerprinter = None if fingerprint_store.is_current(file_path) else Fingerprinter()
+    decoded = player.analyze(file_path, fingerprinter.feed if fingerprinter is not None else None)
+    if fingerprinter is None:
+        return
+    if not decoded:
+        with timed("fingerprint"):
+            fingerprint_file(file_path, fingerprinter)
+    record = to_record(file_path, fingerprinter)
+    if record is None:
+        return
+    matches = duplicate_index().add(record)
+    if matches:
+        player.events.publish(
+            "duplicate", path=file_path,
+            matches=[{"path": path, "similarity": score} for path, score in matches],
+        )
+
+# Tracks waiting for room in the analysis queue, oldest first (event loop
+# only). Seeded at startup with every library track that has no current
+# fingerprint, so tracks a full queue or a restart left behind still get done
+analysis_backlog: "OrderedDict[str, None]" = OrderedDict()
+
+# Seconds between passes handing the analysis backlog to the analysis pool
+ANALYSIS_BACKLOG_INTERVAL = 5.0
+
+def queue_analysis(file_path: str):
+    """Analyse a track in the background; failures only cost the waveform
+
+    While the analysis queue is full, tracks wait in the backlog instead.
+    """
+    if not analysis_backlog:
+        try:
+            workers.analysis.submit(analyze_track, file_path)
+            return
+        except workers.PoolFullError:
+            pass
+    ANALYSIS_DEFERRED.inc()
+    analysis_backlog[file_path] = None
+
+def drain_analysis_backlog():
+    """Hand backlog tracks to the analysis pool while its queue has room"""
+    while analysis_backlog:
+        path = next(iter(analysis_backlog))
+        try:
+            workers.analysis.submit(analyze_track, path)
+        except workers.PoolFullError:
+            return
+        del analysis_backlog[path]
+
+def unanalysed_library() -> List[str]:
+    """Library files with no current fingerprint"""
+    return [
+        meta.path for meta in metadata.entries()
+        if not fingerprint_store.is_current(meta.path) and os.path.exists(meta.path)
+    ]
+
+async def analyze_backlog():
+    for path in await workers.ingest.run(unanalysed_library):
+        analysis_backlog.setdefault(path, None)
+    while True:
+        drain_analysis_backlog()
+        await asyncio.sleep(ANALYSIS_BACKLOG_INTERVAL)
+
+async def add_track(file_path: str) -> TrackInfo:
+    """Probe a file on the probe pool, then register it on the control thread"""
+    await workers.probe.run(player.track_metadata, file_path)
+    track = await workers.control.run(player.add_track, file_path)
+    queue_analysis(file_path)
+    return track
+
+async def add_download(file_path: str, thumbnail: Optional[str] = None) -> str:
+    """Move a finished download into the media store and add it
+
+    The video's thumbnail becomes the cover of a download without one.
+    Returns the path it is stored at, for the download job to record.
+    """
+    obj, _ = await workers.ingest.run(player.media.add, file_path)
+    if thumbnail is not None:
+        await workers.probe.run(attach_thumbnail, obj.path, thumbnail)
+    await add_track(obj.path)
+    return obj.path
+
+def attach_thumbnail(file_path: str, thumbnail: str):
+    """Store a thumbnail as the cover of a track that has none, then delete it"""
+    try:
+        meta = player.track_metadata(file_path)
+        if meta.artwork is None:
+            name = artwork_store.add_file(thumbnail)
+            if name is not None:
+                metadata.put(replace(meta, artwork=name))
+    finally:
+        os.remove(thumbnail)
+
+async def add_stored(obj: MediaObject, is_new: bool) -> TrackInfo:
+    """Add a stored upload, dropping it from the store again if it can't be played"""
+    try:
+        return await add_track(obj.path)
+    except Exception:
+        if is_new:
+            await workers.ingest.run(player.media.discard, obj.sha256)
+        raise
+
+# Running scan tasks, kept referenced until they finish
+scan_tasks = set()
+
+# Background probing of files added over IPC, kept referenced until done
+prepare_tasks = set()
+
+def publish_scan(job: ScanJob):
+    player.events.publish("scan", **library_scanner.describe(job))
+
+async def run_scan(job: ScanJob, add_to_playlist: bool):
+    """Scan on the ingest pool (probing fans out to worker processes), then add the results"""
+    with timed("scan"):
+        paths = await workers.ingest.run(library_scanner.scan, job, publish_scan)
+    if add_to_playlist and paths:
+        job.added = len(await workers.control.run(player.add_tracks, paths))
+        publish_scan(job)
+    # Fingerprint what's new, so duplicates across the library are found too
+    for path in await workers.ingest.run(unfingerprinted, paths):
+        queue_analysis(path)
+
+def unfingerprinted(paths: List[str]) -> List[str]:
+    return [path for path in paths if not fingerprint_store.is_current(path)]
+
+async def sweep_zones():
+    while True:
+        await asyncio.sleep(ZONE_SWEEP_INTERVAL)
+        await workers.control.run(players.evict_idle)
+
+def checkpoint_players(compact: bool = False):
+    for live in players.live():
+        live.checkpoint(compact)
+
+async def checkpoint_zones():
+    while True:
+        await asyncio.sleep(CHECKPOINT_INTERVAL)
+        await workers.control.run(checkpoint_players)
+
+def publish_players():
+    for live in players.live():
+        live.publish_status()
+
+async def publish_zones():
+    """Keep the status board current for replicas (owner only)"""
+    while True:
+        await asyncio.sleep(STATUS_PUBLISH_INTERVAL)
+        await workers.control.run(publish_players)
+
+def forget_zone(zone: str) -> bool:
+    """Drop a deleted zone's saved state, and its own playlist unless another zone plays it"""
+    found = playlist_store.delete_player(zone)
+    if status_board is not None:
+        status_board.remove(zone)
+    if not playlist_store.zones_using(zone):
+        playlist_store.delete(zone)
+    return found
+
+def forget_playlist(name: str) -> bool:
+    if playlist_store.zones_using(name):
+        raise HTTPException(status_code=409, detail="Playlist is in use by a zone")
+    return playlist_store.delete(name)
+
+# ---- Local control socket ----
+# The server is the machine's one playback daemon: the desktop app drives
+# the same players over a Unix-domain socket (see ipc.py) instead of
+# starting a libVLC of its own. Commands act on the default zone unless the
+# connection picked another with use_zone.
+
+async def ipc_run(conn: "ipc.Connection", action, *args):
+    """Run action(zone player, *args) on the control thread"""
+    zone = conn.state.get("zone", DEFAULT_ZONE)
+    try:
+        return await workers.control.run(lambda: action(players.get(zone), *args))
+    except HTTPException as e:
+        # The player methods are shared with the routes; send just the reason
+        raise ValueError(e.detail)
+
+def ipc_edit_result(target: APIPlayer) -> Dict[str, Any]:
+    """What a client needs to keep its copy of the playlist in step"""
+    return {"version": target.playlist.version, "current_id": target.current_id}
+
+def ipc_snapshot(target: APIPlayer, since_version: Optional[int] = None) -> Optional[Dict[str, Any]]:
+    """The whole playlist, or None if its version is still since_version"""
+    if since_version == target.playlist.version:
+        return None
+    return {
+        "items": list(target.playlist.items()),
+        "next_id": target.playlist.next_id,
+        "version": target.playlist.version,
+        "current_id": target.current_id,
+        "volume": target.volume,
+    }
+
+def ipc_add(target: APIPlayer, paths: List[str]) -> Dict[str, Any]:
+    track_ids = target.add_tracks(paths)
+    return {
+        "added": [(track_id, target.playlist.path_of(track_id)) for track_id in track_ids],
+        **ipc_edit_result(target),
+    }
+
+async def ipc_add_files(conn: "ipc.Connection", paths: List[str]) -> Dict[str, Any]:
+    """Queue desktop files at once, then probe and analyse them in the background
+
+    Missing files are skipped, as MusicPlayer.add does. Probing stores the
+    metadata, which also puts the tracks in the search index.
+    """
+    result = await ipc_run(conn, ipc_add, paths)
+    added = [path for _, path in result["added"]]
+    if added:
+        task = asyncio.create_task(prepare_added(added))
+        prepare_tasks.add(task)
+        task.add_done_callback(prepare_tasks.discard)
+    return result
+
+async def prepare_added(paths: List[str]):
+    """Probe queued files one at a time, so a big add can't fill the probe queue"""
+    for path in paths:
+        try:
+            await workers.probe.run(player.track_metadata, path)
+        except Exception:
+            # Gone or unreadable: it stays queued and shows its filename
+            continue
+        queue_analysis(path)
+
+def ipc_remove(target: APIPlayer, track_id: int) -> Dict[str, Any]:
+    target.remove_id(track_id)
+    return ipc_edit_result(target)
+
+def ipc_move(target: APIPlayer, track_id: int, position: int) -> Dict[str, Any]:
+    target.move_track(track_id, position)
+    return ipc_edit_result(target)
+
+def ipc_clear(target: APIPlayer) -> Dict[str, Any]:
+    target.clear_playlist()
+    return ipc_edit_result(target)
+
+async def ipc_use_zone(conn: "ipc.Connection", zone: str) -> bool:
+    if not ZONE_NAME.match(zone):
+        raise ValueError("Invalid zone name")
+    if "subscription" in conn.state:
+        raise ValueError("Choose the zone before subscribing")
+    await workers.control.run(players.get, zone)
+    conn.state["zone"] = zone
+    return True
+
+async def ipc_subscribe(conn: "ipc.Connection", tick: int = 0) -> bool:
+    """Forward the zone's events to the connection; `tick` as for /events"""
+    if "subscription" in conn.state:
+        return True
+    target = await workers.control.run(players.get, conn.state.get("zone", DEFAULT_ZONE))
+    subscription = target.events.subscribe(tick / 1000.0 if tick > 0 else None)
+    conn.state["subscription"] = subscription
+
+    async def forward():
+        while True:
+            event = await subscription.get()
+            # Every subscriber gets the same dict, so don't pop from it
+            conn.send_event(event["type"], {key: value for key, value in event.items() if key != "type"})
+
+    sender = asyncio.create_task(forward())
+    conn.on_close(sender.cancel)
+    conn.on_close(lambda: target.events.unsubscribe(subscription))
+    return True
+
+async def ipc_metadata(conn: "ipc.Connection", path: str) -> Optional[Dict[str, Any]]:
+    try:
+        meta = await workers.probe.run(player.track_metadata, path)
+    except FileNotFoundError:
+        return None
+    return asdict(meta)
+
+async def ipc_download(conn: "ipc.Connection", url: str) -> Dict[str, Any]:
+    return downloads.describe(downloads.submit(url))
+
+# Player methods API replicas run in the owner (see ReplicaPlayer)
+REPLICA_METHODS = {
+    "play_track", "pause", "stop", "next_track", "previous_track", "set_volume",
+    "set_playback_settings", "add_tracks", "remove_id", "move_track", "clear_playlist",
+    "save_playlist", "load_playlist",
+}
+
+def ipc_call(target: APIPlayer, method: str, *args) -> Dict[str, Any]:
+    """Run a player method for a replica; HTTP errors are passed back as they are"""
+    if method not in REPLICA_METHODS:
+        raise ValueError(f"Unknown player method: {method}")
+    if method == "set_playback_settings":
+        args = (PlaybackSettings(**args[0]),)
+    try:
+        result = getattr(target, method)(*args)
+    except HTTPException as e:
+        return {"status": e.status_code, "detail": e.detail}
+    except Exception as e:
+        return {"status": 400, "detail": str(e)}
+    # Published before answering, so the replica sees the outcome right away
+    target.publish_status()
+    return {"status": None, "result": result}
+
+IPC_HANDLERS = {
+    "status": lambda conn: ipc_run(conn, lambda target: target.get_status().model_dump()),
+    "snapshot": lambda conn, since_version=None: ipc_run(conn, ipc_snapshot, since_version),
+    "play": lambda conn, index=None: ipc_run(conn, APIPlayer.play_track, index),
+    "play_id": lambda conn, track_id: ipc_run(conn, APIPlayer.play_track, None, track_id),
+    "pause": lambda conn: ipc_run(conn, APIPlayer.pause),
+    "play_or_pause": lambda conn: ipc_run(conn, APIPlayer.play_or_pause),
+    "stop": lambda conn: ipc_run(conn, APIPlayer.stop),
+    "next": lambda conn: ipc_run(conn, APIPlayer.next_track),
+    "previous": lambda conn: ipc_run(conn, APIPlayer.previous_track),
+    "volume": lambda conn, volume: ipc_run(conn, APIPlayer.set_volume, volume),
+    "add": ipc_add_files,
+    "remove": lambda conn, track_id: ipc_run(conn, ipc_remove, track_id),
+    "move": lambda conn, track_id, position: ipc_run(conn, ipc_move, track_id, position),
+    "clear": lambda conn: ipc_run(conn, ipc_clear),
+    "use_zone": ipc_use_zone,
+    "subscribe": ipc_subscribe,
+    "metadata": ipc_metadata,
+    "download": ipc_download,
+    "call": lambda conn, method, *args: ipc_run(conn, ipc_call, method, *args),
+}
+
+async def start_ipc(app: FastAPI):
+    if not ipc.available():
+        return
+    server = ipc.IPCServer(IPC_HANDLERS)
+    if await server.start():
+        app.state.ipc = server
+    else:
+        print(f"Another playback daemon is listening on {server.path}; local control disabled")
+
+def open_library():
+    """Open the library stores (blocking); the caches read their tables into memory"""
+    global metadata, media_store, analysis_store, fingerprint_store, playlist_store, search_index, transcode_cache
+    global artwork_store, artwork_cache, status_board, upload_sessions
+    metadata = MetadataCache()
+    media_store = MediaStore()
+    analysis_store = AnalysisStore()
+    fingerprint_store = FingerprintStore()
+    playlist_store = PlaylistStore()
+    search_index = SearchIndex()
+    if len(search_index) != len(metadata):
+        # First start with search, or the index fell behind the cache
+        search_index.rebuild(metadata.entries())
+    metadata.subscribe(search_index.update)
+    transcode_cache = TranscodeCache()
+    artwork_store = ArtworkStore()
+    artwork_cache = ArtworkCache(artwork_store)
+    # Look for a WebP encoder now rather than on the first request
+    artwork_cache.output_format("webp")
+    if ROLE == "owner":
+        status_board = StatusBoard()
+    # Brings back unfinished resumable uploads and deletes stale partial files
+    upload_sessions = UploadSessionManager(UploadSessionStore())
+
+def open_replica_library():
+    """Open the stores a replica reads; rows the owner adds later are read through"""
+    global metadata, media_store, playlist_store, search_index, status_board
+    metadata = MetadataCache(read_through=True)
+    media_store = MediaStore(index=MediaIndex(read_through=True))
+    playlist_store = PlaylistStore()
+    search_index = SearchIndex()
+    # The owner indexes; tracks it added since show up when the metadata is refreshed
+    metadata.subscribe(search_index.learn)
+    status_board = StatusBoard()
+
+async def initialize(app: FastAPI):
+    """Create the stores, the default zone's player and the background services"""
+    global players, player, library_scanner, downloads
+    try:
+        await workers.ingest.run(open_library)
+        # Players are created and driven on the control thread; the default
+        # zone is always live and is the one uploads, downloads and scans add to
+        players = await workers.control.run(
+            lambda: PlayerPool(create_player, saved_zones=playlist_store.zones)
+        )
+        player = await workers.control.run(players.get, DEFAULT_ZONE)
+        library_scanner = LibraryScanner(metadata)
+        downloads = DownloadManager(
+            workers.download,
+            await workers.ingest.run(DownloadJobStore),
+            on_complete=add_download,
+            on_update=lambda job: player.events.publish("download", id=job.id, status=job.status, path=job.path),
+            policy=DownloadPolicy.from_env(),
+        )
+        await downloads.start()
+    except Exception as e:
+        app.state.startup_error = str(e)
+        print(f"Startup failed: {e}")
+        return
+    app.state.zone_sweeper = asyncio.create_task(sweep_zones())
+    app.state.checkpointer = asyncio.create_task(checkpoint_zones())
+    app.state.analyzer = asyncio.create_task(analyze_backlog())
+    if status_board is not None:
+        app.state.publisher = asyncio.create_task(publish_zones())
+    await start_ipc(app)
+    app.state.ready_after = time.monotonic() - app.state.started_at
+    app.state.ready = True
+
+async def initialize_replica(app: FastAPI):
+    """Open the stores read-side and wait until the owner is listening"""
+    global owner_proxy
+    try:
+        if not ipc.available():
+            raise RuntimeError("Replicas need Unix-domain sockets to reach the owner")
+        await workers.ingest.run(open_replica_library)
+        owner_proxy = OwnerProxy(owner_url())
+        while True:
+            client = await asyncio.to_thread(ipc.IPCClient.connect)
+            if client is not None:
+                client.close()
+                break
+            await asyncio.sleep(0.1)
+    except Exception as e:
+        app.state.startup_error = str(e)
+        print(f"Startup failed: {e}")
+        return
+    app.state.ready_after = time.monotonic() - app.state.started_at
+    app.state.ready = True
+
+async def monitor_event_loop():
+    """Measure how late the loop wakes a sleeping task; blocking calls show up here"""
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(LAG_INTERVAL)
+        EVENT_LOOP_LAG.observe(max(0.0, loop.time() - start - LAG_INTERVAL))
+
+async def shutdown(app: FastAPI):
+    app.state.lag_monitor.cancel()
+    app.state.initializer.cancel()
+    if app.state.zone_sweeper is not None:
+        app.state.zone_sweeper.cancel()
+    if app.state.checkpointer is not None:
+        app.state.checkpointer.cancel()
+    if app.state.analyzer is not None:
+        app.state.analyzer.cancel()
+    if app.state.publisher is not None:
+        app.state.publisher.cancel()
+    if owner_proxy is not None:
+        await owner_proxy.close()
+    for replica in replicas.values():
+        replica.release()
+    if app.state.ipc is not None:
+        await app.state.ipc.stop()
+    if downloads is not None:
+        await downloads.stop()
+    if library_scanner is not None:
+        for job_id in list(library_scanner.jobs):
+            library_scanner.cancel(job_id)
+    if players is not None:
+        # A clean shutdown leaves every playlist compacted, so the next start replays nothing
+        await workers.control.run(checkpoint_players, True)
+    workers.shutdown(wait=False)
 
 # API Routes
 @app.get("/")
 async def root():
     return {"message": "Music Player API is running"}
 
-@app.get("/playlist", response_model=PlaylistResponse)
-async def get_playlist():
-    """Get current playlist"""
-    return player.get_playlist()
+@app.get("/health")
+async def health():
+    """Liveness: answers as soon as the server is listening"""
+    return {"status": "ok"}
+
+@app.get("/ready")
+async def readiness():
+    """Readiness: 200 once the library and the default player are up, 503 until then"""
+    if app.state.ready:
+        return {"status": "ready", "startup_seconds": round(app.state.ready_after, 3)}
+    if app.state.startup_error is not None:
+        return JSONResponse({"status": "failed", "error": app.state.startup_error}, status_code=503)
+    return JSONResponse({"status": "starting"}, status_code=503, headers={"Retry-After": "1"})
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Metrics in the Prometheus text exposition format"""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/debug/profile", response_class=PlainTextResponse)
+async def profile(seconds: float = Query(10.0, gt=0, le=60), interval: float = Query(0.01, ge=0.001)):
+    """Sample every thread's stack for a while and return folded stacks
+
+    The output feeds flamegraph.pl or speedscope. Only available when the
+    server runs with MUSIC_PLAYER_PROFILING=1.
+    """
+    if not PROFILING_ENABLED:
+        raise HTTPException(status_code=404, detail="Profiling is disabled")
+    stacks = await asyncio.to_thread(sample_stacks, seconds, interval)
+    return PlainTextResponse(fold(stacks))
+
+@app.get("/workers")
+async def worker_stats():
+    """Queue depth and counters for each worker pool"""
+    return workers.stats()
+
+@zone_router.get("/playlist", response_model=PlaylistResponse)
+async def get_playlist(
+    request: Request,
+    offset: int = Query(0, ge=0),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[int] = None,
+    q: Optional[str] = None,
+    fields: Optional[str] = None,
+    player: APIPlayer = Depends(zone_player),
+):
+    """Get current playlist, optionally paginated, filtered and trimmed to some fields
+
+    Responses carry an ETag derived from the playlist version and the
+    metadata generation, so a re-probed tag or a new cover changes it too;
+    a request whose If-None-Match still matches gets a 304 without building
+    the body.
+    """
+    etag = f'W/"{player.playlist_version()}.{metadata.generation}"'
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+
+    include = None
+    if fields:
+        include = {name.strip() for name in fields.split(",") if name.strip()}
+        unknown = include - set(TrackInfo.model_fields)
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+
+    page = await workers.control.run(player.get_playlist, offset, limit, cursor, q)
+    body = page.model_dump(include={"tracks": {"__all__": include}, **{
+        name: True for name in PlaylistResponse.model_fields if name != "tracks"
+    }} if include else None)
+    return JSONResponse(body, headers={"ETag": etag, "Cache-Control": "no-cache"})
 
-@app.get("/status", response_model=PlayerStatus)
-async def get_status():
+@zone_router.get("/status", response_model=PlayerStatus)
+async def get_status(player: APIPlayer = Depends(zone_player)):
     """Get player status"""
-    return player.get_status()
+    return await workers.control.run(player.get_status)
 
-@app.post("/play")
-async def play(index: Optional[int] = None):
-    """Play track at index or resume current track"""
+@zone_router.websocket("/events")
+async def events(websocket: WebSocket, tick: int = 1000, player: APIPlayer = Depends(zone_player)):
+    """Stream playback events; `tick` is the position update interval in ms (0 disables)"""
+    await websocket.accept()
+    subscription = player.events.subscribe(tick / 1000.0 if tick > 0 else None)
     try:
-        player.play_track(index)
+        if isinstance(player.events, ReplicaEvents):
+            await asyncio.to_thread(player.events.wait_relayed)
+            await workers.control.run(player.refresh)
+        status = await workers.control.run(player.get_status)
+        playlist = await workers.control.run(player.get_playlist)
+        await websocket.send_json({
+            "type": "snapshot",
+            "status": status.model_dump(),
+            "playlist": playlist.model_dump(),
+        })
+
+        async def forward():
+            while True:
+                await websocket.send_json(await subscription.get())
+
+        # Reading is what notices a client going away, even when no events
+        # are flowing, so the subscription doesn't outlive the socket
+        sender = asyncio.create_task(forward())
+        try:
+            while True:
+                await websocket.receive_text()
+        finally:
+            sender.cancel()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        player.events.unsubscribe(subscription)
+
+@zone_router.post("/play")
+async def play(index: Optional[int] = None, track_id: Optional[int] = None,
+               player: APIPlayer = Depends(zone_player)):
+    """Play track at index (or by ID) or resume current track"""
+    try:
+        await workers.control.run(player.play_track, index, track_id)
         return {"message": "Playing"}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
-@app.post("/pause")
-async def pause():
+@zone_router.post("/pause")
+async def pause(player: APIPlayer = Depends(zone_player)):
     """Pause playback"""
-    player.pause()
+    await workers.control.run(player.pause)
     return {"message": "Paused"}
 
-@app.post("/stop")
-async def stop():
+@zone_router.post("/stop")
+async def stop(player: APIPlayer = Depends(zone_player)):
     """Stop playback"""
-    player.stop()
+    await workers.control.run(player.stop)
     return {"message": "Stopped"}
 
-@app.post("/next")
-async def next_track():
+@zone_router.post("/next")
+async def next_track(player: APIPlayer = Depends(zone_player)):
     """Play next track"""
-    player.next_track()
+    await workers.control.run(player.next_track)
     return {"message": "Next track"}
 
-@app.post("/previous")
-async def previous_track():
+@zone_router.post("/previous")
+async def previous_track(player: APIPlayer = Depends(zone_player)):
     """Play previous track"""
-    player.previous_track()
+    await workers.control.run(player.previous_track)
     return {"message": "Previous track"}
 
-@app.post("/volume")
-async def set_volume(request: VolumeRequest):
+@zone_router.get("/settings/playback", response_model=PlaybackSettings)
+async def get_playback_settings(player: APIPlayer = Depends(zone_player)):
+    """Get gapless/crossfade/repeat settings"""
+    return await workers.control.run(player.get_playback_settings)
+
+@zone_router.put("/settings/playback", response_model=PlaybackSettings)
+async def set_playback_settings(settings: PlaybackSettings, player: APIPlayer = Depends(zone_player)):
+    """Enable gapless playback, set the pre-buffer and crossfade lengths, or toggle repeat"""
+    await workers.control.run(player.set_playback_settings, settings)
+    return await workers.control.run(player.get_playback_settings)
+
+@zone_router.post("/volume")
+async def set_volume(request: VolumeRequest, player: APIPlayer = Depends(zone_player)):
     """Set volume"""
-    player.set_volume(request.volume)
+    await workers.control.run(player.set_volume, request.volume, request.normalize)
     return {"message": f"Volume set to {request.volume}"}
 
+@zone_router.get("/track/{track_id}/waveform", response_model=WaveformResponse)
+async def get_waveform(track_id: int, points: Optional[int] = Query(None, ge=1),
+                       player: APIPlayer = Depends(zone_player)):
+    """Precomputed waveform and loudness of a track
+
+    Answers 202 and queues the analysis if it hasn't been done yet.
+    `points` reduces the waveform to fewer bins.
+    """
+    path = player.playlist.path_of(track_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Track not found")
+    result = await workers.probe.run(player.analysis.get, path)
+    if result is None or not player.analysis.is_current(path):
+        queue_analysis(path)
+        return JSONResponse(status_code=202, content={"message": "Analysis queued"})
+
+    import numpy as np
+    from analysis import dequantize
+
+    peaks = dequantize(result.peaks)
+    rms = dequantize(result.rms)
+    if points is not None and points < len(peaks):
+        starts = np.linspace(0, len(peaks), points + 1).astype(int)[:-1]
+        peaks = np.maximum.reduceat(peaks, starts)
+        rms = np.sqrt(np.add.reduceat(rms ** 2, starts) / np.diff(np.append(starts, len(rms))))
+    return WaveformResponse(
+        id=track_id,
+        points=len(peaks),
+        peaks=np.round(peaks.astype(float), 3).tolist(),
+        rms=np.round(rms.astype(float), 3).tolist(),
+        loudness=result.loudness,
+        peak=result.peak,
+        gain=result.gain,
+    )
+
+@zone_router.api_route("/track/{track_id}/art", methods=["GET", "HEAD"])
+async def get_artwork(
+    track_id: int,
+    request: Request,
+    size: int = Query(DEFAULT_VARIANT_SIZE, ge=1, le=VARIANT_SIZES[-1], description="Box to fit the image in, in pixels"),
+    v: Optional[str] = Query(None, description="The track's `artwork`; makes the response cacheable for good"),
+    player: APIPlayer = Depends(zone_player),
+):
+    """A track's cover art, resized
+
+    WebP for clients that accept it, JPEG otherwise. Images are rendered
+    once per size step (artwork.VARIANT_SIZES) and then served from a disk
+    cache; with `v` the URL names the image itself, so it never goes stale.
+    """
+    path = player.playlist.path_of(track_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Track not found")
+    try:
+        meta = await workers.probe.run(player.track_metadata, path)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Track not found")
+    if meta.artwork is None:
+        raise HTTPException(status_code=404, detail="No artwork")
+
+    fmt = artwork_cache.output_format("webp" if "image/webp" in request.headers.get("accept", "") else "jpeg")
+    size = variant_size(size)
+    etag = f'"{artwork_cache.key(meta.artwork, size, fmt)}"'
+    headers = {
+        "ETag": etag,
+        "Vary": "Accept",
+        "Cache-Control": "private, max-age=31536000, immutable" if v == meta.artwork else "private, max-age=3600",
+    }
+    if etag in (tag.strip() for tag in request.headers.get("if-none-match", "").split(",")):
+        return Response(status_code=304, headers=headers)
+    try:
+        f, length = await workers.transcode.run(artwork_cache.open, meta.artwork, size, fmt)
+    except workers.PoolFullError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="No artwork")
+    except ArtworkError as e:
+        raise HTTPException(status_code=500, detail=f"Resizing artwork failed: {e}")
+    return RangeFileResponse(f, length, None, VARIANT_FORMATS[fmt][3], headers=headers)
+
 @app.post("/upload")
 async def upload_file(file: UploadFile = File(...)):
     """Upload audio file"""
-    if not file.filename.lower().endswith(('.mp3', '.wav', '.flac', '.m4a')):
+    if not is_audio_file(file.filename):
         raise HTTPException(status_code=400, detail="Invalid file type")
     
-    file_path = f"uploads/{file.filename}"
-    
-    with open(file_path, "wb") as f:
-        content = await file.read()
-        f.write(content)
+    # Streamed to disk in chunks and moved into the store before registering
+    obj, is_new = await workers.ingest.run(store_stream, file.file, file.filename, player.media)
     
     try:
-        track = player.add_track(file_path)
-        return {"message": "File uploaded successfully", "track": track}
+        track = await add_stored(obj, is_new)
+        message = "File uploaded successfully" if is_new else "File already in library"
+        return {"message": message, "track": track}
     except Exception as e:
-        os.remove(file_path)  # Clean up on error
         raise HTTPException(status_code=400, detail=str(e))
 
-@app.post("/download")
-async def download_from_url(request: DownloadRequest, background_tasks: BackgroundTasks):
-    """Download audio from URL (YouTube, etc.)"""
+@app.post("/upload/batch")
+async def upload_files(files: List[UploadFile] = File(...)):
+    """Upload several audio files, storing and probing them in parallel"""
+    async def ingest(file: UploadFile) -> str:
+        if not is_audio_file(file.filename):
+            raise ValueError("Invalid file type")
+        obj, is_new = await workers.ingest.run(store_stream, file.file, file.filename, player.media)
+        try:
+            await workers.probe.run(player.track_metadata, obj.path)
+        except Exception:
+            if is_new:
+                await workers.ingest.run(player.media.discard, obj.sha256)
+            raise
+        return obj.path
+
+    results = await asyncio.gather(*(ingest(file) for file in files), return_exceptions=True)
+
+    tracks = []
+    errors = []
+    for file, result in zip(files, results):
+        if isinstance(result, Exception):
+            errors.append({"filename": file.filename, "detail": str(result)})
+            continue
+        # Probed above, so this only registers it and queues its analysis
+        tracks.append(await add_track(result))
+    return {"tracks": tracks, "errors": errors}
+
+@app.post("/upload/sessions", response_model=UploadSessionInfo)
+async def create_upload_session(request: UploadSessionRequest):
+    """Start a resumable upload"""
+    if not is_audio_file(request.filename):
+        raise HTTPException(status_code=400, detail="Invalid file type")
+    if request.size <= 0:
+        raise HTTPException(status_code=400, detail="Invalid file size")
+    session = await workers.ingest.run(upload_sessions.create, request.filename, request.size)
+    return UploadSessionInfo(id=session.id, filename=session.filename, size=session.size, offset=session.offset)
+
+@app.get("/upload/sessions/{session_id}", response_model=UploadSessionInfo)
+async def get_upload_session(session_id: str):
+    """Get how many bytes of a resumable upload have been received"""
+    session = upload_sessions.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Upload session not found")
+    return UploadSessionInfo(id=session.id, filename=session.filename, size=session.size, offset=session.offset)
+
+@app.put("/upload/sessions/{session_id}")
+async def append_upload_session(session_id: str, request: Request):
+    """Append the request body to a resumable upload.
+
+    An optional `Content-Range: bytes <start>-<end>/<total>` header must
+    start at the current offset; otherwise a 409 reports where to resume.
+    """
+    session = upload_sessions.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Upload session not found")
+
+    content_range = request.headers.get("content-range")
+    start = None
+    if content_range:
+        try:
+            start = int(content_range.split()[1].split("-")[0])
+        except (IndexError, ValueError):
+            raise HTTPException(status_code=400, detail="Malformed Content-Range header")
+
+    try:
+        with session.appending():
+            if start is not None and start != session.offset:
+                raise HTTPException(status_code=409, detail={"offset": session.offset})
+            buffer = bytearray()
+            async for chunk in request.stream():
+                buffer.extend(chunk)
+                if len(buffer) >= UPLOAD_CHUNK_SIZE:
+                    await workers.ingest.run(session.write, bytes(buffer))
+                    buffer.clear()
+            if buffer:
+                await workers.ingest.run(session.write, bytes(buffer))
+    except UploadBusyError as e:
+        raise HTTPException(status_code=409, detail={"offset": session.offset, "error": str(e)})
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if not session.complete:
+        return {"offset": session.offset}
+
+    await workers.ingest.run(upload_sessions.remove, session_id)
+    obj, is_new = await workers.ingest.run(session.finish, player.media)
     try:
-        # Add to background tasks for async processing
-        background_tasks.add_task(download_audio_task, request.url)
-        return {"message": "Download started", "url": request.url}
+        track = await add_stored(obj, is_new)
+        return {"offset": session.offset, "message": "File uploaded successfully", "track": track}
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
-async def download_audio_task(url: str):
-    """Background task to download audio"""
+@app.delete("/upload/sessions/{session_id}")
+async def cancel_upload_session(session_id: str):
+    """Abort a resumable upload and discard its data"""
+    session = await workers.ingest.run(upload_sessions.remove, session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Upload session not found")
+    await workers.ingest.run(session.discard)
+    return {"message": "Upload cancelled"}
+
+@app.post("/download", response_model=DownloadJobInfo)
+async def download_from_url(request: DownloadRequest):
+    """Queue a download from URL (YouTube, etc.)"""
+    job = downloads.submit(request.url)
+    return downloads.describe(job)
+
+@app.post("/download/batch", response_model=List[DownloadJobInfo])
+async def download_batch(request: BatchDownloadRequest):
+    """Queue several URLs; playlist URLs are expanded into one job per entry"""
     try:
-        import yt_dlp
-        
-        output_dir = "downloads"
-        os.makedirs(output_dir, exist_ok=True)
-        
-        ydl_opts = {
-            'format': 'bestaudio/best',
-            'outtmpl': os.path.join(output_dir, '%(title)s.%(ext)s'),
-            'postprocessors': [{
-                'key': 'FFmpegExtractAudio',
-                'preferredcodec': 'mp3',
-                'preferredquality': '192',
-            }],
-            'noplaylist': True,
-            'quiet': True,
-        }
-        
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(url, download=True)
-            title = info.get('title', 'audio')
-            # Clean filename
-            safe_title = "".join(c for c in title if c.isalnum() or c in (' ', '-', '_')).rstrip()
-            path = os.path.join(output_dir, f"{safe_title}.mp3")
-            
-            # Try to find the actual downloaded file
-            for file in os.listdir(output_dir):
-                if file.startswith(safe_title) and file.endswith('.mp3'):
-                    actual_path = os.path.join(output_dir, file)
-                    if os.path.exists(actual_path):
-                        # Add to playlist
-                        player.add_track(actual_path)
-                        break
-                        
+        jobs = await downloads.submit_batch(request.urls, request.expand_playlists)
     except ImportError:
-        print("yt-dlp not installed. Install with: pip install yt-dlp")
+        raise HTTPException(status_code=500, detail="yt-dlp not installed. Install with: pip install yt-dlp")
     except Exception as e:
-        print(f"Download error: {e}")
+        raise HTTPException(status_code=400, detail=str(e))
+    return [downloads.describe(job) for job in jobs]
+
+@app.get("/downloads", response_model=List[DownloadJobInfo])
+async def list_downloads():
+    """List every download job"""
+    return [downloads.describe(job) for job in downloads.jobs.values()]
+
+@app.get("/downloads/{job_id}", response_model=DownloadJobInfo)
+async def get_download(job_id: str):
+    """Get a download job with its progress"""
+    job = downloads.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Download not found")
+    return downloads.describe(job)
+
+@app.delete("/downloads/{job_id}")
+async def cancel_download(job_id: str):
+    """Cancel a queued or running download"""
+    if downloads.get(job_id) is None:
+        raise HTTPException(status_code=404, detail="Download not found")
+    if not downloads.cancel(job_id):
+        raise HTTPException(status_code=409, detail="Download already finished")
+    return {"message": "Download cancelled"}
+
+@app.post("/downloads/{job_id}/retry", response_model=DownloadJobInfo)
+async def retry_download(job_id: str):
+    """Re-queue a failed or cancelled download"""
+    if downloads.get(job_id) is None:
+        raise HTTPException(status_code=404, detail="Download not found")
+    if not downloads.retry(job_id):
+        raise HTTPException(status_code=409, detail="Only failed or cancelled downloads can be retried")
+    return downloads.describe(downloads.get(job_id))
+
+@app.get("/stream/cache")
+async def stream_cache_stats():
+    """Size and hit counts of the transcode cache"""
+    return transcode_cache.stats()
+
+def open_stream(path: str, fmt: Optional[str], bitrate: int) -> Tuple[BinaryIO, int, str]:
+    """Open a track, or its transcode, for streaming (blocking)
+
+    Returns the open file, its size and its ETag. A transcode is encoded
+    whole on a cache miss, so nothing is sent before ffmpeg is done.
+    """
+    if fmt is None:
+        f = open(path, "rb")
+        try:
+            st = os.fstat(f.fileno())
+        except BaseException:
+            f.close()
+            raise
+        return f, st.st_size, f'"{st.st_mtime_ns:x}-{st.st_size:x}"'
+    # Keyed before opening, so a source that vanishes fails before any file is open
+    etag = f'"{transcode_cache.key(path, fmt, bitrate)}"'
+    f, size = transcode_cache.open(path, fmt, bitrate)
+    return f, size, etag
 
-@app.delete("/playlist")
-async def clear_playlist():
+def close_stream(future: Future):
+    """Close what open_stream opened for a request that went away meanwhile"""
+    if not future.cancelled() and future.exception() is None:
+        future.result()[0].close()
+
+@zone_router.api_route("/stream/{track_id}", methods=["GET", "HEAD"])
+async def stream_track(
+    track_id: int,
+    request: Request,
+    fmt: Optional[str] = Query(None, alias="format", description="opus or aac to transcode; omit for the original file"),
+    bitrate: int = Query(128, ge=MIN_BITRATE, le=MAX_BITRATE, description="Transcode bitrate in kbit/s"),
+    player: APIPlayer = Depends(zone_player),
+):
+    """Stream a track's audio, honouring Range requests"""
+    path = player.playlist.path_of(track_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Track not found")
+    if fmt is not None and fmt not in TRANSCODE_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported format: {fmt}")
+    media_type = content_type(path) if fmt is None else TRANSCODE_FORMATS[fmt][3]
+
+    try:
+        future = workers.transcode.submit(open_stream, path, fmt, bitrate)
+    except workers.PoolFullError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    try:
+        f, size, etag = await asyncio.wrap_future(future)
+    except asyncio.CancelledError:
+        future.add_done_callback(close_stream)
+        raise
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Track not found")
+    except TranscodeError as e:
+        raise HTTPException(status_code=500, detail=f"Transcoding failed: {e}")
+
+    try:
+        byte_range = parse_range(request.headers.get("range"), size)
+        return RangeFileResponse(
+            f, size, byte_range, media_type,
+            headers={"ETag": etag, "Cache-Control": "private, max-age=3600"},
+        )
+    except RangeNotSatisfiable as e:
+        f.close()
+        return Response(status_code=416, headers={"Content-Range": str(e)})
+    except BaseException:
+        f.close()
+        raise
+
+@app.post("/library/scan", response_model=ScanJobInfo)
+async def scan_library(request: LibraryScanRequest):
+    """Scan folders for audio files in the background and add them to the playlist"""
+    if not request.paths:
+        raise HTTPException(status_code=400, detail="No folders given")
+    for path in request.paths:
+        if not os.path.isdir(path):
+            raise HTTPException(status_code=400, detail=f"Not a folder: {path}")
+    job = library_scanner.create(request.paths)
+    task = asyncio.create_task(run_scan(job, request.add_to_playlist))
+    scan_tasks.add(task)
+    task.add_done_callback(scan_tasks.discard)
+    return library_scanner.describe(job)
+
+@app.get("/library/scan/{job_id}", response_model=ScanJobInfo)
+async def get_scan(job_id: str):
+    """Get a library scan with its progress"""
+    job = library_scanner.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Scan not found")
+    return library_scanner.describe(job)
+
+@app.delete("/library/scan/{job_id}")
+async def cancel_scan(job_id: str):
+    """Stop a running library scan"""
+    if library_scanner.get(job_id) is None:
+        raise HTTPException(status_code=404, detail="Scan not found")
+    if not library_scanner.cancel(job_id):
+        raise HTTPException(status_code=409, detail="Scan already finished")
+    return {"message": "Scan cancelled"}
+
+def duplicate_groups(min_similarity: float) -> List[DuplicateGroup]:
+    """Group matched tracks that still exist, biggest groups first (blocking)"""
+    parent: Dict[str, str] = {}
+
+    def root(path: str) -> str:
+        while parent.setdefault(path, path) != path:
+            parent[path] = parent[parent[path]]
+            path = parent[path]
+        return path
+
+    lowest: Dict[str, float] = {}
+    exists: Dict[str, bool] = {}
+    for a, b, score in fingerprint_store.matches(min_similarity):
+        for path in (a, b):
+            if path not in exists:
+                exists[path] = os.path.exists(path)
+        if not (exists[a] and exists[b]):
+            continue
+        ra, rb = root(a), root(b)
+        merged = min(score, lowest.pop(ra, 1.0), lowest.pop(rb, 1.0) if ra != rb else 1.0)
+        parent[ra] = rb
+        lowest[rb] = merged
+
+    members: Dict[str, List[str]] = {}
+    for path in parent:
+        members.setdefault(root(path), []).append(path)
+    groups = []
+    for group_root, paths in members.items():
+        tracks = []
+        for path in sorted(paths):
+            meta = metadata.peek(path)
+            tracks.append(DuplicateTrack(
+                path=path,
+                title=meta.title if meta is not None else os.path.splitext(media_store.display_name(path))[0],
+                artist=meta.artist if meta is not None else None,
+                album=meta.album if meta is not None else None,
+                duration=meta.duration if meta is not None else None,
+                codec=meta.codec if meta is not None else None,
+                bitrate=meta.bitrate if meta is not None else None,
+                size=meta.size if meta is not None else None,
+            ))
+        groups.append(DuplicateGroup(tracks=tracks, similarity=lowest[group_root]))
+    groups.sort(key=lambda group: (-len(group.tracks), -group.similarity))
+    return groups
+
+@app.get("/library/duplicates", response_model=DuplicateReport)
+async def library_duplicates(min_similarity: float = Query(0.0, ge=0.0, le=1.0)):
+    """Groups of library tracks that sound like the same recording
+
+    Tracks are fingerprinted when they are analysed after an upload,
+    download or scan, and matched against the library as that happens.
+    """
+    groups = await workers.ingest.run(duplicate_groups, min_similarity)
+    return DuplicateReport(fingerprinted=len(fingerprint_store), groups=groups)
+
+@zone_router.delete("/playlist")
+async def clear_playlist(player: APIPlayer = Depends(zone_player)):
     """Clear playlist"""
-    player.clear_playlist()
+    await workers.control.run(player.clear_playlist)
     return {"message": "Playlist cleared"}
 
-@app.delete("/track/{track_id}")
-async def remove_track(track_id: int):
-    """Remove track from playlist"""
-    playlist = player.get_playlist()
-    if 0 <= track_id < len(playlist):
-        removed_path = playlist[track_id]
-        removed_filename = os.path.basename(removed_path)
-        player.remove_track(track_id)
-        return {"message": f"Removed track: {removed_filename}"}
-    else:
+@zone_router.patch("/playlist")
+async def reorder_playlist(request: ReorderRequest, player: APIPlayer = Depends(zone_player)):
+    """Move a track to a new position (drag & drop)"""
+    if not await workers.control.run(player.move_track, request.track_id, request.position):
+        raise HTTPException(status_code=404, detail="Track not found")
+    return {"message": "Playlist reordered"}
+
+@zone_router.delete("/track/{track_id}")
+async def remove_track(track_id: int, player: APIPlayer = Depends(zone_player)):
+    """Remove track from playlist by its stable ID"""
+    removed_path = await workers.control.run(player.remove_id, track_id)
+    if removed_path is None:
         raise HTTPException(status_code=404, detail="Track not found")
+    removed_filename = player.media.display_name(removed_path)
+    return {"message": f"Removed track: {removed_filename}"}
+
+@zone_router.post("/playlist")
+async def add_to_playlist(request: AddTracksRequest, player: APIPlayer = Depends(zone_player)):
+    """Queue library tracks (uploaded, downloaded or scanned) by path"""
+    unknown = [
+        path for path in request.paths
+        if metadata.peek(path) is None and media_store.lookup_path(path) is None
+    ]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Not in the library: {unknown[0]}")
+    track_ids = await workers.control.run(player.add_tracks, request.paths)
+    return {"message": f"Added {len(track_ids)} tracks", "track_ids": track_ids}
+
+@zone_router.post("/playlist/save")
+async def save_playlist(request: NamedPlaylistRequest, player: APIPlayer = Depends(zone_player)):
+    """Store a copy of the zone's playlist under a name"""
+    await workers.control.run(player.save_playlist, request.name)
+    return {"message": f"Saved playlist {request.name}"}
+
+@zone_router.post("/playlist/load")
+async def load_playlist(request: NamedPlaylistRequest, player: APIPlayer = Depends(zone_player)):
+    """Switch the zone to a named playlist; later edits are saved to it"""
+    await workers.control.run(player.load_playlist, request.name)
+    return {"message": f"Loaded playlist {request.name}", "total": len(player.playlist)}
+
+@app.get("/playlists")
+async def list_playlists():
+    """Named playlists, their lengths and the zones playing them"""
+    return await workers.control.run(playlist_store.names)
+
+@app.delete("/playlists/{name}")
+async def delete_playlist(name: str):
+    """Delete a named playlist no zone is playing"""
+    if not await workers.control.run(forget_playlist, name):
+        raise HTTPException(status_code=404, detail="Playlist not found")
+    return {"message": f"Playlist {name} deleted"}
+
+@zone_router.get("/search", response_model=SearchResponse)
+async def search_library(q: str = Query(..., min_length=1, max_length=200),
+                 limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
+                 player: APIPlayer = Depends(zone_player)):
+    """Search the library by title, artist, album and genre
+
+    Words match as prefixes; misspelt words are also matched against
+    their closest spellings when there are few exact results.
+    """
+    start = time.perf_counter()
+    hits = await workers.search.run(search_index.search, q, limit)
+    results = []
+    for hit in hits:
+        meta = metadata.peek(hit.path)
+        if meta is None:
+            continue
+        results.append(SearchResult(
+            path=hit.path,
+            title=meta.title,
+            artist=meta.artist,
+            album=meta.album,
+            genre=meta.genre,
+            duration=meta.duration,
+            track_id=player.playlist.id_of_path(hit.path),
+            score=round(hit.score, 3),
+            fuzzy=hit.fuzzy,
+        ))
+    return SearchResponse(query=q, results=results, took_ms=round((time.perf_counter() - start) * 1000, 2))
+
+@app.get("/zones")
+async def list_zones():
+    """Every zone, and whether its player is currently live"""
+    return await workers.control.run(players.zones)
+
+@app.delete("/zones/{zone}")
+async def delete_zone(zone: str):
+    """Stop a zone and forget its playlist"""
+    if zone == DEFAULT_ZONE:
+        raise HTTPException(status_code=400, detail="The default zone can't be deleted")
+    removed = await workers.control.run(players.remove, zone)
+    if not await workers.control.run(forget_zone, zone) and not removed:
+        raise HTTPException(status_code=404, detail="Zone not found")
+    return {"message": f"Zone {zone} deleted"}
+
+app.include_router(zone_router)
+app.include_router(zone_router, prefix="/zones/{zone}")
+
+# Mount static files last so they don't shadow API routes such as /downloads/{job_id}
+app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
+app.mount("/downloads", StaticFiles(directory="downloads"), name="downloads")
+
+def uvicorn_command(*options: str) -> List[str]:
+    """Command line serving this app from a fresh interpreter
+
+    Worker and reloader processes must import the app as api_server rather
+    than alongside this file running as __main__, or it is set up twice.
+    """
+    app_dir = os.path.dirname(os.path.abspath(__file__))
+    return [sys.executable, "-m", "uvicorn", "api_server:app", "--app-dir", app_dir, *options]
+
+def run_cluster(host: str, port: int, processes: int):
+    """Serve the API from several replica processes in front of one player owner
+
+    The owner runs the players behind a private address (MUSIC_PLAYER_OWNER_URL);
+    the replicas share the public port.
+    """
+    import signal
+    import subprocess
+    from urllib.parse import urlsplit
+
+    if not ipc.available():
+        raise SystemExit("Several workers need Unix-domain sockets; run with --workers 1")
+    url = owner_url()
+    if url.startswith("unix:"):
+        owner_address = ["--uds", url[len("unix:"):]]
+    else:
+        parts = urlsplit(url)
+        owner_address = ["--host", parts.hostname, "--port", str(parts.port or 80)]
+    owner = subprocess.Popen(
+        uvicorn_command(*owner_address),
+        env={**os.environ, "MUSIC_PLAYER_ROLE": "owner", "MUSIC_PLAYER_OWNER_URL": url},
+    )
+    api = subprocess.Popen(
+        uvicorn_command("--host", host, "--port", str(port), "--workers", str(processes)),
+        env={**os.environ, "MUSIC_PLAYER_ROLE": "replica", "MUSIC_PLAYER_OWNER_URL": url},
+    )
+    # Stopping the launcher stops both
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        api.wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for process in (api, owner):
+            process.terminate()
+            process.wait()
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Music Player API server")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=1,
+                        help="API processes; with more than one, a separate process owns the players")
+    parser.add_argument("--reload", action="store_true", help="Restart on code changes (single process only)")
+    args = parser.parse_args()
+    if args.workers > 1:
+        run_cluster(args.host, args.port, args.workers)
+    elif args.reload:
+        command = uvicorn_command("--host", args.host, "--port", str(args.port), "--reload")
+        os.execv(command[0], command)
+    else:
+        uvicorn.run(app, host=args.host, port=args.port)
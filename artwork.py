@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+"""
+Cover art: read from a track's tags at ingest, stored once per image, and
+served as resized variants from a disk cache
+"""
+import hashlib
+import os
+import shutil
+import struct
+import subprocess
+import uuid
+from typing import BinaryIO, Iterator, List, Optional, Tuple
+
+from streaming import DiskCache
+
+ARTWORK_DIR = "artwork"
+VARIANT_DIR = os.path.join("cache", "artwork")
+DEFAULT_VARIANT_BYTES = 256 * 1024 ** 2
+
+# Square boxes variants are rendered to fit; a request gets the smallest
+# one at least as large, so a handful of files serve every client
+VARIANT_SIZES = (64, 128, 256, 512, 1024)
+DEFAULT_VARIANT_SIZE = 256
+
+# Output format name -> (ffmpeg encoder options, ffmpeg muxer, file extension, content type)
+VARIANT_FORMATS = {
+    "webp": (("-c:v", "libwebp", "-quality", "80"), "webp", ".webp", "image/webp"),
+    "jpeg": (("-c:v", "mjpeg", "-q:v", "4"), "mjpeg", ".jpg", "image/jpeg"),
+}
+
+# Pictures bigger than this are left alone
+MAX_IMAGE_BYTES = 16 * 1024 ** 2
+# MP4 files whose moov box (tags plus sample tables) is bigger than this aren't searched
+MAX_MOOV_BYTES = 64 * 1024 ** 2
+# ID3/FLAC picture type of the front cover, preferred over other pictures
+FRONT_COVER = 3
+
+IMAGE_SIGNATURES = (
+    (b"\xff\xd8\xff", ".jpg"),
+    (b"\x89PNG\r\n\x1a\n", ".png"),
+    (b"GIF8", ".gif"),
+)
+
+
+class ArtworkError(RuntimeError):
+    """Raised when ffmpeg is missing or can't render a variant"""
+
+
+def image_extension(data: bytes) -> Optional[str]:
+    """File extension for image data, from its signature; None if it isn't a known image"""
+    for signature, ext in IMAGE_SIGNATURES:
+        if data.startswith(signature):
+            return ext
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return ".webp"
+    return None
+
+
+def _syncsafe(data: bytes) -> int:
+    return (data[0] << 21) | (data[1] << 14) | (data[2] << 7) | data[3]
+
+
+def _id3_picture(body: bytes, version: int) -> Optional[Tuple[int, bytes]]:
+    """(picture type, data) of an APIC (PIC in ID3v2.2) frame body"""
+    encoding = body[0]
+    if version == 2:
+        # Three-letter image format instead of a MIME type
+        picture_type, rest = body[4], body[5:]
+    else:
+        end = body.index(b"\0", 1)
+        picture_type, rest = body[end + 1], body[end + 2:]
+    # The description ends with one NUL, or two aligned ones in UTF-16
+    if encoding in (1, 2):
+        end = rest.find(b"\0\0")
+        while end >= 0 and end % 2:
+            end = rest.find(b"\0\0", end + 1)
+        if end < 0:
+            return None
+        return picture_type, rest[end + 2:]
+    end = rest.find(b"\0")
+    return (picture_type, rest[end + 1:]) if end >= 0 else None
+
+
+def _id3_pictures(f: BinaryIO) -> List[Tuple[int, bytes]]:
+    """Pictures in the ID3v2 tag at the file's current position; leaves it after the tag"""
+    header = f.read(10)
+    if len(header) < 10 or header[:3] != b"ID3" or header[3] not in (2, 3, 4):
+        return []
+    version, flags = header[3], header[5]
+    size = _syncsafe(header[6:10])
+    tag = f.read(size)
+    if len(tag) < size:
+        return []  # cut short; its pictures would be too
+    if flags & 0x10:
+        f.read(10)  # footer
+    if version < 4 and flags & 0x80:
+        tag = tag.replace(b"\xff\x00", b"\xff")
+    pos = 0
+    if version == 3 and flags & 0x40:
+        pos = 4 + struct.unpack(">I", tag[:4])[0]
+    elif version == 4 and flags & 0x40:
+        pos = _syncsafe(tag[:4])
+    header_size = 6 if version == 2 else 10
+    pictures = []
+    while pos + header_size <= len(tag) and tag[pos] != 0:
+        frame_flags = 0
+        if version == 2:
+            frame_id, size = tag[pos:pos + 3], int.from_bytes(tag[pos + 3:pos + 6], "big")
+        else:
+            frame_id = tag[pos:pos + 4]
+            size = struct.unpack(">I", tag[pos + 4:pos + 8])[0] if version == 3 else _syncsafe(tag[pos + 4:pos + 8])
+            frame_flags = int.from_bytes(tag[pos + 8:pos + 10], "big")
+        body = tag[pos + header_size:pos + header_size + size]
+        pos += header_size + size
+        if frame_id not in (b"APIC", b"PIC") or not body:
+            continue
+        if version == 3:
+            if frame_flags & 0xc0:
+                continue  # compressed or encrypted
+            if frame_flags & 0x20:
+                body = body[1:]  # group id
+        elif version == 4:
+            if frame_flags & 0x0c:
+                continue
+            if frame_flags & 0x40:
+                body = body[1:]
+            if frame_flags & 0x01:
+                body = body[4:]  # data length indicator
+            if frame_flags & 0x02:
+                body = body.replace(b"\xff\x00", b"\xff")
+        picture = _id3_picture(body, version)
+        if picture is not None:
+            pictures.append(picture)
+    return pictures
+
+
+def _flac_pictures(f: BinaryIO) -> List[Tuple[int, bytes]]:
+    """PICTURE metadata blocks of a FLAC stream starting at the file's position"""
+    if f.read(4) != b"fLaC":
+        return []
+    pictures = []
+    while True:
+        header = f.read(4)
+        if len(header) < 4:
+            return pictures
+        kind, size = header[0] & 0x7f, int.from_bytes(header[1:4], "big")
+        if kind == 6:
+            block = f.read(size)
+            if len(block) < size:
+                return pictures
+            picture_type, mime_length = struct.unpack(">II", block[:8])
+            pos = 8 + mime_length
+            pos += 4 + struct.unpack(">I", block[pos:pos + 4])[0] + 16  # description, dimensions
+            length = struct.unpack(">I", block[pos:pos + 4])[0]
+            pictures.append((picture_type, block[pos + 4:pos + 4 + length]))
+        else:
+            f.seek(size, os.SEEK_CUR)
+        if header[0] & 0x80:
+            return pictures
+
+
+def _mp4_boxes(data: bytes, start: int, end: int) -> Iterator[Tuple[bytes, int, int]]:
+    """(type, body start, body end) of the boxes in data[start:end]"""
+    pos = start
+    while pos + 8 <= end:
+        size, kind = struct.unpack(">I4s", data[pos:pos + 8])
+        header = 8
+        if size == 1:
+            size, header = struct.unpack(">Q", data[pos + 8:pos + 16])[0], 16
+        elif size == 0:
+            size = end - pos
+        if size < header or pos + size > end:
+            return
+        yield kind, pos + header, pos + size
+        pos += size
+
+
+def _mp4_pictures(f: BinaryIO) -> List[Tuple[int, bytes]]:
+    """Images in an MP4 file's moov/udta/meta/ilst/covr box; mdat is skipped, not read"""
+    while True:
+        header = f.read(8)
+        if len(header) < 8:
+            return []
+        size, kind = struct.unpack(">I4s", header)
+        header_size = 8
+        if size == 1:
+            size, header_size = struct.unpack(">Q", f.read(8))[0], 16
+        if kind == b"moov":
+            if size == 0 or size - header_size > MAX_MOOV_BYTES:
+                return []
+            moov = f.read(size - header_size)
+            if len(moov) < size - header_size:
+                return []
+            break
+        if size < header_size:
+            return []
+        f.seek(size - header_size, os.SEEK_CUR)
+    span = (0, len(moov))
+    for wanted in (b"udta", b"meta", b"ilst", b"covr"):
+        span = next(((start, end) for kind, start, end in _mp4_boxes(moov, *span) if kind == wanted), None)
+        if span is None:
+            return []
+        if wanted == b"meta":
+            span = (span[0] + 4, span[1])  # version and flags
+    # Each data box starts with its type and locale; covers carry no picture type
+    return [
+        (FRONT_COVER, moov[start + 8:end])
+        for kind, start, end in _mp4_boxes(moov, *span) if kind == b"data"
+    ]
+
+
+def embedded_picture(path: str) -> Optional[bytes]:
+    """The front cover in a file's ID3, FLAC or MP4 tags, else its first picture
+
+    Only the tags are read, not the audio.
+    """
+    try:
+        with open(path, "rb") as f:
+            magic = f.read(8)
+            f.seek(0)
+            pictures = []
+            if magic[:3] == b"ID3":
+                pictures = _id3_pictures(f)
+                # FLAC files sometimes carry an ID3 tag in front
+                magic = f.read(4)
+                f.seek(-len(magic), os.SEEK_CUR)
+            if magic[:4] == b"fLaC":
+                pictures += _flac_pictures(f)
+            elif magic[4:8] == b"ftyp":
+                pictures = _mp4_pictures(f)
+    except (OSError, IndexError, ValueError, struct.error):
+        return None
+    pictures = [
+        (picture_type, data) for picture_type, data in pictures
+        if len(data) <= MAX_IMAGE_BYTES and image_extension(data) is not None
+    ]
+    if not pictures:
+        return None
+    return next((data for picture_type, data in pictures if picture_type == FRONT_COVER), pictures[0][1])
+
+
+class ArtworkStore:
+    """Stores images at artwork/<aa>/<sha256><ext>; an image's name is that file name
+
+    Every track of an album usually embeds the same cover, which is kept
+    once. Safe to use from several processes (e.g. scanner workers).
+    """
+
+    def __init__(self, root: str = ARTWORK_DIR):
+        self.root = root
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.root, name[:2], name)
+
+    def add(self, data: bytes) -> Optional[str]:
+        """Store image data; returns its name, or None if it isn't an image"""
+        ext = image_extension(data)
+        if ext is None:
+            return None
+        name = hashlib.sha256(data).hexdigest() + ext
+        path = self.path(name)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{uuid.uuid4().hex}"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        return name
+
+    def add_file(self, path: str) -> Optional[str]:
+        """Store an image file (e.g. a downloaded thumbnail); the file itself is left alone"""
+        try:
+            if os.path.getsize(path) > MAX_IMAGE_BYTES:
+                return None
+            with open(path, "rb") as f:
+                return self.add(f.read())
+        except OSError:
+            return None
+
+    def extract(self, path: str) -> Optional[str]:
+        """Store the cover embedded in an audio file; returns its name"""
+        data = embedded_picture(path)
+        return self.add(data) if data is not None else None
+
+
+def variant_size(requested: int) -> int:
+    """The variant size that serves a request for `requested` pixels"""
+    return next((size for size in VARIANT_SIZES if size >= requested), VARIANT_SIZES[-1])
+
+
+class ArtworkCache(DiskCache):
+    """Size-bounded LRU of resized artwork on disk.
+
+    Images are named by their content hash, so a variant's name (image,
+    size, format) always stands for the same picture and never goes stale.
+    WebP is served as JPEG if ffmpeg can't encode it.
+    """
+
+    def __init__(self, store: ArtworkStore, root: str = VARIANT_DIR, max_bytes: int = DEFAULT_VARIANT_BYTES):
+        super().__init__(root, max_bytes)
+        self.store = store
+        self._webp: Optional[bool] = None
+
+    def key(self, name: str, size: int, fmt: str) -> str:
+        """Cache file name for an image fitted to a size in a format"""
+        return f"{os.path.splitext(name)[0]}-{size}{VARIANT_FORMATS[fmt][2]}"
+
+    def output_format(self, fmt: str) -> str:
+        """The format a request for `fmt` is served in"""
+        if fmt == "webp" and self._webp is None:
+            self._webp = has_encoder("libwebp")
+        return "jpeg" if fmt == "webp" and not self._webp else fmt
+
+    def open(self, name: str, size: int, fmt: str) -> Tuple[BinaryIO, int]:
+        """Open an image resized to fit size x size, rendering it first on a miss (blocking).
+
+        `fmt` should come from output_format(). Returns the open file and its size.
+        """
+        source = self.store.path(name)
+        if not os.path.exists(source):
+            raise FileNotFoundError(f"Artwork not found: {name}")
+        return self._open_or_build(
+            self.key(name, size, fmt), lambda dest: resize(source, dest, size, fmt), "artwork",
+        )
+
+
+def has_encoder(encoder: str) -> bool:
+    """Whether the installed ffmpeg was built with an encoder"""
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg is None:
+        return False
+    result = subprocess.run([ffmpeg, "-hide_banner", "-encoders"], capture_output=True)
+    return any(line.split()[1:2] == [encoder] for line in result.stdout.decode(errors="replace").splitlines())
+
+
+def resize(source: str, dest: str, size: int, fmt: str):
+    """Fit an image within size x size with ffmpeg, never enlarging it (blocking)"""
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg is None:
+        raise ArtworkError("ffmpeg not found")
+    encoder, muxer, _, _ = VARIANT_FORMATS[fmt]
+    scale = f"scale='min({size},iw)':'min({size},ih)':force_original_aspect_ratio=decrease"
+    result = subprocess.run(
+        [ffmpeg, "-nostdin", "-v", "error", "-y", "-i", source, "-frames:v", "1",
+         "-vf", scale, *encoder, "-f", muxer, dest],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+    )
+    if result.returncode != 0:
+        raise ArtworkError(result.stderr.decode(errors="replace").strip() or "ffmpeg failed")
@@ -0,0 +1,123 @@
+"""
+Helpers shared by the benchmarks: environments, a server under test and statistics
+"""
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCH_DIR)
+FAKES_DIR = os.path.join(BENCH_DIR, "fakes")
+
+
+def bench_env(fakes: bool = True, **extra: str) -> Dict[str, str]:
+    """Environment for a child process; with fakes, libVLC and yt-dlp are replaced"""
+    env = dict(os.environ)
+    paths = [FAKES_DIR, BENCH_DIR] if fakes else []
+    paths += [REPO_ROOT, env.get("PYTHONPATH")]
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, paths))
+    env["PYTHONDONTWRITEBYTECODE"] = "1"
+    env.update(extra)
+    return env
+
+
+def use_fakes():
+    """Make this process import the fakes instead of libVLC and yt-dlp"""
+    for path in (REPO_ROOT, BENCH_DIR, FAKES_DIR):
+        if path not in sys.path:
+            sys.path.insert(0, path)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def http_status(url: str) -> Optional[int]:
+    """HTTP status of a GET, or None if nothing is listening yet"""
+    try:
+        with urllib.request.urlopen(url, timeout=1) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+    except OSError:
+        return None
+
+
+def wait_for(url: str, proc: subprocess.Popen, deadline: float):
+    while http_status(url) != 200:
+        if proc.poll() is not None:
+            raise RuntimeError(f"server exited with status {proc.returncode}")
+        if time.perf_counter() > deadline:
+            raise RuntimeError(f"timed out waiting for {url}")
+        time.sleep(0.005)
+
+
+def spawn_server(data_dir: str, port: int, fakes: bool = True, workers: int = 1,
+                 **extra_env: str) -> subprocess.Popen:
+    """Start uvicorn serving api_server from data_dir
+
+    With several workers, api_server's own launcher starts the replicas and
+    the player owner, keeping its sockets in data_dir.
+    """
+    if workers > 1:
+        command = [sys.executable, os.path.join(REPO_ROOT, "api_server.py"), "--host", "127.0.0.1",
+                   "--port", str(port), "--workers", str(workers)]
+        extra_env.setdefault("XDG_RUNTIME_DIR", data_dir)
+    else:
+        command = [sys.executable, "-m", "uvicorn", "api_server:app", "--host", "127.0.0.1",
+                   "--port", str(port), "--log-level", "warning"]
+    return subprocess.Popen(
+        command, cwd=data_dir, env=bench_env(fakes, **extra_env),
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+
+
+@contextmanager
+def running_server(data_dir: str, timeout: float = 60.0, workers: int = 1, **extra_env: str) -> Iterator[str]:
+    """A ready server on a free port; yields its base URL"""
+    port = free_port()
+    base = f"http://127.0.0.1:{port}"
+    proc = spawn_server(data_dir, port, workers=workers, **extra_env)
+    try:
+        wait_for(base + "/ready", proc, time.perf_counter() + timeout)
+        yield base
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    """min/median/max of a few repeated measurements"""
+    return {
+        "min": round(min(samples), 4),
+        "median": round(statistics.median(samples), 4),
+        "max": round(max(samples), 4),
+    }
+
+
+def latency_summary(latencies: List[float], seconds: float) -> Dict[str, float]:
+    """Throughput and latency percentiles (ms) of many requests"""
+    if not latencies:
+        return {"requests": 0, "throughput": 0.0}
+    ordered = sorted(latencies)
+
+    def percentile(p: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))] * 1000, 3)
+
+    return {
+        "requests": len(ordered),
+        "throughput": round(len(ordered) / seconds, 1),
+        "p50_ms": percentile(50),
+        "p90_ms": percentile(90),
+        "p99_ms": percentile(99),
+        "max_ms": round(ordered[-1] * 1000, 3),
+    }
@@ -0,0 +1,183 @@
+"""
+Offline stand-in for python-vlc used by the benchmarks
+
+Covers the parts of the API the player and the scanner use. Nothing is
+decoded or played: media report a fixed duration, players just track
+their state and fire the matching events synchronously.
+"""
+import enum
+import os
+
+DURATION_MS = 180000
+
+
+class State(enum.IntEnum):
+    NothingSpecial = 0
+    Opening = 1
+    Buffering = 2
+    Playing = 3
+    Paused = 4
+    Stopped = 5
+    Ended = 6
+    Error = 7
+
+
+class Meta(enum.IntEnum):
+    Title = 0
+    Artist = 1
+    Genre = 2
+    Album = 4
+    ArtworkURL = 15
+
+
+class TrackType(enum.IntEnum):
+    unknown = -1
+    audio = 0
+    video = 1
+    ext = 2
+
+
+class EventType(enum.IntEnum):
+    MediaPlayerMediaChanged = 256
+    MediaPlayerBuffering = 259
+    MediaPlayerPlaying = 260
+    MediaPlayerPaused = 261
+    MediaPlayerStopped = 262
+    MediaPlayerEndReached = 265
+    MediaPlayerEncounteredError = 266
+    MediaPlayerTimeChanged = 267
+    MediaPlayerPositionChanged = 268
+
+
+class _Payload:
+    def __init__(self, **fields):
+        self.__dict__.update(fields)
+
+
+class Event:
+    def __init__(self, event_type, **fields):
+        self.type = event_type
+        self.u = _Payload(**fields)
+
+
+class EventManager:
+    def __init__(self):
+        self._handlers = {}
+
+    def event_attach(self, event_type, callback, *args):
+        self._handlers.setdefault(event_type, []).append((callback, args))
+
+    def event_detach(self, event_type):
+        self._handlers.pop(event_type, None)
+
+    def fire(self, event_type, **fields):
+        event = Event(event_type, **fields)
+        for callback, args in list(self._handlers.get(event_type, [])):
+            callback(event, *args)
+
+
+class _AudioTrack:
+    type = TrackType.audio
+    codec = int.from_bytes(b"s16l", "little")
+    bitrate = 1411200
+
+
+class Media:
+    def __init__(self, path):
+        self.path = path
+        self.options = []
+
+    def parse(self):
+        pass
+
+    def get_duration(self):
+        return DURATION_MS
+
+    def get_meta(self, meta):
+        return os.path.basename(self.path) if meta == Meta.Title else None
+
+    def tracks_get(self):
+        return iter([_AudioTrack()])
+
+    def add_option(self, option):
+        self.options.append(option)
+
+    def get_mrl(self):
+        return "file://" + os.path.abspath(self.path)
+
+    def release(self):
+        pass
+
+
+class MediaPlayer:
+    def __init__(self):
+        self._media = None
+        self._state = State.NothingSpecial
+        self._volume = 100
+        self._time = 0
+        self._events = EventManager()
+
+    def set_media(self, media):
+        self._media = media
+        self._time = 0
+
+    def get_media(self):
+        return self._media
+
+    def play(self):
+        self._state = State.Playing
+        self._events.fire(EventType.MediaPlayerPlaying)
+        return 0
+
+    def pause(self):
+        self.set_pause(self._state == State.Playing)
+
+    def set_pause(self, paused):
+        self._state = State.Paused if paused else State.Playing
+        self._events.fire(EventType.MediaPlayerPaused if paused else EventType.MediaPlayerPlaying)
+
+    def stop(self):
+        self._state = State.Stopped
+        self._events.fire(EventType.MediaPlayerStopped)
+
+    def get_state(self):
+        return self._state
+
+    def audio_set_volume(self, volume):
+        self._volume = volume
+        return 0
+
+    def audio_get_volume(self):
+        return self._volume
+
+    def get_time(self):
+        return self._time
+
+    def set_time(self, time_ms):
+        self._time = time_ms
+
+    def get_length(self):
+        return DURATION_MS if self._media is not None else -1
+
+    def get_position(self):
+        return self._time / DURATION_MS if self._media is not None else 0.0
+
+    def event_manager(self):
+        return self._events
+
+    def release(self):
+        pass
+
+
+class Instance:
+    def __init__(self, *args):
+        self.args = args
+
+    def media_new(self, path):
+        return Media(path)
+
+    def media_player_new(self):
+        return MediaPlayer()
+
+    def release(self):
+        pass
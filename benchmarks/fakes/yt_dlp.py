@@ -0,0 +1,61 @@
+"""
+Offline stand-in for yt-dlp used by the benchmarks
+
+"Downloads" take BENCH_DOWNLOAD_SECONDS (default 0.2) of wall time spread
+over progress-hook calls, then write a short generated WAV under the
+requested name. A URL containing "list=" expands to `count` entries
+(e.g. https://example.test/playlist?list=x&count=50).
+"""
+import os
+import time
+from urllib.parse import parse_qs, urlparse
+
+from fixtures import sine_wav_bytes
+
+PROGRESS_STEPS = 10
+
+
+class DownloadError(Exception):
+    pass
+
+
+class YoutubeDL:
+    def __init__(self, params=None):
+        self.params = params or {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def extract_info(self, url, download=True):
+        query = parse_qs(urlparse(url).query)
+        if not download:
+            if "list" not in query:
+                return {"webpage_url": url, "title": url}
+            count = int(query.get("count", ["10"])[0])
+            return {"entries": [{"url": f"{url}&entry={i}"} for i in range(count)]}
+
+        title = "bench " + "".join(c for c in url.rsplit("/", 1)[-1] if c.isalnum())
+        data = sine_wav_bytes(seconds=0.5, frequency=220 + len(url) % 400)
+        seconds = float(os.environ.get("BENCH_DOWNLOAD_SECONDS", "0.2"))
+        for step in range(1, PROGRESS_STEPS + 1):
+            time.sleep(seconds / PROGRESS_STEPS)
+            for hook in self.params.get("progress_hooks", []):
+                hook({
+                    "status": "downloading",
+                    "downloaded_bytes": len(data) * step // PROGRESS_STEPS,
+                    "total_bytes": len(data),
+                })
+
+        # Reported through requested_downloads like the real one, which is
+        # where the downloader takes the final path from
+        path = self.params["outtmpl"].replace("%(title)s", title).replace("%(ext)s", "mp3")
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(data)
+        info = {"title": title, "ext": "mp3", "filepath": path, "requested_downloads": [{"filepath": path}]}
+        for hook in self.params.get("progress_hooks", []):
+            hook({"status": "finished", "filename": path, "info_dict": info})
+        return info
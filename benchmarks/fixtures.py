@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Fixture audio for the benchmarks: short generated WAV files
+
+    python benchmarks/fixtures.py /tmp/bench-library --count 1000
+"""
+import argparse
+import io
+import math
+import os
+import struct
+import wave
+from typing import List
+
+SAMPLE_RATE = 44100
+
+
+def sine_wav_bytes(seconds: float = 0.5, frequency: float = 440.0,
+                   sample_rate: int = SAMPLE_RATE, channels: int = 2) -> bytes:
+    """A 16-bit PCM WAV of a sine tone at half scale"""
+    frames = int(seconds * sample_rate)
+    step = 2 * math.pi * frequency / sample_rate
+    samples = [int(16383 * math.sin(i * step)) for i in range(frames)]
+    pcm = struct.pack(f"<{frames}h", *samples)
+    if channels > 1:
+        pcm = b"".join(pcm[i:i + 2] * channels for i in range(0, len(pcm), 2))
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(channels)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(pcm)
+    return buffer.getvalue()
+
+
+def make_tracks(root: str, count: int, seconds: float = 0.5, distinct: bool = True) -> List[str]:
+    """Write `count` WAV files under root (100 per folder); returns their paths.
+
+    Distinct files differ in pitch and content, so content-addressed
+    storage keeps every one of them. Otherwise a single file is written
+    and hard-linked, which makes libraries of 100k tracks cheap to build.
+    """
+    paths = []
+    template = None
+    for i in range(count):
+        folder = os.path.join(root, f"album{i // 100:04d}")
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, f"track{i:06d}.wav")
+        if os.path.exists(path):
+            paths.append(path)
+            continue
+        if distinct:
+            with open(path, "wb") as f:
+                f.write(sine_wav_bytes(seconds, frequency=110.0 + i % 880 + i / 1000.0))
+        elif template is None:
+            with open(path, "wb") as f:
+                f.write(sine_wav_bytes(seconds))
+            template = path
+        else:
+            try:
+                os.link(template, path)
+            except OSError:
+                with open(template, "rb") as src, open(path, "wb") as dst:
+                    dst.write(src.read())
+        paths.append(path)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate fixture audio files")
+    parser.add_argument("root")
+    parser.add_argument("--count", type=int, default=100)
+    parser.add_argument("--seconds", type=float, default=0.5)
+    parser.add_argument("--linked", action="store_true", help="hard-link one file instead of distinct files")
+    args = parser.parse_args()
+    paths = make_tracks(args.root, args.count, args.seconds, distinct=not args.linked)
+    print(f"{len(paths)} files under {args.root}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,635 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite for the player core and the API, runnable offline
+
+libVLC and yt-dlp are replaced by the fakes in benchmarks/fakes and all
+audio comes from benchmarks/fixtures.py, so results only depend on this
+code and the machine. Each run writes a JSON file that a later run can be
+compared against:
+
+    python benchmarks/run.py                          # everything
+    python benchmarks/run.py --suites playlist --sizes 1000,10000,100000
+    python benchmarks/run.py --quick --compare benchmarks/results/<earlier>.json
+
+The API suites need httpx (pip install -r benchmarks/requirements.txt).
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from common import BENCH_DIR, REPO_ROOT, latency_summary, running_server, use_fakes
+from fixtures import make_tracks
+
+SUITES = ("playlist", "search", "fingerprint", "artwork", "api", "replicas", "ipc", "upload", "download", "startup")
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+
+# Endpoints hammered by the pollers in the api suite
+POLLED_ENDPOINTS = ("/status", "/playlist?limit=100", "/playlist")
+
+# Commands timed over the local control socket in the ipc suite
+IPC_COMMANDS = (("status",), ("volume", 50), ("snapshot", None))
+
+# Final statuses of a download job
+DOWNLOAD_DONE = ("done", "failed", "cancelled")
+
+
+def per_op(fn: Callable[[int], Any], count: int) -> float:
+    """Mean microseconds per call of fn(i) for i in range(count)"""
+    start = time.perf_counter()
+    for i in range(count):
+        fn(i)
+    return round((time.perf_counter() - start) / count * 1e6, 2)
+
+
+def seconds(fn: Callable[[], Any]) -> float:
+    start = time.perf_counter()
+    fn()
+    return round(time.perf_counter() - start, 4)
+
+
+# ---- playlist: MusicPlayer in-process ----
+
+def bench_playlist(workdir: str, sizes: List[int], ops: int) -> Dict[str, Any]:
+    """Playlist operations on a MusicPlayer holding `size` tracks
+
+    store_load_s reopens the playlist the way a zone does: the stored
+    snapshot plus `ops` journaled moves replayed on top.
+    """
+    use_fakes()
+    from database import PlaylistStore
+    from music_player import MusicPlayer
+    from playlist import IndexedPlaylist
+
+    library = make_tracks(os.path.join(workdir, "playlist"), max(sizes) + ops, distinct=False)
+    results = {}
+    for size in sizes:
+        rng = random.Random(size)
+        player = MusicPlayer()
+        playlist = player.playlist
+        extra = library[size:size + ops]
+        result = {"add_bulk_s": seconds(lambda: player.add(library[:size]))}
+        ids = [track_id for track_id, _ in playlist.items()]
+        picks = [rng.choice(ids) for _ in range(ops)]
+        positions = [rng.randrange(size) for _ in range(ops)]
+
+        result["append_us"] = per_op(lambda i: player.add_single(extra[i]), ops)
+        result["contains_us"] = per_op(lambda i: player.contains(library[positions[i]]), ops)
+        result["position_of_us"] = per_op(lambda i: playlist.position_of(picks[i]), ops)
+        result["id_at_us"] = per_op(lambda i: playlist.id_at(positions[i]), ops)
+        result["move_us"] = per_op(lambda i: player.move_track(picks[i], positions[i]), ops)
+        result["page_100_us"] = per_op(lambda i: list(playlist.items(positions[i], positions[i] + 100)), ops)
+        result["play_index_us"] = per_op(lambda i: player.play_index(positions[i]), ops)
+        result["next_us"] = per_op(lambda i: player.next(), ops)
+        store = PlaylistStore(os.path.join(workdir, f"playlist-{size}.db"))
+        result["store_write_s"] = seconds(lambda: store.write(
+            "bench", list(playlist.items()), playlist.next_id, playlist.version
+        ))
+        store.record(
+            "bench", [("move", picks[i], None, positions[i]) for i in range(ops)],
+            len(playlist), playlist.next_id, playlist.version,
+        )
+
+        def reopen():
+            stored = store.load("bench")
+            restored = IndexedPlaylist()
+            restored.restore(stored.items, stored.next_id, stored.version)
+            for edit in stored.edits:
+                restored.apply(edit)
+
+        result["store_load_s"] = seconds(reopen)
+        store.close()
+        removed = rng.sample(ids, min(ops, size))
+        result["remove_us"] = per_op(lambda i: player.remove_id(removed[i]), len(removed))
+        player.release()
+        results[str(size)] = result
+    return results
+
+
+# ---- search: SearchIndex in-process ----
+
+_SYLLABLES = ("ka", "lo", "mi", "ra", "ten", "so", "vel", "dor", "an", "qui", "ber", "lu", "na", "zen")
+
+
+def _fake_word(rng: random.Random) -> str:
+    return "".join(rng.choice(_SYLLABLES) for _ in range(rng.randint(2, 4))).title()
+
+
+def bench_search(workdir: str, sizes: List[int], queries: int) -> Dict[str, Any]:
+    """Build, reopen and query a search index over `size` tagged tracks"""
+    use_fakes()
+    from database import TrackMetadata
+    from search import SearchIndex
+
+    results = {}
+    for size in sizes:
+        rng = random.Random(size)
+        artists = [f"{_fake_word(rng)} {_fake_word(rng)}" for _ in range(max(1, size // 30))]
+        albums = [_fake_word(rng) for _ in range(max(1, size // 12))]
+        metas = [
+            TrackMetadata(
+                path=f"/library/{i:07d}.mp3", mtime=0.0, size=0,
+                title=" ".join(_fake_word(rng) for _ in range(rng.randint(1, 4))),
+                artist=rng.choice(artists), album=rng.choice(albums), genre=rng.choice(("Rock", "Jazz", "Pop")),
+            )
+            for i in range(size)
+        ]
+        db_path = os.path.join(workdir, f"search-{size}.db")
+        index = SearchIndex(db_path)
+        result = {"build_s": seconds(lambda: index.rebuild(metas))}
+        index.close()
+        result["open_s"] = seconds(lambda: SearchIndex(db_path).close())
+        index = SearchIndex(db_path)
+
+        picks = [rng.choice(metas) for _ in range(queries)]
+        words = [meta.artist.split()[0].lower() for meta in picks]
+        # A dropped letter in the middle of a word that is long enough to correct
+        typos = [word[:len(word) // 2] + word[len(word) // 2 + 1:] for word in words]
+        result["word_us"] = per_op(lambda i: index.search(words[i], 50), queries)
+        result["prefix_3_us"] = per_op(lambda i: index.search(words[i][:3], 50), queries)
+        result["two_words_us"] = per_op(lambda i: index.search(f"{picks[i].artist} {picks[i].album[:4]}", 50), queries)
+        result["typo_us"] = per_op(lambda i: index.search(typos[i], 50), queries)
+        result["single_letter_us"] = per_op(lambda i: index.search("k", 50), queries)
+        result["update_us"] = per_op(lambda i: index.update([picks[i]]), queries)
+        index.close()
+        results[str(size)] = result
+    return results
+
+
+# ---- fingerprint: fingerprinting speed and duplicate lookups in-process ----
+
+def bench_fingerprint(workdir: str, sizes: List[int], queries: int) -> Dict[str, Any]:
+    """Fingerprint synthetic audio, then add re-encoded copies to libraries of `size` tracks
+
+    Library fingerprints are random (200 frames each) with summaries about
+    as correlated as real songs'; a copy differs from its original in 5% of
+    the bits. Recall is the share of copies matched to their original.
+    """
+    use_fakes()
+    import sqlite3
+
+    import numpy as np
+    import fingerprint
+    from database import FingerprintStore, TrackFingerprint
+
+    rng = np.random.default_rng(0)
+    seconds_of_audio = 60
+    t = np.arange(seconds_of_audio * fingerprint.SAMPLE_RATE) / fingerprint.SAMPLE_RATE
+    mono = sum(np.sin(2 * np.pi * f * t) for f in (220.0, 277.2, 329.6)).astype(np.float32) / 3
+    stereo = np.stack((mono, mono), axis=1)
+    fingerprinter = fingerprint.Fingerprinter()
+    start = time.perf_counter()
+    for offset in range(0, len(stereo), 480000):
+        fingerprinter.feed(stereo[offset:offset + 480000])
+    fingerprinter.finish()
+    results: Dict[str, Any] = {"audio_x_realtime": round(seconds_of_audio / (time.perf_counter() - start), 1)}
+
+    common = rng.standard_normal(fingerprint.SUMMARY_SIZE)
+    bits = np.arange(fingerprint.CODE_BITS, dtype=np.uint32)
+
+    def unit(vector: np.ndarray) -> np.ndarray:
+        return (vector / np.linalg.norm(vector)).astype("<f4")
+
+    for size in sizes:
+        root = os.path.join(workdir, f"fingerprint-{size}")
+        os.makedirs(root)
+        paths = [os.path.join(root, f"{i:07d}.mp3") for i in range(size)]
+        for path in paths:
+            # Matches are only reported for files that still exist
+            open(path, "wb").close()
+        db_path = os.path.join(workdir, f"fingerprint-{size}.db")
+        FingerprintStore(db_path).close()
+        codes = rng.integers(0, 1 << fingerprint.CODE_BITS, size=(size, 200), dtype=np.uint32)
+        summaries = [unit(0.75 * common + rng.standard_normal(fingerprint.SUMMARY_SIZE)) for _ in range(size)]
+        with sqlite3.connect(db_path) as conn:
+            conn.executemany(
+                "INSERT INTO track_fingerprints (path, mtime, size, duration, codes, summary) "
+                "VALUES (?, 0, 0, 60, ?, ?)",
+                ((paths[i], codes[i].astype("<u4").tobytes(), summaries[i].tobytes()) for i in range(size)),
+            )
+        store = FingerprintStore(db_path)
+        index = None
+
+        def build():
+            nonlocal index
+            index = fingerprint.DuplicateIndex(store)
+
+        result: Dict[str, Any] = {"build_s": seconds(build)}
+        originals = rng.integers(0, size, queries)
+        copies = []
+        for i, j in enumerate(originals):
+            flips = (rng.random((200, fingerprint.CODE_BITS)) < 0.05).astype(np.uint32) << bits
+            copies.append(TrackFingerprint(
+                path=os.path.join(root, f"copy-{i:05d}.mp3"), mtime=0.0, size=0, duration=60.0,
+                codes=(codes[j] ^ flips.sum(axis=1, dtype=np.uint32)).astype("<u4").tobytes(),
+                # About as close to the original as a re-encode's summary (cosine ~0.99)
+                summary=unit(summaries[j] + 0.01 * rng.standard_normal(fingerprint.SUMMARY_SIZE)).tobytes(),
+            ))
+        candidates = [len(index.candidates(np.frombuffer(copy.summary, dtype="<f4"))) for copy in copies]
+        matches = []
+        result["add_us"] = per_op(lambda i: matches.append(index.add(copies[i])), queries)
+        result["candidates_mean"] = round(float(np.mean(candidates)), 1)
+        result["recall"] = round(sum(
+            any(path == paths[j] for path, _ in found) for j, found in zip(originals, matches)
+        ) / queries, 3)
+        store.close()
+        results[str(size)] = result
+    return results
+
+
+def bench_artwork(workdir: str, files: int) -> Dict[str, Any]:
+    """Extract the ID3 covers of `files` 4 MB tracks (10 albums), then serve resized variants
+
+    There is no ffmpeg here to render variants, so the cache is seeded with
+    them and only hits are timed.
+    """
+    use_fakes()
+    from artwork import ArtworkCache, ArtworkStore
+
+    root = os.path.join(workdir, "artwork-tracks")
+    os.makedirs(root)
+    audio = os.urandom(4 * 1024 * 1024)
+    paths = []
+    for i in range(files):
+        cover = b"\xff\xd8\xff\xe0" + bytes([i % 10]) * 200_000
+        frame = b"\0image/jpeg\0\x03\0" + cover
+        tag = b"APIC" + len(frame).to_bytes(4, "big") + b"\0\0" + frame
+        size = bytes((len(tag) >> shift) & 0x7f for shift in (21, 14, 7, 0))
+        paths.append(os.path.join(root, f"{i:05d}.mp3"))
+        with open(paths[-1], "wb") as f:
+            f.write(b"ID3\x03\0\0" + size + tag + audio)
+
+    store = ArtworkStore(os.path.join(workdir, "artwork"))
+    names = []
+    results: Dict[str, Any] = {"extract_us": per_op(lambda i: names.append(store.extract(paths[i])), files)}
+    results["images_stored"] = sum(len(files) for _, _, files in os.walk(store.root))
+    cache_dir = os.path.join(workdir, "artwork-cache")
+    cache = ArtworkCache(store, cache_dir)
+    for name in set(names):
+        with open(os.path.join(cache_dir, cache.key(name, 128, "jpeg")), "wb") as f:
+            f.write(os.urandom(8000))
+    # Reopened, it picks the seeded variants up like those of a previous run
+    cache = ArtworkCache(store, cache_dir)
+    results["variant_hit_us"] = per_op(lambda i: cache.open(names[i], 128, "jpeg")[0].close(), files)
+    return results
+
+
+# ---- HTTP load helpers ----
+
+async def _poll(base: str, path: str, clients: int, duration: float,
+                stop: Optional[asyncio.Event] = None) -> Dict[str, Any]:
+    """`clients` concurrent loops GETting path for `duration` seconds or until stop is set"""
+    import httpx
+
+    latencies: List[float] = []
+    errors = 0
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+    async with httpx.AsyncClient(base_url=base, limits=limits, timeout=60) as client:
+        deadline = time.perf_counter() + duration
+
+        async def loop():
+            nonlocal errors
+            while time.perf_counter() < deadline and not (stop is not None and stop.is_set()):
+                start = time.perf_counter()
+                response = await client.get(path)
+                await response.aread()
+                latencies.append(time.perf_counter() - start)
+                if response.status_code >= 400:
+                    errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(loop() for _ in range(clients)))
+        elapsed = time.perf_counter() - started
+    return {**latency_summary(latencies, elapsed), "errors": errors}
+
+
+def _seed_library(base: str, root: str, tracks: int):
+    """Scan generated tracks into the server's library and playlist"""
+    import httpx
+
+    make_tracks(root, tracks, distinct=False)
+    with httpx.Client(base_url=base, timeout=60) as client:
+        job_id = client.post("/library/scan", json={"paths": [root]}).json()["id"]
+        while True:
+            job = client.get(f"/library/scan/{job_id}").json()
+            if job["status"] in ("failed", "cancelled"):
+                raise RuntimeError(f"library scan {job['status']}: {job['error']}")
+            # Tracks are added to the playlist once probing is done
+            if job["status"] == "done" and job["added"]:
+                return
+            time.sleep(0.05)
+
+
+# ---- api: /status and /playlist under concurrent pollers ----
+
+def bench_api(workdir: str, tracks: int, pollers: List[int], duration: float) -> Dict[str, Any]:
+    data_dir = os.path.join(workdir, "api")
+    os.makedirs(data_dir)
+    results = {"tracks": tracks}
+    with running_server(data_dir) as base:
+        _seed_library(base, os.path.join(workdir, "api-library"), tracks)
+        for path in POLLED_ENDPOINTS:
+            results[path] = {
+                str(clients): asyncio.run(_poll(base, path, clients, duration))
+                for clients in pollers
+            }
+    return results
+
+
+# ---- replicas: read throughput as API worker processes are added ----
+
+def bench_replicas(workdir: str, tracks: int, worker_counts: List[int], clients: int,
+                   duration: float) -> Dict[str, Any]:
+    """The api suite's reads at one client count, per number of API workers
+
+    One worker is the plain single-process server; more start replicas in
+    front of a player owner. Throughput can only grow up to the CPU count.
+    """
+    results: Dict[str, Any] = {"tracks": tracks, "clients": clients}
+    for workers in worker_counts:
+        data_dir = os.path.join(workdir, f"replicas-{workers}")
+        os.makedirs(data_dir)
+        with running_server(data_dir, workers=workers) as base:
+            _seed_library(base, os.path.join(workdir, f"replicas-{workers}-library"), tracks)
+            results[str(workers)] = {
+                path: asyncio.run(_poll(base, path, clients, duration)) for path in POLLED_ENDPOINTS
+            }
+    return results
+
+
+# ---- ipc: the same player driven over its Unix-domain socket ----
+
+def bench_ipc(workdir: str, tracks: int, calls: int) -> Dict[str, Any]:
+    """Round trips of single commands on the local socket, next to GET /status"""
+    import httpx
+
+    use_fakes()
+    from ipc import IPCClient
+
+    data_dir = os.path.join(workdir, "ipc")
+    os.makedirs(data_dir)
+    socket_path = os.path.join(data_dir, "player.sock")
+    results: Dict[str, Any] = {"tracks": tracks}
+    with running_server(data_dir, MUSIC_PLAYER_SOCKET=socket_path) as base:
+        _seed_library(base, os.path.join(workdir, "ipc-library"), tracks)
+        client = IPCClient(socket_path)
+        try:
+            for command in IPC_COMMANDS:
+                latencies = []
+                started = time.perf_counter()
+                for _ in range(calls):
+                    start = time.perf_counter()
+                    client.call(*command)
+                    latencies.append(time.perf_counter() - start)
+                results[command[0]] = latency_summary(latencies, time.perf_counter() - started)
+        finally:
+            client.close()
+        with httpx.Client(base_url=base) as http:
+            latencies = []
+            started = time.perf_counter()
+            for _ in range(calls):
+                start = time.perf_counter()
+                http.get("/status")
+                latencies.append(time.perf_counter() - start)
+            results["http /status"] = latency_summary(latencies, time.perf_counter() - started)
+    return results
+
+
+# ---- upload: concurrent POST /upload of distinct files ----
+
+def bench_upload(workdir: str, files: int, clients: int) -> Dict[str, Any]:
+    data_dir = os.path.join(workdir, "upload")
+    os.makedirs(data_dir)
+    paths = make_tracks(os.path.join(workdir, "upload-fixtures"), files, distinct=True)
+    total_bytes = sum(os.path.getsize(path) for path in paths)
+
+    async def upload_all(base: str) -> Dict[str, Any]:
+        import httpx
+
+        pending = list(paths)
+        latencies: List[float] = []
+        errors = 0
+        async with httpx.AsyncClient(base_url=base, timeout=120) as client:
+
+            async def loop():
+                nonlocal errors
+                while pending:
+                    path = pending.pop()
+                    with open(path, "rb") as f:
+                        data = f.read()
+                    start = time.perf_counter()
+                    response = await client.post(
+                        "/upload", files={"file": (os.path.basename(path), data, "audio/wav")}
+                    )
+                    latencies.append(time.perf_counter() - start)
+                    if response.status_code >= 400:
+                        errors += 1
+
+            started = time.perf_counter()
+            await asyncio.gather(*(loop() for _ in range(clients)))
+            elapsed = time.perf_counter() - started
+        return {
+            **latency_summary(latencies, elapsed),
+            "errors": errors,
+            "elapsed_s": round(elapsed, 3),
+            "mb_per_s": round(total_bytes / elapsed / 1e6, 2),
+        }
+
+    with running_server(data_dir) as base:
+        result = asyncio.run(upload_all(base))
+    return {"files": files, "clients": clients, "bytes": total_bytes, **result}
+
+
+# ---- download: queue saturation with slow fake downloads ----
+
+def bench_download(workdir: str, jobs: int, download_seconds: float, pollers: int) -> Dict[str, Any]:
+    """Queue more downloads than there are download workers and watch the API"""
+    data_dir = os.path.join(workdir, "download")
+    os.makedirs(data_dir)
+
+    async def saturate(base: str) -> Dict[str, Any]:
+        import httpx
+
+        async with httpx.AsyncClient(base_url=base, timeout=60) as client:
+            parallel = (await client.get("/workers")).json()["download"]["max_workers"]
+            urls = [f"https://example.test/watch?v={i:06d}" for i in range(jobs)]
+            started = time.perf_counter()
+            response = await client.post("/download/batch", json={"urls": urls, "expand_playlists": False})
+            response.raise_for_status()
+            submitted = time.perf_counter() - started
+
+            # How /status holds up while the download workers are saturated
+            done = asyncio.Event()
+            status = asyncio.create_task(_poll(base, "/status", pollers, math.inf, done))
+            max_waiting = 0
+            while True:
+                listed = (await client.get("/downloads")).json()
+                max_waiting = max(max_waiting, sum(1 for job in listed if job["status"] == "queued"))
+                finished = [job for job in listed if job["status"] in DOWNLOAD_DONE]
+                if len(finished) >= jobs:
+                    break
+                await asyncio.sleep(0.05)
+            elapsed = time.perf_counter() - started
+            done.set()
+            ideal = math.ceil(jobs / parallel) * download_seconds
+        return {
+            "jobs": jobs,
+            "parallel": parallel,
+            "download_seconds": download_seconds,
+            "submit_s": round(submitted, 3),
+            "elapsed_s": round(elapsed, 3),
+            "ideal_s": round(ideal, 3),
+            "efficiency": round(ideal / elapsed, 3),
+            "jobs_per_s": round(jobs / elapsed, 2),
+            "max_waiting": max_waiting,
+            "failed": sum(1 for job in finished if job["status"] != "done"),
+            "status_during_saturation": await status,
+        }
+
+    with running_server(data_dir, BENCH_DOWNLOAD_SECONDS=str(download_seconds)) as base:
+        return asyncio.run(saturate(base))
+
+
+# ---- startup ----
+
+def bench_startup(runs: int) -> Dict[str, Any]:
+    import startup
+
+    return startup.run(runs=runs, fakes=True)
+
+
+# ---- results ----
+
+def git_revision() -> Dict[str, Any]:
+    def git(*args: str) -> str:
+        return subprocess.run(
+            ["git", *args], cwd=REPO_ROOT, capture_output=True, text=True
+        ).stdout.strip()
+
+    return {"commit": git("rev-parse", "--short", "HEAD") or None,
+            "dirty": bool(git("status", "--porcelain", "--untracked-files=no"))}
+
+
+def flatten(data: Any, prefix: str = "") -> Dict[str, float]:
+    """Numeric leaves keyed by dotted path"""
+    if isinstance(data, dict):
+        flat = {}
+        for key, value in data.items():
+            flat.update(flatten(value, f"{prefix}.{key}" if prefix else str(key)))
+        return flat
+    if isinstance(data, (int, float)) and not isinstance(data, bool):
+        return {prefix: data}
+    return {}
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any]) -> List[str]:
+    """One line per metric present in both runs, with the relative change"""
+    before = flatten(baseline.get("results", {}))
+    after = flatten(current.get("results", {}))
+    lines = []
+    for key in sorted(before.keys() & after.keys()):
+        old, new = before[key], after[key]
+        change = f"{(new - old) / old * 100:+.1f}%" if old else "n/a"
+        lines.append(f"{key:<60} {old:>12g} {new:>12g} {change:>9}")
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--suites", default=",".join(SUITES),
+                        help=f"comma-separated subset of {', '.join(SUITES)}")
+    parser.add_argument("--sizes", default="1000,10000,100000", help="playlist and search index sizes")
+    parser.add_argument("--ops", type=int, default=1000, help="operations timed per playlist size")
+    parser.add_argument("--queries", type=int, default=200, help="queries timed per search index size")
+    parser.add_argument("--tracks", type=int, default=1000, help="playlist size for the api suite")
+    parser.add_argument("--pollers", default="1,10,50", help="concurrent clients for the api suite")
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds per api measurement")
+    parser.add_argument("--replica-workers", default="1,2,4", help="API worker counts for the replicas suite")
+    parser.add_argument("--ipc-calls", type=int, default=5000, help="calls timed per command in the ipc suite")
+    parser.add_argument("--uploads", type=int, default=200)
+    parser.add_argument("--upload-clients", type=int, default=8)
+    parser.add_argument("--downloads", type=int, default=30)
+    parser.add_argument("--download-seconds", type=float, default=0.5)
+    parser.add_argument("--startup-runs", type=int, default=3)
+    parser.add_argument("--quick", action="store_true", help="small sizes and short runs, for smoke checks")
+    parser.add_argument("--output", help="JSON file to write (default: benchmarks/results/<commit>-<time>.json)")
+    parser.add_argument("--compare", help="earlier results JSON to compare against")
+    args = parser.parse_args()
+
+    if args.quick:
+        args.sizes, args.ops, args.queries, args.tracks = "1000,10000", 200, 50, 200
+        args.pollers, args.duration = "1,10", 1.0
+        args.uploads, args.downloads, args.download_seconds = 40, 9, 0.2
+        args.ipc_calls = 500
+        args.replica_workers = "1,2"
+        args.startup_runs = 1
+    suites = [suite.strip() for suite in args.suites.split(",") if suite.strip()]
+    unknown = set(suites) - set(SUITES)
+    if unknown:
+        parser.error(f"unknown suites: {', '.join(sorted(unknown))}")
+
+    results: Dict[str, Any] = {}
+    with tempfile.TemporaryDirectory(prefix="music-bench-") as workdir:
+        for suite in suites:
+            print(f"running {suite}...", file=sys.stderr)
+            if suite == "playlist":
+                results[suite] = bench_playlist(workdir, [int(n) for n in args.sizes.split(",")], args.ops)
+            elif suite == "search":
+                results[suite] = bench_search(workdir, [int(n) for n in args.sizes.split(",")], args.queries)
+            elif suite == "fingerprint":
+                results[suite] = bench_fingerprint(workdir, [int(n) for n in args.sizes.split(",")], args.queries)
+            elif suite == "artwork":
+                results[suite] = bench_artwork(workdir, args.queries)
+            elif suite == "api":
+                results[suite] = bench_api(workdir, args.tracks, [int(n) for n in args.pollers.split(",")],
+                                           args.duration)
+            elif suite == "replicas":
+                results[suite] = bench_replicas(
+                    workdir, args.tracks, [int(n) for n in args.replica_workers.split(",")],
+                    int(args.pollers.split(",")[-1]), args.duration,
+                )
+            elif suite == "ipc":
+                results[suite] = bench_ipc(workdir, args.tracks, args.ipc_calls)
+            elif suite == "upload":
+                results[suite] = bench_upload(workdir, args.uploads, args.upload_clients)
+            elif suite == "download":
+                results[suite] = bench_download(workdir, args.downloads, args.download_seconds,
+                                                int(args.pollers.split(",")[-1]))
+            elif suite == "startup":
+                results[suite] = bench_startup(args.startup_runs)
+
+    report = {
+        **git_revision(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "params": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        "results": results,
+    }
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"{report['commit'] or 'unknown'}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(results, indent=2))
+    print(f"results written to {output}", file=sys.stderr)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(f"\ncompared with {baseline.get('commit')} ({baseline.get('timestamp')}):")
+        print("\n".join(compare(baseline, report)))
+
+
+if __name__ == "__main__":
+    main()
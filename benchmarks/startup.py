@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Startup benchmark: api_server import time and time to first response
+
+Every run happens in a fresh interpreter inside a scratch data directory
+(uploads, media, library.db...), so the numbers are cold-import numbers
+and the repository is left untouched. Results are printed as JSON.
+
+    python benchmarks/startup.py --runs 5
+    python benchmarks/startup.py --data-dir ~/music-data   # an existing library
+"""
+import argparse
+import json
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict
+
+from common import bench_env, free_port, spawn_server, summarize, wait_for
+
+IMPORT_SNIPPET = (
+    "import time; start = time.perf_counter(); import api_server; "
+    "print(time.perf_counter() - start)"
+)
+
+
+def measure_import(data_dir: str, fakes: bool = False) -> float:
+    """Seconds spent in `import api_server` in a fresh interpreter"""
+    result = subprocess.run(
+        [sys.executable, "-c", IMPORT_SNIPPET],
+        cwd=data_dir, env=bench_env(fakes), capture_output=True, text=True, check=True,
+    )
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def measure_server(data_dir: str, timeout: float, fakes: bool = False) -> Dict[str, float]:
+    """Seconds from spawning uvicorn to the first /health answer and to /ready"""
+    port = free_port()
+    base = f"http://127.0.0.1:{port}"
+    start = time.perf_counter()
+    proc = spawn_server(data_dir, port, fakes)
+    try:
+        deadline = start + timeout
+        wait_for(base + "/health", proc, deadline)
+        first_response = time.perf_counter() - start
+        wait_for(base + "/ready", proc, deadline)
+        ready = time.perf_counter() - start
+    finally:
+        proc.terminate()
+        proc.wait()
+    return {"first_response": first_response, "ready": ready}
+
+
+def run(runs: int = 5, data_dir: str = None, timeout: float = 60.0, fakes: bool = False) -> Dict:
+    """Repeated cold import and server start measurements"""
+    with tempfile.TemporaryDirectory() as scratch:
+        data_dir = data_dir or scratch
+        imports = [measure_import(data_dir, fakes) for _ in range(runs)]
+        servers = [measure_server(data_dir, timeout, fakes) for _ in range(runs)]
+    return {
+        "runs": runs,
+        "import_seconds": summarize(imports),
+        "first_response_seconds": summarize([server["first_response"] for server in servers]),
+        "ready_seconds": summarize([server["ready"] for server in servers]),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--data-dir", help="run against this data directory instead of an empty one")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--fakes", action="store_true", help="use the offline libVLC/yt-dlp fakes")
+    args = parser.parse_args()
+    result = run(args.runs, args.data_dir, args.timeout, args.fakes)
+    print(json.dumps({"python": sys.version.split()[0], **result}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,946 @@
+#!/usr/bin/env python3
+"""
+SQLite-backed persistence for the music player
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, astuple
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+DEFAULT_DB_PATH = "library.db"
+
+
+@dataclass
+class TrackMetadata:
+    """Probed metadata for a single audio file"""
+    path: str
+    mtime: float
+    size: int
+    title: str
+    duration: Optional[float] = None
+    codec: Optional[str] = None
+    bitrate: Optional[int] = None
+    artist: Optional[str] = None
+    album: Optional[str] = None
+    genre: Optional[str] = None
+    # Name of the cover in the artwork store (see artwork.py)
+    artwork: Optional[str] = None
+
+
+# Called with the entries stored and the paths dropped
+MetadataListener = Callable[[List[TrackMetadata], List[str]], None]
+
+_METADATA_COLUMNS = "path, mtime, size, title, duration, codec, bitrate, artist, album, genre, artwork"
+
+
+def file_signature(path: str) -> Optional[Tuple[float, int]]:
+    """Return (mtime, size) for a file, or None if it can't be read"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime, st.st_size
+
+
+class MetadataCache:
+    """Persistent track metadata cache keyed on path, mtime and size.
+
+    Every row is mirrored in memory so lookups never touch SQLite; the
+    database is only written when an entry is added or invalidated.
+    Listeners (e.g. the search index) are told about every change.
+
+    `generation` goes up with every change and is stored alongside the
+    rows, so every process reading the same database agrees on it; it
+    tells HTTP caches when metadata shown with a playlist has changed.
+
+    With read_through, peek() falls back to SQLite for paths it hasn't
+    mirrored, for processes (API replicas) that read rows another process
+    writes; refresh() reloads the mirror once the stored generation moves.
+    """
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH, read_through: bool = False):
+        self.db_path = db_path
+        self.read_through = read_through
+        self._lock = threading.Lock()
+        # Lookups by get(); counted without the lock, so only approximate
+        self.hits = 0
+        self.misses = 0
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS track_metadata (
+                path TEXT PRIMARY KEY,
+                mtime REAL NOT NULL,
+                size INTEGER NOT NULL,
+                title TEXT NOT NULL,
+                duration REAL,
+                codec TEXT,
+                bitrate INTEGER,
+                artist TEXT,
+                album TEXT,
+                genre TEXT,
+                artwork TEXT
+            )"""
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(track_metadata)")}
+        if "artist" not in columns:
+            # Rows from before tags were read are marked stale so the next
+            # lookup or scan probes them again
+            for column in ("artist", "album", "genre"):
+                self._conn.execute(f"ALTER TABLE track_metadata ADD COLUMN {column} TEXT")
+            self._conn.execute("UPDATE track_metadata SET mtime = -1")
+        if "artwork" not in columns:
+            # Likewise for rows probed before covers were extracted
+            self._conn.execute("ALTER TABLE track_metadata ADD COLUMN artwork TEXT")
+            self._conn.execute("UPDATE track_metadata SET mtime = -1")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS metadata_generation (generation INTEGER NOT NULL)"
+        )
+        self._conn.execute(
+            "INSERT INTO metadata_generation SELECT 0 "
+            "WHERE NOT EXISTS (SELECT 1 FROM metadata_generation)"
+        )
+        self._conn.commit()
+        self.generation = self._stored_generation()
+        self._entries = self._load_entries()
+        self._listeners: List[MetadataListener] = []
+
+    def _stored_generation(self) -> int:
+        return self._conn.execute("SELECT generation FROM metadata_generation").fetchone()[0]
+
+    def _load_entries(self) -> Dict[str, TrackMetadata]:
+        return {
+            row[0]: TrackMetadata(*row)
+            for row in self._conn.execute(f"SELECT {_METADATA_COLUMNS} FROM track_metadata")
+        }
+
+    def _bump_generation(self):
+        """Count a change, in the transaction that makes it (lock held)"""
+        self._conn.execute("UPDATE metadata_generation SET generation = generation + 1")
+        self.generation = self._stored_generation()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, path: str) -> Optional[TrackMetadata]:
+        """Return cached metadata if the file is unchanged since it was probed"""
+        entry = self._entries.get(path)
+        if entry is None:
+            self.misses += 1
+            return None
+        if file_signature(path) != (entry.mtime, entry.size):
+            self.invalidate(path)
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry
+
+    def peek(self, path: str) -> Optional[TrackMetadata]:
+        """Return cached metadata without checking the file on disk"""
+        entry = self._entries.get(path)
+        if entry is None and self.read_through:
+            with self._lock:
+                row = self._conn.execute(
+                    f"SELECT {_METADATA_COLUMNS} FROM track_metadata WHERE path = ?", (path,)
+                ).fetchone()
+            if row is not None:
+                entry = self._entries[path] = TrackMetadata(*row)
+        return entry
+
+    def refresh(self) -> bool:
+        """Reload the mirror if another process changed the table since
+
+        Listeners are told what changed. Returns whether anything did.
+        """
+        with self._lock:
+            generation = self._stored_generation()
+            if generation == self.generation:
+                return False
+            entries = self._load_entries()
+            previous, self._entries, self.generation = self._entries, entries, generation
+        stored = [meta for path, meta in entries.items() if previous.get(path) != meta]
+        dropped = [path for path in previous if path not in entries]
+        if stored or dropped:
+            self._notify(stored, dropped)
+        return True
+
+    def entries(self) -> List[TrackMetadata]:
+        """Every cached entry"""
+        return list(self._entries.values())
+
+    def subscribe(self, listener: MetadataListener):
+        """Call listener(stored, dropped) after every change"""
+        self._listeners.append(listener)
+
+    def _notify(self, stored: List[TrackMetadata], dropped: List[str]):
+        for listener in self._listeners:
+            listener(stored, dropped)
+
+    def put(self, meta: TrackMetadata):
+        """Store (or replace) the metadata for a file"""
+        self.put_many([meta])
+
+    def put_many(self, metas: List[TrackMetadata]):
+        """Store many entries in a single transaction"""
+        with self._lock:
+            for meta in metas:
+                self._entries[meta.path] = meta
+            self._conn.executemany(
+                f"INSERT OR REPLACE INTO track_metadata ({_METADATA_COLUMNS}) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [astuple(meta) for meta in metas],
+            )
+            self._bump_generation()
+            self._conn.commit()
+        self._notify(metas, [])
+
+    def paths_under(self, root: str) -> List[str]:
+        """Cached paths inside a directory"""
+        prefix = os.path.join(root, "")
+        return [path for path in list(self._entries) if path.startswith(prefix)]
+
+    def invalidate_many(self, paths: List[str]):
+        """Drop the cached metadata for many files in a single transaction"""
+        with self._lock:
+            removed = [(path,) for path in paths if self._entries.pop(path, None) is not None]
+            self._conn.executemany("DELETE FROM track_metadata WHERE path = ?", removed)
+            if removed:
+                self._bump_generation()
+            self._conn.commit()
+        if removed:
+            self._notify([], [path for path, in removed])
+
+    def invalidate(self, path: str):
+        """Drop the cached metadata for a file"""
+        self.invalidate_many([path])
+
+    def close(self):
+        """Close the underlying database connection"""
+        with self._lock:
+            self._conn.close()
+
+
+@dataclass
+class DownloadJob:
+    """A queued or finished URL download"""
+    id: str
+    url: str
+    status: str = "queued"
+    attempts: int = 0
+    error: Optional[str] = None
+    path: Optional[str] = None
+    created_at: float = 0.0
+    updated_at: float = 0.0
+
+
+class DownloadJobStore:
+    """Persistent download queue so pending jobs survive restarts"""
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS download_jobs (
+                id TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                path TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )"""
+        )
+        self._conn.commit()
+
+    def load(self) -> List[DownloadJob]:
+        """Return every stored job, oldest first"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, url, status, attempts, error, path, created_at, updated_at "
+                "FROM download_jobs ORDER BY created_at"
+            ).fetchall()
+        return [DownloadJob(*row) for row in rows]
+
+    def save(self, job: DownloadJob):
+        """Insert or update a job"""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO download_jobs "
+                "(id, url, status, attempts, error, path, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                astuple(job),
+            )
+            self._conn.commit()
+
+    def delete(self, job_id: str):
+        """Forget a job"""
+        with self._lock:
+            self._conn.execute("DELETE FROM download_jobs WHERE id = ?", (job_id,))
+            self._conn.commit()
+
+    def close(self):
+        """Close the underlying database connection"""
+        with self._lock:
+            self._conn.close()
+
+
+@dataclass
+class SavedUpload:
+    """A resumable upload session; its data so far is in its partial file"""
+    id: str
+    filename: str
+    size: int
+    created_at: float
+
+
+class UploadSessionStore:
+    """Resumable upload sessions, so a restart doesn't orphan their partial files
+
+    Only the session itself is stored; how much has been received is the
+    size of its partial file.
+    """
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS upload_sessions (
+                id TEXT PRIMARY KEY,
+                filename TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL
+            )"""
+        )
+        self._conn.commit()
+
+    def load(self) -> List[SavedUpload]:
+        """Every stored session, oldest first"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, filename, size, created_at FROM upload_sessions ORDER BY created_at"
+            ).fetchall()
+        return [SavedUpload(*row) for row in rows]
+
+    def save(self, upload: SavedUpload):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO upload_sessions (id, filename, size, created_at) VALUES (?, ?, ?, ?)",
+                astuple(upload),
+            )
+            self._conn.commit()
+
+    def delete(self, session_id: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM upload_sessions WHERE id = ?", (session_id,))
+            self._conn.commit()
+
+    def close(self):
+        """Close the underlying database connection"""
+        with self._lock:
+            self._conn.close()
+
+
+@dataclass
+class MediaObject:
+    """A file kept once in the content-addressed media store"""
+    sha256: str
+    path: str
+    size: int
+    name: str
+
+
+class MediaIndex:
+    """Persistent hash -> file index for the media store.
+
+    Rows are mirrored in memory by hash and by path so both lookups are O(1).
+    With read_through, misses fall back to SQLite (see MetadataCache).
+    """
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH, read_through: bool = False):
+        self.db_path = db_path
+        self.read_through = read_through
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS media_objects (
+                sha256 TEXT PRIMARY KEY,
+                path TEXT NOT NULL UNIQUE,
+                size INTEGER NOT NULL,
+                name TEXT NOT NULL
+            )"""
+        )
+        self._conn.commit()
+        self._by_hash: Dict[str, MediaObject] = {}
+        self._by_path: Dict[str, MediaObject] = {}
+        for row in self._conn.execute("SELECT sha256, path, size, name FROM media_objects"):
+            obj = MediaObject(*row)
+            self._by_hash[obj.sha256] = obj
+            self._by_path[obj.path] = obj
+
+    def __len__(self) -> int:
+        return len(self._by_hash)
+
+    def by_hash(self, sha256: str) -> Optional[MediaObject]:
+        obj = self._by_hash.get(sha256)
+        if obj is None and self.read_through:
+            obj = self._read("sha256", sha256)
+        return obj
+
+    def by_path(self, path: str) -> Optional[MediaObject]:
+        obj = self._by_path.get(path)
+        if obj is None and self.read_through:
+            obj = self._read("path", path)
+        return obj
+
+    def _read(self, column: str, value: str) -> Optional[MediaObject]:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT sha256, path, size, name FROM media_objects WHERE {column} = ?", (value,)
+            ).fetchone()
+        if row is None:
+            return None
+        obj = MediaObject(*row)
+        self._by_hash[obj.sha256] = obj
+        self._by_path[obj.path] = obj
+        return obj
+
+    def put(self, obj: MediaObject):
+        """Record a stored object"""
+        with self._lock:
+            self._by_hash[obj.sha256] = obj
+            self._by_path[obj.path] = obj
+            self._conn.execute(
+                "INSERT OR REPLACE INTO media_objects (sha256, path, size, name) VALUES (?, ?, ?, ?)",
+                astuple(obj),
+            )
+            self._conn.commit()
+
+    def remove(self, sha256: str):
+        """Forget a stored object"""
+        with self._lock:
+            obj = self._by_hash.pop(sha256, None)
+            if obj is not None:
+                self._by_path.pop(obj.path, None)
+                self._conn.execute("DELETE FROM media_objects WHERE sha256 = ?", (sha256,))
+                self._conn.commit()
+
+    def close(self):
+        """Close the underlying database connection"""
+        with self._lock:
+            self._conn.close()
+
+
+@dataclass
+class TrackAnalysis:
+    """Waveform and loudness computed from a track's decoded audio.
+
+    `peaks` and `rms` are int8 arrays (0-127 full scale) stored as bytes.
+    """
+    path: str
+    mtime: float
+    size: int
+    loudness: Optional[float]
+    peak: float
+    gain: Optional[float]
+    peaks: bytes
+    rms: bytes
+
+
+class AnalysisStore:
+    """Persistent waveform/loudness results keyed on path, mtime and size.
+
+    Only the gains are mirrored in memory, since they are read on every
+    track change; the waveform blobs stay in SQLite until asked for.
+    """
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS track_analysis (
+                path TEXT PRIMARY KEY,
+                mtime REAL NOT NULL,
+                size INTEGER NOT NULL,
+                loudness REAL,
+                peak REAL NOT NULL,
+                gain REAL,
+                peaks BLOB NOT NULL,
+                rms BLOB NOT NULL
+            )"""
+        )
+        self._conn.commit()
+        self._gains: Dict[str, Tuple[float, int, Optional[float]]] = {
+            row[0]: (row[1], row[2], row[3])
+            for row in self._conn.execute("SELECT path, mtime, size, gain FROM track_analysis")
+        }
+
+    def __len__(self) -> int:
+        return len(self._gains)
+
+    def is_current(self, path: str) -> bool:
+        """Whether the stored analysis matches the file on disk"""
+        entry = self._gains.get(path)
+        return entry is not None and file_signature(path) == entry[:2]
+
+    def gain(self, path: str) -> Optional[float]:
+        """Normalization gain in dB, without touching the file or the database"""
+        entry = self._gains.get(path)
+        return entry[2] if entry is not None else None
+
+    def get(self, path: str) -> Optional[TrackAnalysis]:
+        """Load the full analysis, including the waveform"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT path, mtime, size, loudness, peak, gain, peaks, rms "
+                "FROM track_analysis WHERE path = ?",
+                (path,),
+            ).fetchone()
+        return TrackAnalysis(*row) if row is not None else None
+
+    def put(self, analysis: TrackAnalysis):
+        """Store (or replace) the analysis for a file"""
+        with self._lock:
+            self._gains[analysis.path] = (analysis.mtime, analysis.size, analysis.gain)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO track_analysis "
+                "(path, mtime, size, loudness, peak, gain, peaks, rms) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                astuple(analysis),
+            )
+            self._conn.commit()
+
+    def close(self):
+        """Close the underlying database connection"""
+        with self._lock:
+            self._conn.close()
+
+
+@dataclass
+class TrackFingerprint:
+    """A track's acoustic fingerprint (see fingerprint.py).
+
+    `codes` is a little-endian uint32 array, one code per frame; `summary`
+    a little-endian float32 vector used for the LSH index.
+    """
+    path: str
+    mtime: float
+    size: int
+    duration: float
+    codes: bytes
+    summary: bytes
+
+
+class FingerprintStore:
+    """Persistent fingerprints keyed on path, mtime and size, and the
+    near-duplicate matches found when each was added.
+
+    Only file signatures are mirrored in memory; the index built over the
+    summaries lives in fingerprint.DuplicateIndex.
+    """
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS track_fingerprints (
+                path TEXT PRIMARY KEY,
+                mtime REAL NOT NULL,
+                size INTEGER NOT NULL,
+                duration REAL NOT NULL,
+                codes BLOB NOT NULL,
+                summary BLOB NOT NULL
+            )"""
+        )
+        # One row per pair, path_a < path_b
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS duplicate_matches (
+                path_a TEXT NOT NULL,
+                path_b TEXT NOT NULL,
+                similarity REAL NOT NULL,
+                PRIMARY KEY (path_a, path_b)
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS duplicate_matches_b ON duplicate_matches (path_b)")
+        self._conn.commit()
+        self._signatures: Dict[str, Tuple[float, int]] = {
+            row[0]: (row[1], row[2])
+            for row in self._conn.execute("SELECT path, mtime, size FROM track_fingerprints")
+        }
+
+    def __len__(self) -> int:
+        return len(self._signatures)
+
+    def is_current(self, path: str) -> bool:
+        """Whether the stored fingerprint matches the file on disk"""
+        entry = self._signatures.get(path)
+        return entry is not None and file_signature(path) == entry
+
+    def get(self, path: str) -> Optional[TrackFingerprint]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT path, mtime, size, duration, codes, summary FROM track_fingerprints WHERE path = ?",
+                (path,),
+            ).fetchone()
+        return TrackFingerprint(*row) if row is not None else None
+
+    def summaries(self) -> List[Tuple[str, bytes]]:
+        """(path, summary) of every fingerprint long enough to match"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT path, summary FROM track_fingerprints WHERE length(codes) > 0"
+            ).fetchall()
+
+    def codes(self, paths: List[str]) -> Dict[str, bytes]:
+        """The stored codes of several fingerprints, in one query"""
+        if not paths:
+            return {}
+        with self._lock:
+            return dict(self._conn.execute(
+                f"SELECT path, codes FROM track_fingerprints WHERE path IN ({', '.join('?' for _ in paths)})",
+                paths,
+            ).fetchall())
+
+    def put(self, fingerprint: TrackFingerprint):
+        """Store (or replace) a fingerprint, forgetting the matches recorded for the old one"""
+        path = fingerprint.path
+        with self._lock:
+            self._signatures[path] = (fingerprint.mtime, fingerprint.size)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO track_fingerprints (path, mtime, size, duration, codes, summary) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                astuple(fingerprint),
+            )
+            self._conn.execute("DELETE FROM duplicate_matches WHERE path_a = ? OR path_b = ?", (path, path))
+            self._conn.commit()
+
+    def add_matches(self, path: str, matches: List[Tuple[str, float]]):
+        """Record the tracks a stored fingerprint nearly duplicates"""
+        if not matches:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO duplicate_matches (path_a, path_b, similarity) VALUES (?, ?, ?)",
+                [(min(path, other), max(path, other), score) for other, score in matches],
+            )
+            self._conn.commit()
+
+    def matches(self, min_similarity: float = 0.0) -> List[Tuple[str, str, float]]:
+        """Every recorded (path_a, path_b, similarity) pair, most similar first"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT path_a, path_b, similarity FROM duplicate_matches WHERE similarity >= ? "
+                "ORDER BY similarity DESC",
+                (min_similarity,),
+            ).fetchall()
+
+    def close(self):
+        """Close the underlying database connection"""
+        with self._lock:
+            self._conn.close()
+
+
+# Journaled edits a playlist may accumulate before it is folded into a new
+# snapshot; replaying this many on startup takes a few milliseconds
+COMPACT_AFTER = 5000
+
+# (op, track_id, path, position); see playlist.PlaylistEdit
+Edit = Tuple[str, Optional[int], Optional[str], Optional[int]]
+
+
+@dataclass
+class StoredPlaylist:
+    """A playlist's last snapshot and the edits journaled since"""
+    name: str
+    items: List[Tuple[int, str]]
+    edits: List[Edit]
+    next_id: int
+    version: int
+
+
+@dataclass
+class SavedPlayer:
+    """A zone's playlist, current track, position and settings at its last checkpoint"""
+    zone: str
+    playlist: str
+    current_id: Optional[int]
+    position_ms: int
+    settings: Dict[str, Any]
+
+
+class PlaylistStore:
+    """Named playlists and per-zone player state that survive restarts.
+
+    A playlist is stored as a snapshot plus an append-only journal of the
+    edits made since, so an edit costs one small insert however long the
+    playlist is; compact() folds the journal into a fresh snapshot. The
+    database runs in WAL mode with synchronous=NORMAL: commits append to
+    the WAL without an fsync and SQLite syncs at its WAL checkpoints, so a
+    crash may lose the last moments of edits but never tears a playlist.
+    """
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            """CREATE TABLE IF NOT EXISTS playlists (
+                name TEXT PRIMARY KEY,
+                length INTEGER NOT NULL DEFAULT 0,
+                next_id INTEGER NOT NULL DEFAULT 0,
+                version INTEGER NOT NULL DEFAULT 0,
+                updated_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS playlist_tracks (
+                playlist TEXT NOT NULL,
+                position INTEGER NOT NULL,
+                track_id INTEGER NOT NULL,
+                path TEXT NOT NULL,
+                PRIMARY KEY (playlist, position)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS playlist_journal (
+                seq INTEGER PRIMARY KEY,
+                playlist TEXT NOT NULL,
+                op TEXT NOT NULL,
+                track_id INTEGER,
+                path TEXT,
+                position INTEGER
+            );
+            CREATE INDEX IF NOT EXISTS playlist_journal_by_playlist
+                ON playlist_journal (playlist, seq);
+            CREATE TABLE IF NOT EXISTS player_state (
+                zone TEXT PRIMARY KEY,
+                playlist TEXT NOT NULL,
+                current_id INTEGER,
+                position_ms INTEGER NOT NULL DEFAULT 0,
+                settings TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            );"""
+        )
+        self._conn.commit()
+        self._journal_lengths: Dict[str, int] = dict(
+            self._conn.execute("SELECT playlist, COUNT(*) FROM playlist_journal GROUP BY playlist")
+        )
+
+    def names(self) -> List[Dict[str, Any]]:
+        """Every playlist with its length and the zones playing it"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT name, length, updated_at FROM playlists ORDER BY name"
+            ).fetchall()
+            zones = self._conn.execute("SELECT zone, playlist FROM player_state").fetchall()
+        return [
+            {
+                "name": name,
+                "tracks": length,
+                "updated_at": updated_at,
+                "zones": [zone for zone, playlist in zones if playlist == name],
+            }
+            for name, length, updated_at in rows
+        ]
+
+    def exists(self, name: str) -> bool:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT 1 FROM playlists WHERE name = ?", (name,)
+            ).fetchone() is not None
+
+    def version(self, name: str) -> Optional[int]:
+        """A playlist's version as of its last edit, or None if it doesn't exist"""
+        with self._lock:
+            row = self._conn.execute("SELECT version FROM playlists WHERE name = ?", (name,)).fetchone()
+        return row[0] if row is not None else None
+
+    def load(self, name: str) -> Optional[StoredPlaylist]:
+        """A playlist's snapshot and journal, or None if it doesn't exist"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT next_id, version FROM playlists WHERE name = ?", (name,)
+            ).fetchone()
+            if row is None:
+                return None
+            items = self._conn.execute(
+                "SELECT track_id, path FROM playlist_tracks WHERE playlist = ? ORDER BY position",
+                (name,),
+            ).fetchall()
+            edits = self._conn.execute(
+                "SELECT op, track_id, path, position FROM playlist_journal "
+                "WHERE playlist = ? ORDER BY seq",
+                (name,),
+            ).fetchall()
+        return StoredPlaylist(name, items, edits, row[0], row[1])
+
+    def record(self, name: str, edits: List[Edit], length: int, next_id: int, version: int):
+        """Append edits to a playlist's journal, creating the playlist if needed"""
+        with self._lock:
+            self._conn.executemany(
+                "INSERT INTO playlist_journal (playlist, op, track_id, path, position) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [(name, *edit) for edit in edits],
+            )
+            self._upsert(name, length, next_id, version)
+            self._conn.commit()
+            self._journal_lengths[name] = self._journal_lengths.get(name, 0) + len(edits)
+
+    def journal_length(self, name: str) -> int:
+        return self._journal_lengths.get(name, 0)
+
+    def write(self, name: str, items: List[Tuple[int, str]], next_id: int, version: int):
+        """Replace a playlist with a snapshot of items and drop its journal"""
+        with self._lock:
+            self._conn.execute("DELETE FROM playlist_tracks WHERE playlist = ?", (name,))
+            self._conn.execute("DELETE FROM playlist_journal WHERE playlist = ?", (name,))
+            self._conn.executemany(
+                "INSERT INTO playlist_tracks (playlist, position, track_id, path) VALUES (?, ?, ?, ?)",
+                [(name, position, track_id, path) for position, (track_id, path) in enumerate(items)],
+            )
+            self._upsert(name, len(items), next_id, version)
+            self._conn.commit()
+            self._journal_lengths.pop(name, None)
+
+    def _upsert(self, name: str, length: int, next_id: int, version: int):
+        self._conn.execute(
+            "INSERT INTO playlists (name, length, next_id, version, updated_at) "
+            "VALUES (?, ?, ?, ?, ?) ON CONFLICT (name) DO UPDATE SET "
+            "length = excluded.length, next_id = excluded.next_id, "
+            "version = excluded.version, updated_at = excluded.updated_at",
+            (name, length, next_id, version, time.time()),
+        )
+
+    def delete(self, name: str) -> bool:
+        """Delete a playlist; returns False if it didn't exist"""
+        with self._lock:
+            deleted = self._conn.execute("DELETE FROM playlists WHERE name = ?", (name,)).rowcount
+            self._conn.execute("DELETE FROM playlist_tracks WHERE playlist = ?", (name,))
+            self._conn.execute("DELETE FROM playlist_journal WHERE playlist = ?", (name,))
+            self._conn.commit()
+            self._journal_lengths.pop(name, None)
+        return bool(deleted)
+
+    def zones_using(self, name: str) -> List[str]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT zone FROM player_state WHERE playlist = ?", (name,)
+            ).fetchall()
+        return [zone for zone, in rows]
+
+    def zones(self) -> List[str]:
+        """Every zone with saved state"""
+        with self._lock:
+            return [zone for zone, in self._conn.execute("SELECT zone FROM player_state")]
+
+    def save_player(self, saved: SavedPlayer):
+        """Checkpoint a zone's player state (no fsync; see the class docstring)"""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO player_state "
+                "(zone, playlist, current_id, position_ms, settings, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (saved.zone, saved.playlist, saved.current_id, saved.position_ms,
+                 json.dumps(saved.settings), time.time()),
+            )
+            self._conn.commit()
+
+    def load_player(self, zone: str) -> Optional[SavedPlayer]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT zone, playlist, current_id, position_ms, settings FROM player_state WHERE zone = ?",
+                (zone,),
+            ).fetchone()
+        if row is None:
+            return None
+        return SavedPlayer(row[0], row[1], row[2], row[3], json.loads(row[4]))
+
+    def delete_player(self, zone: str) -> bool:
+        """Forget a zone's saved state; returns False if there was none"""
+        with self._lock:
+            deleted = self._conn.execute("DELETE FROM player_state WHERE zone = ?", (zone,)).rowcount
+            self._conn.commit()
+        return bool(deleted)
+
+    def close(self):
+        """Close the underlying database connection"""
+        with self._lock:
+            self._conn.close()
+
+
+@dataclass
+class PublishedStatus:
+    """A zone's live player state as last published by the player owner"""
+    zone: str
+    playlist: str
+    # PlayerStatus and PlaybackSettings fields
+    status: Dict[str, Any]
+    settings: Dict[str, Any]
+    # Wall-clock time, so readers in other processes can extrapolate the position
+    published_at: float
+
+
+class StatusBoard:
+    """Live player state shared between processes.
+
+    The process that owns the players publishes each zone's status here
+    whenever it changes, and API replicas serve reads from it. Rows are
+    tiny and rewritten often, so commits don't wait for an fsync; losing
+    the last update in a crash doesn't matter, as the owner republishes
+    on start. That is synchronous=NORMAL, which in WAL mode only syncs at
+    checkpoints; OFF would also skip those, and the checkpoints cover the
+    whole shared library database, not just these rows.
+    """
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS zone_status (
+                zone TEXT PRIMARY KEY,
+                playlist TEXT NOT NULL,
+                status TEXT NOT NULL,
+                settings TEXT NOT NULL,
+                published_at REAL NOT NULL
+            )"""
+        )
+        self._conn.commit()
+
+    def publish(self, published: PublishedStatus):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO zone_status (zone, playlist, status, settings, published_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (published.zone, published.playlist, json.dumps(published.status),
+                 json.dumps(published.settings), published.published_at),
+            )
+            self._conn.commit()
+
+    def read(self, zone: str, since: Optional[float] = None) -> Optional[PublishedStatus]:
+        """A zone's published state; None if there is none, or none newer than since"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT playlist, status, settings, published_at FROM zone_status "
+                "WHERE zone = ? AND published_at > ?",
+                (zone, since if since is not None else float("-inf")),
+            ).fetchone()
+        if row is None:
+            return None
+        return PublishedStatus(zone, row[0], json.loads(row[1]), json.loads(row[2]), row[3])
+
+    def remove(self, zone: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM zone_status WHERE zone = ?", (zone,))
+            self._conn.commit()
+
+    def close(self):
+        """Close the underlying database connection"""
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,366 @@
+#!/usr/bin/env python3
+"""
+Download job subsystem: a persistent, bounded-parallelism yt-dlp queue
+"""
+import asyncio
+import os
+import time
+import uuid
+from dataclasses import asdict, dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from database import DownloadJob, DownloadJobStore
+from metrics import timed
+from workers import WorkerPool
+
+OUTPUT_DIR = "downloads"
+
+# What happens to the downloaded stream: kept as served ("passthrough"),
+# copied into an audio-only container without re-encoding ("remux"), or
+# re-encoded to `codec` at `bitrate` ("transcode")
+DOWNLOAD_MODES = ("passthrough", "remux", "transcode")
+TRANSCODE_CODECS = ("mp3", "aac", "m4a", "opus", "vorbis", "flac", "wav")
+
+# Statuses a job can be in; the first group is picked up again on restart
+PENDING_STATUSES = ("queued", "running", "retrying")
+FINAL_STATUSES = ("done", "failed", "cancelled")
+
+
+class DownloadCancelled(Exception):
+    """Raised from the progress hook to abort a cancelled download"""
+
+
+@dataclass
+class DownloadProgress:
+    """Live progress reported by yt-dlp progress hooks"""
+    downloaded_bytes: int = 0
+    total_bytes: Optional[int] = None
+    speed: Optional[float] = None
+    eta: Optional[int] = None
+    cancel_requested: bool = False
+    # Set once the file is being added to the library; too late to cancel then
+    finishing: bool = False
+
+    @property
+    def percent(self) -> Optional[float]:
+        if not self.total_bytes:
+            return None
+        return min(100.0, self.downloaded_bytes * 100.0 / self.total_bytes)
+
+
+@dataclass(frozen=True)
+class DownloadPolicy:
+    """How a download's audio is selected and post-processed.
+
+    libVLC plays the Opus, Vorbis and AAC streams sites serve as-is, so by
+    default the best audio-only stream is just moved into a matching audio
+    container (.opus, .m4a, ...) with a stream copy. Only "transcode"
+    decodes and re-encodes, which costs more CPU than the download itself.
+    """
+    mode: str = "remux"
+    # yt-dlp format selector; the default prefers audio-only streams
+    format: str = "bestaudio/best"
+    codec: str = "mp3"
+    bitrate: int = 192
+
+    def __post_init__(self):
+        if self.mode not in DOWNLOAD_MODES:
+            raise ValueError(f"Unknown download mode: {self.mode}")
+        if self.codec not in TRANSCODE_CODECS:
+            raise ValueError(f"Unknown download codec: {self.codec}")
+
+    @classmethod
+    def from_env(cls) -> "DownloadPolicy":
+        """The policy set through MUSIC_PLAYER_DOWNLOAD_* environment variables"""
+        default = cls()
+        return cls(
+            mode=os.environ.get("MUSIC_PLAYER_DOWNLOAD_MODE", default.mode),
+            format=os.environ.get("MUSIC_PLAYER_DOWNLOAD_FORMAT", default.format),
+            codec=os.environ.get("MUSIC_PLAYER_DOWNLOAD_CODEC", default.codec),
+            bitrate=int(os.environ.get("MUSIC_PLAYER_DOWNLOAD_BITRATE", default.bitrate)),
+        )
+
+    def postprocessors(self) -> List[Dict[str, Any]]:
+        if self.mode == "passthrough":
+            return []
+        if self.mode == "remux":
+            # "best" makes FFmpegExtractAudio copy the stream whenever its
+            # codec has an audio container, and only encode otherwise
+            return [{'key': 'FFmpegExtractAudio', 'preferredcodec': 'best'}]
+        return [{
+            'key': 'FFmpegExtractAudio',
+            'preferredcodec': self.codec,
+            'preferredquality': str(self.bitrate),
+        }]
+
+
+def downloaded_path(info: Dict[str, Any]) -> Optional[str]:
+    """Final path of a download as reported by yt-dlp, after post-processing"""
+    for download in info.get('requested_downloads') or ():
+        path = download.get('filepath')
+        if path:
+            return path
+    return info.get('filepath')
+
+
+def downloaded_thumbnail(info: Dict[str, Any]) -> Optional[str]:
+    """Path of the thumbnail yt-dlp wrote for a download, if any"""
+    for thumbnail in reversed(info.get('thumbnails') or ()):
+        path = thumbnail.get('filepath')
+        if path and os.path.exists(path):
+            return path
+    return None
+
+
+@dataclass
+class DownloadedFile:
+    path: str
+    # The video's thumbnail, saved next to the audio; the caller removes it
+    thumbnail: Optional[str] = None
+
+    def discard(self):
+        """Delete the files of a download nobody wants any more"""
+        for path in (self.path, self.thumbnail):
+            if path is not None and os.path.exists(path):
+                os.remove(path)
+
+
+def download_file(url: str, output_dir: str = OUTPUT_DIR,
+                  progress_hook: Optional[Callable[[Dict[str, Any]], None]] = None,
+                  policy: Optional[DownloadPolicy] = None,
+                  thumbnail: bool = False) -> Optional[DownloadedFile]:
+    """Blocking yt-dlp download, optionally with the thumbnail (used as cover art)"""
+    import yt_dlp
+
+    policy = policy or DownloadPolicy()
+    os.makedirs(output_dir, exist_ok=True)
+
+    ydl_opts = {
+        'format': policy.format,
+        'outtmpl': os.path.join(output_dir, '%(title)s.%(ext)s'),
+        'postprocessors': policy.postprocessors(),
+        'writethumbnail': thumbnail,
+        'noplaylist': True,
+        'quiet': True,
+    }
+    if progress_hook is not None:
+        ydl_opts['progress_hooks'] = [progress_hook]
+
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        info = ydl.extract_info(url, download=True) or {}
+    path = downloaded_path(info)
+    thumbnail_path = downloaded_thumbnail(info) if thumbnail else None
+    if path is None or not os.path.exists(path):
+        if thumbnail_path is not None:
+            os.remove(thumbnail_path)
+        return None
+    return DownloadedFile(path, thumbnail_path)
+
+
+def download_audio(url: str, output_dir: str = OUTPUT_DIR,
+                   progress_hook: Optional[Callable[[Dict[str, Any]], None]] = None,
+                   policy: Optional[DownloadPolicy] = None) -> Optional[str]:
+    """Blocking yt-dlp download; returns the path of the downloaded file"""
+    downloaded = download_file(url, output_dir, progress_hook, policy)
+    return downloaded.path if downloaded is not None else None
+
+
+def expand_playlist(url: str) -> List[str]:
+    """Return the entry URLs of a playlist URL, or [url] for a single item"""
+    import yt_dlp
+
+    ydl_opts = {
+        'extract_flat': 'in_playlist',
+        'noplaylist': False,
+        'quiet': True,
+    }
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        info = ydl.extract_info(url, download=False)
+
+    entries = info.get('entries') if info else None
+    if not entries:
+        return [url]
+    urls = []
+    for entry in entries:
+        if not entry:
+            continue
+        entry_url = entry.get('webpage_url') or entry.get('url')
+        if entry_url:
+            urls.append(entry_url)
+    return urls
+
+
+class DownloadManager:
+    """Runs download jobs from a persistent queue with retry and backoff.
+
+    A fixed number of runner coroutines pull job ids off an asyncio queue
+    and hand the blocking yt-dlp call to the download worker pool, so at
+    most `max_parallel` downloads are in flight at once. on_complete gets
+    the downloaded file and its thumbnail, if yt-dlp saved one, and returns
+    the path the file was stored at, which is what the job records.
+    """
+
+    def __init__(self, pool: WorkerPool, store: DownloadJobStore,
+                 on_complete: Callable[[str, Optional[str]], Awaitable[str]],
+                 on_update: Optional[Callable[[DownloadJob], None]] = None,
+                 max_parallel: Optional[int] = None,
+                 max_attempts: int = 3, backoff: float = 2.0,
+                 policy: Optional[DownloadPolicy] = None):
+        self.pool = pool
+        self.store = store
+        self.on_complete = on_complete
+        self.on_update = on_update
+        self.max_parallel = max_parallel or pool.max_workers
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.policy = policy or DownloadPolicy()
+        self.jobs: Dict[str, DownloadJob] = {}
+        self.progress: Dict[str, DownloadProgress] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._runners: List[asyncio.Task] = []
+
+    async def start(self):
+        """Load persisted jobs and start the runners"""
+        self._queue = asyncio.Queue()
+        for job in self.store.load():
+            self.jobs[job.id] = job
+            self.progress[job.id] = DownloadProgress()
+            if job.status in PENDING_STATUSES:
+                # Interrupted by a restart: run it again from scratch
+                self._set_status(job, "queued")
+                self._queue.put_nowait(job.id)
+        self._runners = [asyncio.create_task(self._runner()) for _ in range(self.max_parallel)]
+
+    async def stop(self):
+        """Cancel the runners; unfinished jobs stay queued in the store"""
+        for runner in self._runners:
+            runner.cancel()
+        for progress in self.progress.values():
+            progress.cancel_requested = True
+        await asyncio.gather(*self._runners, return_exceptions=True)
+        self._runners = []
+
+    def submit(self, url: str) -> DownloadJob:
+        """Queue a URL for download"""
+        now = time.time()
+        job = DownloadJob(id=uuid.uuid4().hex, url=url, created_at=now, updated_at=now)
+        self.jobs[job.id] = job
+        self.progress[job.id] = DownloadProgress()
+        self.store.save(job)
+        self._queue.put_nowait(job.id)
+        self._notify(job)
+        return job
+
+    async def submit_batch(self, urls: List[str], expand_playlists: bool = True) -> List[DownloadJob]:
+        """Queue several URLs, expanding playlists into one job per entry"""
+        jobs = []
+        for url in urls:
+            entries = [url]
+            if expand_playlists:
+                entries = await self.pool.run(expand_playlist, url)
+            jobs.extend(self.submit(entry) for entry in entries)
+        return jobs
+
+    def get(self, job_id: str) -> Optional[DownloadJob]:
+        return self.jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> bool:
+        """Cancel a queued or running job; returns False if it already finished
+
+        A job whose file is already being added to the library can't be
+        cancelled any more either.
+        """
+        job = self.jobs.get(job_id)
+        if job is None or job.status in FINAL_STATUSES or self.progress[job_id].finishing:
+            return False
+        self.progress[job_id].cancel_requested = True
+        if job.status != "running":
+            self._set_status(job, "cancelled")
+        return True
+
+    def retry(self, job_id: str) -> bool:
+        """Re-queue a failed or cancelled job"""
+        job = self.jobs.get(job_id)
+        if job is None or job.status not in ("failed", "cancelled"):
+            return False
+        job.attempts = 0
+        job.error = None
+        self.progress[job_id] = DownloadProgress()
+        self._set_status(job, "queued")
+        self._queue.put_nowait(job_id)
+        return True
+
+    def describe(self, job: DownloadJob) -> Dict[str, Any]:
+        """Job fields merged with its live progress"""
+        progress = self.progress.get(job.id) or DownloadProgress()
+        return {
+            **asdict(job),
+            "downloaded_bytes": progress.downloaded_bytes,
+            "total_bytes": progress.total_bytes,
+            "percent": progress.percent,
+            "speed": progress.speed,
+            "eta": progress.eta,
+        }
+
+    async def _runner(self):
+        while True:
+            job_id = await self._queue.get()
+            job = self.jobs.get(job_id)
+            if job is None or job.status != "queued":
+                continue
+            await self._run(job)
+
+    async def _run(self, job: DownloadJob):
+        progress = self.progress[job.id]
+
+        def hook(d: Dict[str, Any]):
+            if progress.cancel_requested:
+                raise DownloadCancelled()
+            if d.get('status') == 'downloading':
+                progress.downloaded_bytes = d.get('downloaded_bytes') or 0
+                progress.total_bytes = d.get('total_bytes') or d.get('total_bytes_estimate')
+                progress.speed = d.get('speed')
+                progress.eta = d.get('eta')
+
+        while True:
+            job.attempts += 1
+            self._set_status(job, "running")
+            try:
+                with timed("download"):
+                    downloaded = await self.pool.run(download_file, job.url, OUTPUT_DIR, hook, self.policy, True)
+                if downloaded is None:
+                    raise FileNotFoundError("Downloaded file not found")
+                # A cancel that came after the last progress hook, e.g.
+                # while ffmpeg post-processed
+                if progress.cancel_requested:
+                    await self.pool.run(downloaded.discard)
+                    self._set_status(job, "cancelled")
+                    return
+                progress.finishing = True
+                job.path = await self.on_complete(downloaded.path, downloaded.thumbnail)
+                self._set_status(job, "done")
+                return
+            except Exception as e:
+                progress.finishing = False
+                if progress.cancel_requested:
+                    self._set_status(job, "cancelled")
+                    return
+                job.error = str(e)
+                if isinstance(e, ImportError) or job.attempts >= self.max_attempts:
+                    self._set_status(job, "failed")
+                    return
+                self._set_status(job, "retrying")
+                await asyncio.sleep(self.backoff * 2 ** (job.attempts - 1))
+                if progress.cancel_requested:
+                    self._set_status(job, "cancelled")
+                    return
+
+    def _set_status(self, job: DownloadJob, status: str):
+        job.status = status
+        job.updated_at = time.time()
+        self.store.save(job)
+        self._notify(job)
+
+    def _notify(self, job: DownloadJob):
+        if self.on_update is not None:
+            self.on_update(job)
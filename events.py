@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Playback event bus: fans player events out to WebSocket subscribers
+"""
+import asyncio
+import threading
+import time
+from typing import Any, Dict, Optional, Set
+
+# Events a slow subscriber may buffer before the oldest ones are dropped
+MAX_PENDING_EVENTS = 256
+
+
+class Subscription:
+    """A single client's view of the event stream"""
+
+    def __init__(self, tick_interval: Optional[float] = None):
+        self.tick_interval = tick_interval
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=MAX_PENDING_EVENTS)
+        self._last_tick = 0.0
+
+    def offer(self, event: Dict[str, Any]):
+        """Queue an event, throttling position ticks to the requested rate"""
+        if event["type"] == "position":
+            if self.tick_interval is None:
+                return
+            now = time.monotonic()
+            if now - self._last_tick < self.tick_interval:
+                return
+            self._last_tick = now
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(event)
+
+    async def get(self) -> Dict[str, Any]:
+        """Wait for the next event"""
+        return await self.queue.get()
+
+
+class EventBus:
+    """Thread-safe publisher for player events.
+
+    libVLC invokes its callbacks on its own threads, so publish() hands
+    events over to the asyncio loop the subscribers live on.
+    """
+
+    def __init__(self):
+        self._subscribers: Set[Subscription] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()
+
+    def subscribe(self, tick_interval: Optional[float] = None) -> Subscription:
+        """Register a subscriber; must be called from the event loop"""
+        sub = Subscription(tick_interval)
+        with self._lock:
+            self._loop = asyncio.get_running_loop()
+            self._subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscription):
+        """Remove a subscriber"""
+        with self._lock:
+            self._subscribers.discard(sub)
+
+    def has_subscribers(self) -> bool:
+        with self._lock:
+            return bool(self._subscribers)
+
+    def publish(self, event_type: str, **data):
+        """Publish an event from any thread"""
+        with self._lock:
+            loop = self._loop
+            if loop is None or not self._subscribers or loop.is_closed():
+                return
+        event = {"type": event_type, **data}
+        try:
+            loop.call_soon_threadsafe(self._dispatch, event)
+        except RuntimeError:
+            # Loop shut down between the check and the call
+            pass
+
+    def _dispatch(self, event: Dict[str, Any]):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for sub in subscribers:
+            sub.offer(event)
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""
+Acoustic fingerprints of decoded audio and an LSH index for near-duplicates
+
+A fingerprint is one 24-bit code per ~170 ms frame, built from how the
+energy of the 12 pitch classes (chroma) compares within the frame. Chroma
+survives re-encoding, bitrate changes and gain, so two encodings of a
+song give nearly the same codes while different songs disagree on about
+half the bits. Each track also gets a short summary vector (its chroma
+profile and how it moves over time); random-hyperplane LSH over the
+summaries finds the few tracks worth comparing code by code.
+"""
+import os
+import threading
+from collections import Counter
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from analysis import SAMPLE_RATE, decode
+from database import FingerprintStore, TrackFingerprint, file_signature
+
+# Frames of ~341 ms stepping by half that
+FRAME = 16384
+HOP = FRAME // 2
+MIN_FREQ = 80.0
+MAX_FREQ = 5000.0
+# Frames averaged before coding, so a note's attack doesn't flip bits
+SMOOTH = 3
+# Frames quieter than this share of the median frame are left out
+SILENCE_RATIO = 1e-3
+# Codes compare each pitch class with the ones this many semitones up
+CODE_SHIFTS = (1, 5)
+CODE_BITS = 12 * len(CODE_SHIFTS)
+# Shortest fingerprint worth indexing (about 5 s of sound)
+MIN_FRAMES = 30
+
+# Lag, in frames, of the chroma transitions in the summary vector
+SUMMARY_LAG = 4
+SUMMARY_SIZE = 12 + 12 * 12
+# LSH: BANDS hash tables, each keyed on BAND_BITS hyperplane signs. A
+# track is a candidate when it shares MIN_BANDS of them: one shared band
+# also catches a fixed share (~0.7%) of unrelated tracks, so candidates
+# grew with the library, while two are rare by chance (~4e-5 of them)
+# and a re-encode still shares several
+BANDS = 16
+BAND_BITS = 16
+MIN_BANDS = 2
+# Fixed so the hyperplanes are the same in every process and run
+LSH_SEED = 20240601
+
+# Frames two fingerprints may be shifted by (about 4 s), e.g. for a longer
+# silence at the start of one encoding
+MAX_OFFSET = 24
+# The compared stretch must cover this share of the longer fingerprint
+MIN_COVERAGE = 0.8
+# Share of matching bits from which two tracks count as the same recording
+MATCH_THRESHOLD = 0.85
+
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def _chroma_matrix() -> Tuple[slice, np.ndarray]:
+    """The rfft bins from MIN_FREQ to MAX_FREQ and a (bins, 12) map from their power to pitch classes"""
+    freqs = np.fft.rfftfreq(FRAME, 1.0 / SAMPLE_RATE)
+    used = np.flatnonzero((freqs >= MIN_FREQ) & (freqs <= MAX_FREQ))
+    pitch = np.round(12 * np.log2(freqs[used] / 440.0) + 69).astype(int) % 12
+    matrix = np.zeros((len(used), 12), dtype=np.float32)
+    matrix[np.arange(len(used)), pitch] = 1.0
+    return slice(used[0], used[-1] + 1), matrix
+
+
+_BINS, _CHROMA = _chroma_matrix()
+_WINDOW = np.hanning(FRAME).astype(np.float32)
+
+
+class Fingerprinter:
+    """Builds a fingerprint from decoded (frames, 2) blocks fed in order
+
+    Fed the blocks analysis.decode() yields, so one decode can serve both
+    the waveform analysis and the fingerprint.
+    """
+
+    def __init__(self):
+        self._pending = np.empty(0, dtype=np.float32)
+        self._chroma: List[np.ndarray] = []
+        self.frames = 0
+
+    def feed(self, samples: np.ndarray):
+        mono = samples.mean(axis=1, dtype=np.float32)
+        self.frames += len(samples)
+        buffer = np.concatenate((self._pending, mono)) if len(self._pending) else mono
+        count = (len(buffer) - FRAME) // HOP + 1 if len(buffer) >= FRAME else 0
+        if count:
+            frames = np.lib.stride_tricks.sliding_window_view(buffer, FRAME)[::HOP][:count]
+            power = np.square(np.abs(np.fft.rfft(frames * _WINDOW, axis=1)[:, _BINS]))
+            self._chroma.append(power @ _CHROMA)
+        self._pending = buffer[count * HOP:].copy()
+
+    def finish(self) -> Tuple[np.ndarray, np.ndarray]:
+        """(codes, summary); codes is empty for audio too short or silent to match"""
+        if not self._chroma:
+            return np.empty(0, dtype=np.uint32), np.zeros(SUMMARY_SIZE, dtype=np.float32)
+        chroma = np.concatenate(self._chroma).astype(np.float64)
+        energy = chroma.sum(axis=1)
+        loud = energy > max(np.median(energy) * SILENCE_RATIO, 1e-12)
+        chroma = chroma[loud] / energy[loud, None]
+        if len(chroma) < max(MIN_FRAMES, SMOOTH):
+            return np.empty(0, dtype=np.uint32), np.zeros(SUMMARY_SIZE, dtype=np.float32)
+        cumulative = np.concatenate((np.zeros((1, 12)), np.cumsum(chroma, axis=0)))
+        smooth = (cumulative[SMOOTH:] - cumulative[:-SMOOTH]) / SMOOTH
+        return encode(smooth), summarize(chroma)
+
+    @property
+    def duration(self) -> float:
+        return self.frames / SAMPLE_RATE
+
+
+def encode(chroma: np.ndarray) -> np.ndarray:
+    """One code per frame: bit 12*k + i says pitch class i outweighs i + CODE_SHIFTS[k]"""
+    codes = np.zeros(len(chroma), dtype=np.uint32)
+    bit = 0
+    for shift in CODE_SHIFTS:
+        greater = chroma > np.roll(chroma, -shift, axis=1)
+        for pitch in range(12):
+            codes |= greater[:, pitch].astype(np.uint32) << np.uint32(bit)
+            bit += 1
+    return codes
+
+
+def summarize(chroma: np.ndarray) -> np.ndarray:
+    """Mean chroma and lagged chroma transitions, standardized (cosine = correlation)"""
+    lagged = chroma[:-SUMMARY_LAG].T @ chroma[SUMMARY_LAG:] / max(len(chroma) - SUMMARY_LAG, 1)
+    vector = np.log(np.concatenate((chroma.mean(axis=0), lagged.ravel())) + 1e-6)
+    vector -= vector.mean()
+    norm = np.linalg.norm(vector)
+    return (vector / norm if norm else vector).astype(np.float32)
+
+
+def similarity(a: np.ndarray, b: np.ndarray, max_offset: int = MAX_OFFSET) -> float:
+    """Share of matching bits at the best alignment of two fingerprints (0-1)
+
+    0 if no alignment covers MIN_COVERAGE of the longer one.
+    """
+    longest = max(len(a), len(b))
+    best = 0.0
+    for offset in range(-max_offset, max_offset + 1):
+        x = a[offset:] if offset > 0 else a
+        y = b[-offset:] if offset < 0 else b
+        count = min(len(x), len(y))
+        if not count or count < MIN_COVERAGE * longest:
+            continue
+        differing = int(_POPCOUNT[(x[:count] ^ y[:count]).view(np.uint8)].sum())
+        best = max(best, 1.0 - differing / (count * CODE_BITS))
+    return best
+
+
+def fingerprint_file(path: str, fingerprinter: Optional[Fingerprinter] = None) -> Fingerprinter:
+    """Decode a whole file into a fingerprinter (blocking)"""
+    fingerprinter = fingerprinter if fingerprinter is not None else Fingerprinter()
+    for samples in decode(path):
+        fingerprinter.feed(samples)
+    return fingerprinter
+
+
+def to_record(path: str, fingerprinter: Fingerprinter) -> Optional[TrackFingerprint]:
+    """The stored form of a finished fingerprint; None if the file is gone"""
+    signature = file_signature(path)
+    if signature is None:
+        return None
+    codes, summary = fingerprinter.finish()
+    mtime, size = signature
+    return TrackFingerprint(
+        path=path,
+        mtime=mtime,
+        size=size,
+        duration=round(fingerprinter.duration, 2),
+        codes=codes.astype("<u4").tobytes(),
+        summary=summary.astype("<f4").tobytes(),
+    )
+
+
+class DuplicateIndex:
+    """Finds the stored tracks a new fingerprint nearly duplicates
+
+    Candidates come from LSH over the summary vectors, so a lookup only
+    compares codes with the handful of tracks that share MIN_BANDS bands
+    with it, not with the whole library. Matches are recorded in the
+    store, which is what the duplicates report reads.
+    """
+
+    def __init__(self, store: FingerprintStore):
+        self.store = store
+        self._lock = threading.Lock()
+        planes = np.random.default_rng(LSH_SEED).standard_normal((BANDS * BAND_BITS, SUMMARY_SIZE))
+        self._planes = planes.astype(np.float32)
+        self._weights = (1 << np.arange(BAND_BITS)).astype(np.int64)
+        self._tables: List[Dict[int, Set[str]]] = [{} for _ in range(BANDS)]
+        self._keys: Dict[str, np.ndarray] = {}
+        for path, summary in store.summaries():
+            self._insert(path, np.frombuffer(summary, dtype="<f4"))
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def _band_keys(self, summary: np.ndarray) -> np.ndarray:
+        signs = (self._planes @ summary > 0).reshape(BANDS, BAND_BITS)
+        return signs @ self._weights
+
+    def _insert(self, path: str, summary: np.ndarray):
+        keys = self._band_keys(summary)
+        self._keys[path] = keys
+        for table, key in zip(self._tables, keys):
+            table.setdefault(int(key), set()).add(path)
+
+    def _discard(self, path: str):
+        keys = self._keys.pop(path, None)
+        if keys is None:
+            return
+        for table, key in zip(self._tables, keys):
+            bucket = table.get(int(key))
+            if bucket is not None:
+                bucket.discard(path)
+                if not bucket:
+                    del table[int(key)]
+
+    def candidates(self, summary: np.ndarray) -> Set[str]:
+        """Indexed tracks sharing at least MIN_BANDS LSH bands with a summary"""
+        with self._lock:
+            return self._candidates(summary)
+
+    def _candidates(self, summary: np.ndarray) -> Set[str]:
+        shared: Counter = Counter()
+        for table, key in zip(self._tables, self._band_keys(summary)):
+            shared.update(table.get(int(key), ()))
+        return {path for path, bands in shared.items() if bands >= MIN_BANDS}
+
+    def add(self, record: TrackFingerprint) -> List[Tuple[str, float]]:
+        """Store a track's fingerprint; returns the tracks it nearly duplicates"""
+        codes = np.frombuffer(record.codes, dtype="<u4")
+        summary = np.frombuffer(record.summary, dtype="<f4")
+        # Stored and indexed before comparing, so of two copies added at
+        # once the second still finds the first; the codes are compared
+        # outside the lock
+        with self._lock:
+            self.store.put(record)
+            self._discard(record.path)
+            others = []
+            if len(codes):
+                others = sorted(self._candidates(summary))
+                self._insert(record.path, summary)
+        matches = []
+        for other, stored in self.store.codes(others).items():
+            if not os.path.exists(other):
+                continue
+            score = similarity(codes, np.frombuffer(stored, dtype="<u4"))
+            if score >= MATCH_THRESHOLD:
+                matches.append((other, round(score, 4)))
+        self.store.add_matches(record.path, matches)
+        return matches
@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""
+Local control protocol: msgpack frames over a Unix-domain socket
+
+Every frame is a 4-byte big-endian length followed by a msgpack array:
+
+    request   [0, id, command, [args...]]
+    response  [1, id, error or None, result]
+    event     [2, type, {data}]
+
+Requests on one connection are answered in order. Events are only sent
+to connections that subscribed to them.
+"""
+import asyncio
+import itertools
+import os
+import socket
+import struct
+import sys
+import tempfile
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import msgpack
+
+REQUEST, RESPONSE, EVENT = 0, 1, 2
+
+_HEADER = struct.Struct("!I")
+# Largest frame either side accepts (a full playlist snapshot fits easily)
+MAX_FRAME = 64 * 1024 * 1024
+
+# Frames an event subscriber may lag behind before it is disconnected
+MAX_PENDING_WRITES = 1024 * 1024
+
+
+def runtime_path(suffix: str = "") -> str:
+    """A per-user socket path in the runtime directory"""
+    runtime = os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir()
+    return os.path.join(runtime, f"music-player-{os.getuid()}{suffix}.sock")
+
+
+def default_socket_path() -> str:
+    """MUSIC_PLAYER_SOCKET, else a per-user socket in the runtime directory"""
+    return os.environ.get("MUSIC_PLAYER_SOCKET") or runtime_path()
+
+
+def available() -> bool:
+    """Whether this platform has Unix-domain sockets for asyncio"""
+    return hasattr(socket, "AF_UNIX") and sys.platform != "win32"
+
+
+def encode(message: list) -> bytes:
+    body = msgpack.packb(message, use_bin_type=True)
+    return _HEADER.pack(len(body)) + body
+
+
+def decode(body: bytes) -> list:
+    return msgpack.unpackb(body, raw=False, use_list=True)
+
+
+class IPCError(RuntimeError):
+    """Raised by the client when the daemon rejects a command"""
+
+
+class Connection:
+    """One connected client, as seen by command handlers"""
+
+    def __init__(self, writer: asyncio.StreamWriter):
+        self.writer = writer
+        # Free for handlers to keep per-connection state (e.g. the zone in use)
+        self.state: Dict[str, Any] = {}
+        self._cleanups: List[Callable[[], None]] = []
+
+    def send_event(self, event_type: str, data: Dict[str, Any]):
+        """Queue an event frame; a client that stops reading is dropped"""
+        if self.writer.is_closing():
+            return
+        if self.writer.transport.get_write_buffer_size() > MAX_PENDING_WRITES:
+            self.writer.close()
+            return
+        self.writer.write(encode([EVENT, event_type, data]))
+
+    def on_close(self, cleanup: Callable[[], None]):
+        """Run cleanup when the client disconnects"""
+        self._cleanups.append(cleanup)
+
+    def close(self):
+        for cleanup in self._cleanups:
+            cleanup()
+        self._cleanups.clear()
+
+
+Handler = Callable[..., Awaitable[Any]]
+
+
+class IPCServer:
+    """Serves commands to local clients on a Unix-domain socket.
+
+    `handlers` maps command names to coroutines called with the Connection
+    followed by the request's arguments; whatever they return is sent back
+    as the result, and an exception's message as the error.
+    """
+
+    def __init__(self, handlers: Dict[str, Handler], path: Optional[str] = None):
+        self.handlers = handlers
+        self.path = path or default_socket_path()
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._connections: set = set()
+
+    async def start(self) -> bool:
+        """Start listening; returns False if another daemon already owns the socket"""
+        if os.path.exists(self.path):
+            try:
+                _, writer = await asyncio.open_unix_connection(self.path)
+            except OSError:
+                # Left behind by a daemon that didn't shut down cleanly
+                os.unlink(self.path)
+            else:
+                writer.close()
+                return False
+        self._server = await asyncio.start_unix_server(self._serve, self.path)
+        os.chmod(self.path, 0o600)
+        return True
+
+    async def stop(self):
+        if self._server is None:
+            return
+        self._server.close()
+        for writer in list(self._connections):
+            writer.close()
+        await self._server.wait_closed()
+        self._server = None
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+    @property
+    def clients(self) -> int:
+        return len(self._connections)
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        conn = Connection(writer)
+        self._connections.add(writer)
+        try:
+            while True:
+                header = await reader.readexactly(_HEADER.size)
+                length, = _HEADER.unpack(header)
+                if length > MAX_FRAME:
+                    break
+                message = decode(await reader.readexactly(length))
+                if not isinstance(message, list) or len(message) != 4 or message[0] != REQUEST:
+                    break
+                _, request_id, command, args = message
+                writer.write(await self._handle(conn, request_id, command, args))
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            conn.close()
+            self._connections.discard(writer)
+            writer.close()
+
+    async def _handle(self, conn: Connection, request_id: int, command: str, args: list) -> bytes:
+        """Run a command and encode its response frame"""
+        handler = self.handlers.get(command) if isinstance(command, str) else None
+        if handler is None:
+            return encode([RESPONSE, request_id, f"Unknown command: {command}", None])
+        if not isinstance(args, list):
+            return encode([RESPONSE, request_id, "Arguments must be a list", None])
+        try:
+            result = await handler(conn, *args)
+        except Exception as e:
+            return encode([RESPONSE, request_id, str(e) or type(e).__name__, None])
+        try:
+            return encode([RESPONSE, request_id, None, result])
+        except Exception as e:
+            # A result msgpack can't carry is the handler's fault, not the client's
+            return encode([RESPONSE, request_id, f"Unencodable result: {e}", None])
+
+
+class IPCClient:
+    """Blocking client for the daemon, safe to call from several threads.
+
+    A reader thread matches responses to pending calls and passes events
+    to `on_event(type, data)` (on that thread, so keep it short or hand
+    the event to another thread).
+    """
+
+    def __init__(self, path: Optional[str] = None,
+                 on_event: Optional[Callable[[str, Dict[str, Any]], None]] = None,
+                 timeout: float = 10.0):
+        self.path = path or default_socket_path()
+        self.on_event = on_event
+        self.timeout = timeout
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.connect(self.path)
+        self._send_lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._pending: Dict[int, Future] = {}
+        self._closed = False
+        self._closing = False
+        self._reader = threading.Thread(target=self._read_loop, name="ipc-client", daemon=True)
+        self._reader.start()
+
+    @classmethod
+    def connect(cls, path: Optional[str] = None, **kwargs) -> Optional["IPCClient"]:
+        """A client for the running daemon, or None if there isn't one"""
+        if not available():
+            return None
+        try:
+            return cls(path, **kwargs)
+        except OSError:
+            return None
+
+    def call(self, command: str, *args, timeout: Optional[float] = None) -> Any:
+        """Run a command on the daemon and return its result"""
+        if self._closed:
+            raise ConnectionError("Not connected to the playback daemon")
+        request_id = next(self._ids)
+        future: Future = Future()
+        self._pending[request_id] = future
+        try:
+            with self._send_lock:
+                self._sock.sendall(encode([REQUEST, request_id, command, list(args)]))
+            return future.result(self.timeout if timeout is None else timeout)
+        finally:
+            self._pending.pop(request_id, None)
+
+    def _recv_exactly(self, size: int) -> bytes:
+        data = bytearray()
+        while len(data) < size:
+            chunk = self._sock.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError("Playback daemon closed the connection")
+            data += chunk
+        return bytes(data)
+
+    def _read_loop(self):
+        try:
+            while True:
+                length, = _HEADER.unpack(self._recv_exactly(_HEADER.size))
+                message = decode(self._recv_exactly(length))
+                if message[0] == RESPONSE:
+                    _, request_id, error, result = message
+                    future = self._pending.get(request_id)
+                    if future is None:
+                        continue
+                    if error is not None:
+                        future.set_exception(IPCError(error))
+                    else:
+                        future.set_result(result)
+                elif message[0] == EVENT and self.on_event is not None:
+                    self.on_event(message[1], message[2])
+        except (OSError, ValueError, struct.error):
+            pass
+        finally:
+            self._closed = True
+            for future in list(self._pending.values()):
+                if not future.done():
+                    future.set_exception(ConnectionError("Playback daemon went away"))
+            if self.on_event is not None and not self._closing:
+                self.on_event("disconnected", {})
+
+    @property
+    def connected(self) -> bool:
+        return not self._closed
+
+    def close(self):
+        self._closing = self._closed = True
+        try:
+            self._sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._sock.close()
@@ -1,22 +1,60 @@
 #ventana + UI
 # main.py
-import os
 import sys
+import threading
+from typing import Optional
 from PySide6.QtWidgets import (
-    QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
-    QPushButton, QListWidget, QFileDialog, QLineEdit, QLabel, QSlider, QMessageBox, QListWidgetItem
+    QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QAbstractItemView,
+    QPushButton, QListView, QFileDialog, QLineEdit, QLabel, QSlider, QMessageBox
 )
-from PySide6.QtCore import Qt
-from music_player import MusicPlayer
+from PySide6.QtCore import QModelIndex, QSize, Qt, Signal
+from PySide6.QtGui import QKeySequence, QShortcut
+from database import MetadataCache, TrackMetadata
+from music_player import MusicPlayer, probe_file, probe_instance
+from playlist_model import COVER_SIZE, PlaylistModel
+from remote_player import RemotePlayer
+from scanner import LibraryScanner, ScanJob
+
+class DesktopPlayer(MusicPlayer):
+    """MusicPlayer que avisa a la ventana cuando cambia la canción actual"""
+
+    def __init__(self, on_track_changed):
+        super().__init__()
+        self.on_track_changed = on_track_changed
+
+    def track_changed(self):
+        # Puede llamarse desde los hilos de VLC; on_track_changed emite una señal
+        self.on_track_changed()
 
 class MainWindow(QMainWindow):
+    # Emitidas desde el hilo del escáner; Qt las entrega en el hilo de la UI
+    scan_progress = Signal(str)
+    scan_finished = Signal(list)
+    # Emitida desde los hilos de VLC al cambiar de canción
+    track_changed = Signal()
+    # Eventos del demonio de reproducción, emitidos desde el hilo del cliente IPC
+    daemon_event = Signal(str, dict)
+
     def __init__(self):
         super().__init__()
         self.setWindowTitle("Mi Reproductor MP3")
         self.resize(700, 500)
 
         # ---- Backend ----
-        self.player = MusicPlayer()
+        # Si el servidor (python api_server.py) está en marcha, la ventana lo
+        # controla por su socket local y no abre un segundo libVLC. Si no,
+        # reproduce ella misma: libVLC arranca en el primer play (o en
+        # warm_up) y la caché de metadatos al añadir la primera carpeta, así
+        # la ventana abre al momento
+        self.remote = RemotePlayer.connect(self.daemon_event.emit)
+        if self.remote is not None:
+            self.player = self.remote
+            self.player.on_track_changed = self.track_changed.emit
+        else:
+            self.player = DesktopPlayer(self.track_changed.emit)
+        self._metadata = None
+        self._metadata_lock = threading.Lock()
+        self._scanner = None
 
         # ---- UI ----
         central = QWidget()
@@ -24,9 +62,18 @@ class MainWindow(QMainWindow):
 
         layout = QVBoxLayout(central)
 
-        # Lista de reproducción
-        self.list_widget = QListWidget()
-        layout.addWidget(self.list_widget)
+        # Lista de reproducción: el modelo entrega las filas por lotes y
+        # carga los títulos y las carátulas en segundo plano, solo de las filas visibles
+        self.playlist_model = PlaylistModel(self.player, self.load_metadata, self)
+        self.list_view = QListView()
+        self.list_view.setUniformItemSizes(True)
+        self.list_view.setIconSize(QSize(COVER_SIZE, COVER_SIZE))
+        self.list_view.setSelectionMode(QAbstractItemView.ExtendedSelection)
+        self.list_view.setModel(self.playlist_model)
+        layout.addWidget(self.list_view)
+        if self.remote is not None:
+            self.remote.on_resync = self.playlist_model.reset
+            self.playlist_model.fetchMore()
 
         # Controles de reproducción
         controls = QHBoxLayout()
@@ -45,13 +92,19 @@ class MainWindow(QMainWindow):
         vol_layout.addWidget(QLabel("Volumen"))
         self.slider_vol = QSlider(Qt.Horizontal)
         self.slider_vol.setRange(0, 100)
-        self.slider_vol.setValue(80)
+        self.slider_vol.setValue(self.player.volume)
         vol_layout.addWidget(self.slider_vol)
         layout.addLayout(vol_layout)
 
         # Cargar archivos locales
+        add_layout = QHBoxLayout()
         self.btn_add_files = QPushButton("➕ Añadir canciones locales")
-        layout.addWidget(self.btn_add_files)
+        self.btn_add_folder = QPushButton("📁 Añadir carpeta")
+        add_layout.addWidget(self.btn_add_files)
+        add_layout.addWidget(self.btn_add_folder)
+        layout.addLayout(add_layout)
+        self.scan_status = QLabel("")
+        layout.addWidget(self.scan_status)
 
         # Descarga desde URL
         dl_layout = QHBoxLayout()
@@ -64,35 +117,111 @@ class MainWindow(QMainWindow):
 
         # ---- Conexiones ----
         self.btn_add_files.clicked.connect(self.add_files)
+        self.btn_add_folder.clicked.connect(self.add_folder)
+        self.scan_progress.connect(self.scan_status.setText)
+        self.scan_finished.connect(self.add_scanned)
         self.btn_play.clicked.connect(self.player.play_or_pause)
         self.btn_stop.clicked.connect(self.player.stop)
         self.btn_next.clicked.connect(self.next_track)
         self.btn_prev.clicked.connect(self.prev_track)
         self.slider_vol.valueChanged.connect(self.player.set_volume)
-        self.list_widget.itemDoubleClicked.connect(self.play_selected)
+        self.list_view.doubleClicked.connect(self.play_selected)
+        QShortcut(QKeySequence.Delete, self.list_view, self.remove_selected)
+        self.track_changed.connect(self.show_current)
         self.btn_download.clicked.connect(self.download_from_url)
+        self.daemon_event.connect(self.on_daemon_event)
 
     # --- Slots ---
     def add_files(self):
         files, _ = QFileDialog.getOpenFileNames(
-            self, "Seleccionar canciones", "", "Audio (*.mp3 *.wav *.flac)"
+            self, "Seleccionar canciones", "", "Audio (*.mp3 *.wav *.flac *.m4a *.ogg *.opus *.aac *.webm)"
         )
         if not files:
             return
-        # Añadir al backend y a la UI
-        self.player.add(files)
-        for full_path in files:
-            item = QListWidgetItem(os.path.basename(full_path))
-            item.setData(Qt.UserRole, full_path)  # guarda la ruta completa
-            self.list_widget.addItem(item)
+        self.add_paths(files)
+
+    def add_paths(self, files):
+        # El reproductor ignora las que ya estaban; la vista pide las filas nuevas al desplazarse
+        self.playlist_model.add_paths(files)
+
+    @property
+    def metadata(self) -> MetadataCache:
+        # La usan el escáner y los hilos del modelo, así que se abre una sola vez
+        with self._metadata_lock:
+            if self._metadata is None:
+                self._metadata = MetadataCache()
+            return self._metadata
+
+    def load_metadata(self, path: str) -> Optional[TrackMetadata]:
+        # Se ejecuta en el QThreadPool del modelo
+        if self.remote is not None:
+            # El demonio responde desde su propia caché
+            return self.remote.probe(path)
+        meta = self.metadata.get(path)
+        if meta is None:
+            # Con una instancia de libVLC propia de cada hilo, no la que reproduce
+            meta = probe_file(probe_instance(), path)
+            if meta is not None:
+                self.metadata.put(meta)
+        return meta
+
+    @property
+    def scanner(self) -> LibraryScanner:
+        if self._scanner is None:
+            self._scanner = LibraryScanner(self.metadata)
+        return self._scanner
+
+    def add_folder(self):
+        folder = QFileDialog.getExistingDirectory(self, "Seleccionar carpeta")
+        if not folder:
+            return
+        self.btn_add_folder.setEnabled(False)
+        job = self.scanner.create([folder])
+        # El escaneo recorre la carpeta y analiza los archivos en otros procesos
+        threading.Thread(target=self.run_scan, args=(job,), daemon=True).start()
 
-    def play_selected(self, item: QListWidgetItem):
-        idx = self.list_widget.row(item)
-        self.player.play_index(idx)
+    def run_scan(self, job: ScanJob):
+        paths = self.scanner.scan(job, self.report_scan)
+        self.scan_finished.emit(paths)
+
+    def report_scan(self, job: ScanJob):
+        if job.status == "scanning":
+            self.scan_progress.emit(f"Buscando canciones… {job.discovered} encontradas")
+        elif job.status == "probing":
+            self.scan_progress.emit(f"Analizando… {job.probed + job.failed}/{job.to_probe}")
+        elif job.status == "done":
+            self.scan_progress.emit(
+                f"{job.discovered} canciones ({job.to_probe} nuevas o modificadas)"
+            )
+        else:
+            self.scan_progress.emit(f"Escaneo {job.status}: {job.error or ''}")
+
+    def add_scanned(self, paths):
+        self.add_paths(paths)
+        self.btn_add_folder.setEnabled(True)
+
+    def play_selected(self, index: QModelIndex):
+        self.player.play_index(index.row())
+
+    def remove_selected(self):
+        rows = [index.row() for index in self.list_view.selectionModel().selectedRows()]
+        self.playlist_model.remove_rows(rows)
+
+    def show_current(self):
+        # Resalta la canción actual y la muestra si ya está cargada en la vista
+        self.playlist_model.refresh_current()
+        row = self.playlist_model.current_row()
+        if row is not None:
+            self.list_view.scrollTo(self.playlist_model.index(row))
+
+    def on_daemon_event(self, event_type: str, data: dict):
+        if event_type == "disconnected":
+            QMessageBox.warning(self, "Aviso", "Se perdió la conexión con el servidor de reproducción.")
+            return
+        self.player.handle_event(event_type, data)
 
     def next_track(self):
         self.player.next()
-        # Opcional: resaltar en la UI el siguiente índice
 
     def prev_track(self):
         self.player.previous()
@@ -102,6 +231,14 @@ class MainWindow(QMainWindow):
         if not url:
             QMessageBox.warning(self, "Aviso", "Pega un enlace válido.")
             return
+        if self.remote is not None:
+            # El servidor descarga en segundo plano y añade la canción al terminar
+            try:
+                self.remote.download(url)
+            except Exception as e:
+                QMessageBox.warning(self, "Error", f"No se pudo iniciar la descarga: {e}")
+            self.url_input.clear()
+            return
         self.btn_download.setEnabled(False)
         self.btn_download.setText("Descargando…")
         try:
@@ -115,8 +252,16 @@ class MainWindow(QMainWindow):
             self.btn_download.setText("⬇️ Descargar MP3")
             self.url_input.clear()
 
+    def closeEvent(self, event):
+        self.playlist_model.shutdown()
+        if self.remote is not None:
+            self.remote.release()
+        super().closeEvent(event)
+
 if __name__ == "__main__":
     app = QApplication(sys.argv)
     w = MainWindow()
     w.show()
+    # Carga los plugins de VLC mientras la ventana ya responde
+    threading.Thread(target=w.player.warm_up, daemon=True).start()
     sys.exit(app.exec())
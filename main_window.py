@@ -47,7 +47,7 @@ class MainWindow(QMainWindow):
 
     def load_song(self):
         file_dialog = QFileDialog(self)
-        file_dialog.setNameFilter("Archivos de audio (*.mp3 *.wav *.flac)")
+        file_dialog.setNameFilter("Archivos de audio (*.mp3 *.wav *.flac *.m4a *.ogg *.opus *.aac *.webm)")
         if file_dialog.exec():
             file_path = file_dialog.selectedFiles()[0]
             self.current_song = file_path
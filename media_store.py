@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Content-addressed media store: every upload/download is kept once under its hash
+"""
+import hashlib
+import os
+import threading
+from typing import Optional, Tuple
+
+from database import MediaIndex, MediaObject
+
+MEDIA_DIR = "media"
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def hash_file(path: str, chunk_size: int = HASH_CHUNK_SIZE) -> str:
+    """sha256 of a file, read incrementally"""
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+class MediaStore:
+    """Stores files at media/<aa>/<sha256><ext> and dedupes by content"""
+
+    def __init__(self, root: str = MEDIA_DIR, index: Optional[MediaIndex] = None):
+        self.root = root
+        self.index = index if index is not None else MediaIndex()
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def object_path(self, sha256: str, ext: str) -> str:
+        return os.path.join(self.root, sha256[:2], sha256 + ext.lower())
+
+    def add(self, src_path: str, sha256: Optional[str] = None,
+            name: Optional[str] = None) -> Tuple[MediaObject, bool]:
+        """Move a file into the store.
+
+        `sha256` should be passed when the caller already hashed the data
+        while writing it. If the content is already stored the source file
+        is deleted and the existing object returned. Returns (object, is_new).
+        """
+        if sha256 is None:
+            sha256 = hash_file(src_path)
+        name = name or os.path.basename(src_path)
+
+        with self._lock:
+            existing = self.index.by_hash(sha256)
+            if existing is not None and os.path.exists(existing.path):
+                if os.path.abspath(src_path) != os.path.abspath(existing.path):
+                    os.remove(src_path)
+                return existing, False
+
+            dest_path = self.object_path(sha256, os.path.splitext(name)[1])
+            os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+            size = os.path.getsize(src_path)
+            os.replace(src_path, dest_path)
+            obj = MediaObject(sha256=sha256, path=dest_path, size=size, name=name)
+            self.index.put(obj)
+            return obj, True
+
+    def discard(self, sha256: str):
+        """Delete a stored object and its index entry"""
+        with self._lock:
+            obj = self.index.by_hash(sha256)
+            if obj is None:
+                return
+            self.index.remove(sha256)
+            if os.path.exists(obj.path):
+                os.remove(obj.path)
+
+    def get(self, sha256: str) -> Optional[MediaObject]:
+        """Look up a stored object by hash"""
+        return self.index.by_hash(sha256)
+
+    def lookup_path(self, path: str) -> Optional[MediaObject]:
+        """Look up a stored object by its path in the store"""
+        return self.index.by_path(path)
+
+    def display_name(self, path: str) -> str:
+        """The original filename for a stored path, or the path's basename"""
+        obj = self.index.by_path(path)
+        return obj.name if obj is not None else os.path.basename(path)
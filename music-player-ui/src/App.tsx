@@ -16,7 +16,7 @@ import Playlist from './components/Playlist';
 import FileUpload from './components/FileUpload';
 import URLDownload from './components/URLDownload';
 import VolumeControl from './components/VolumeControl';
-import { MusicPlayerAPI, PlayerStatus, PlaylistResponse } from './api/client';
+import { MusicPlayerAPI, PlayerEvent, PlayerStatus, PlaylistResponse } from './api/client';
 
 const theme = createTheme({
   palette: {
@@ -58,50 +58,82 @@ function App() {
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState<string | null>(null);
 
-  const fetchPlayerStatus = async () => {
-    try {
-      const status = await MusicPlayerAPI.getStatus();
-      setPlayerStatus(status);
-    } catch (err) {
-      console.error('Failed to fetch player status:', err);
-      setError('Failed to connect to music player API');
+  const applyEvent = (event: PlayerEvent) => {
+    switch (event.type) {
+      case 'snapshot':
+        setPlayerStatus(event.status);
+        setPlaylist(event.playlist);
+        setError(null);
+        setLoading(false);
+        break;
+      case 'state':
+        setPlayerStatus((prev) => prev && { ...prev, is_playing: event.is_playing, is_paused: event.is_paused });
+        break;
+      case 'track':
+        setPlayerStatus((prev) => prev && { ...prev, current_track: event.current_track ?? undefined });
+        setPlaylist((prev) => ({ ...prev, current_index: event.current_index }));
+        break;
+      case 'position':
+        setPlayerStatus((prev) => prev && { ...prev, position: event.position, duration: event.duration });
+        break;
+      case 'volume':
+        setPlayerStatus((prev) => prev && { ...prev, volume: event.volume, normalize: event.normalize });
+        break;
+      case 'playlist':
+        if (event.action === 'reload') {
+          // Bulk additions (library scans) are fetched rather than streamed
+          MusicPlayerAPI.getPlaylist().then(setPlaylist).catch(() => undefined);
+          break;
+        }
+        setPlaylist((prev) => {
+          if (event.action === 'add') {
+            return { ...prev, tracks: [...prev.tracks, event.track] };
+          }
+          if (event.action === 'remove') {
+            return { ...prev, tracks: prev.tracks.filter((track) => track.id !== event.id) };
+          }
+          if (event.action === 'move') {
+            const moved = prev.tracks.find((track) => track.id === event.id);
+            if (!moved) return prev;
+            const tracks = prev.tracks.filter((track) => track.id !== event.id);
+            tracks.splice(event.position, 0, moved);
+            return { ...prev, tracks };
+          }
+          return { tracks: [], current_index: undefined };
+        });
+        break;
+      case 'download':
+        // Finished downloads show up as playlist 'add' events
+        break;
+      case 'scan':
+        // Scanned folders show up as a playlist 'reload' event
+        break;
+      case 'analysis':
+        // Waveforms are fetched on demand
+        break;
     }
   };
 
-  const fetchPlaylist = async () => {
-    try {
-      const playlistData = await MusicPlayerAPI.getPlaylist();
-      setPlaylist(playlistData);
-    } catch (err) {
-      console.error('Failed to fetch playlist:', err);
-    }
-  };
-
-  const refreshData = async () => {
-    await Promise.all([fetchPlayerStatus(), fetchPlaylist()]);
-    setLoading(false);
-  };
-
   useEffect(() => {
-    refreshData();
-    
-    // Poll for updates every 2 seconds
-    const interval = setInterval(() => {
-      fetchPlayerStatus();
-    }, 2000);
-
-    return () => clearInterval(interval);
+    // Status and playlist changes are pushed by the server; no polling
+    const unsubscribe = MusicPlayerAPI.subscribe({
+      onEvent: applyEvent,
+      onError: () => {
+        setError('Failed to connect to music player API');
+        setLoading(false);
+      },
+    });
+
+    return unsubscribe;
   }, []);
 
   const handlePlaylistUpdate = () => {
-    fetchPlaylist();
+    // Playlist edits arrive over the event stream
   };
 
   const handlePlayerAction = async (action: () => Promise<void>) => {
     try {
       await action();
-      // Wait a bit for the action to take effect, then refresh
-      setTimeout(fetchPlayerStatus, 200);
     } catch (err) {
       console.error('Player action failed:', err);
       setError('Player action failed');
@@ -186,7 +218,8 @@ function App() {
               <Playlist 
                 playlist={playlist}
                 currentTrack={playerStatus?.current_track}
-                onPlayTrack={(index) => handlePlayerAction(() => MusicPlayerAPI.play(index))}
+                onPlayTrack={(trackId) => handlePlayerAction(() => MusicPlayerAPI.playTrack(trackId))}
+                onMoveTrack={(trackId, position) => handlePlayerAction(() => MusicPlayerAPI.moveTrack(trackId, position))}
                 onRemoveTrack={(trackId) => {
                   handlePlayerAction(() => MusicPlayerAPI.removeTrack(trackId));
                   handlePlaylistUpdate();
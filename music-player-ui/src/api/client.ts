@@ -1,6 +1,7 @@
 import axios from 'axios';
 
 const API_BASE_URL = 'http://localhost:8000';
+const EVENTS_URL = API_BASE_URL.replace(/^http/, 'ws') + '/events';
 
 export const apiClient = axios.create({
   baseURL: API_BASE_URL,
@@ -12,12 +13,45 @@ export interface TrackInfo {
   title: string;
   filename: string;
   path: string;
+  sha256?: string;
   duration?: number;
+  codec?: string;
+  bitrate?: number;
+  artist?: string;
+  album?: string;
+  genre?: string;
+  /** Name of the track's cover image, if it has one */
+  artwork?: string;
+}
+
+export interface SearchResult {
+  path: string;
+  title: string;
+  artist?: string;
+  album?: string;
+  genre?: string;
+  duration?: number;
+  /** ID in the current playlist, if the track is queued */
+  track_id?: number;
+  score: number;
+  fuzzy: boolean;
 }
 
 export interface PlaylistResponse {
   tracks: TrackInfo[];
   current_index?: number;
+  total?: number;
+  offset?: number;
+  next_cursor?: number;
+  version?: string;
+}
+
+export interface PlaylistQuery {
+  offset?: number;
+  limit?: number;
+  cursor?: number;
+  q?: string;
+  fields?: (keyof TrackInfo)[];
 }
 
 export interface PlayerStatus {
@@ -27,21 +61,162 @@ export interface PlayerStatus {
   position: number;
   duration: number;
   volume: number;
+  normalize: boolean;
+}
+
+export interface PlaybackSettings {
+  gapless: boolean;
+  prebuffer_seconds: number;
+  crossfade_seconds: number;
+  repeat: boolean;
+}
+
+export interface DownloadJob {
+  id: string;
+  url: string;
+  status: 'queued' | 'running' | 'retrying' | 'done' | 'failed' | 'cancelled';
+  attempts: number;
+  error?: string;
+  path?: string;
+  created_at: number;
+  updated_at: number;
+  downloaded_bytes: number;
+  total_bytes?: number;
+  percent?: number;
+  speed?: number;
+  eta?: number;
+}
+
+export interface ScanJob {
+  id: string;
+  roots: string[];
+  status: 'queued' | 'scanning' | 'probing' | 'done' | 'failed' | 'cancelled';
+  discovered: number;
+  unchanged: number;
+  to_probe: number;
+  probed: number;
+  failed: number;
+  removed: number;
+  added: number;
+  error?: string;
+  started_at?: number;
+  finished_at?: number;
+}
+
+export interface Waveform {
+  id: number;
+  points: number;
+  peaks: number[];
+  rms: number[];
+  loudness?: number;
+  peak: number;
+  gain?: number;
+}
+
+export interface ZoneInfo {
+  active: boolean;
+  idle_seconds?: number;
+}
+
+export interface NamedPlaylist {
+  name: string;
+  tracks: number;
+  updated_at: number;
+  zones: string[];
+}
+
+export type PlayerEvent =
+  | { type: 'snapshot'; status: PlayerStatus; playlist: PlaylistResponse }
+  | { type: 'state'; is_playing: boolean; is_paused: boolean }
+  | { type: 'track'; current_track?: TrackInfo; current_index?: number }
+  | { type: 'position'; position: number; duration: number }
+  | { type: 'volume'; volume: number; normalize: boolean }
+  | { type: 'analysis'; id: number }
+  | { type: 'playlist'; action: 'add'; track: TrackInfo }
+  | { type: 'playlist'; action: 'remove'; id: number }
+  | { type: 'playlist'; action: 'move'; id: number; position: number }
+  | { type: 'playlist'; action: 'clear' }
+  | { type: 'playlist'; action: 'reload'; version: string }
+  | { type: 'download'; id: string; status: DownloadJob['status']; path?: string }
+  | ({ type: 'scan' } & ScanJob);
+
+export interface EventStreamHandlers {
+  onEvent: (event: PlayerEvent) => void;
+  onError?: () => void;
 }
 
 export class MusicPlayerAPI {
-  static async getPlaylist(): Promise<PlaylistResponse> {
-    const response = await apiClient.get<PlaylistResponse>('/playlist');
+  /**
+   * Subscribe to the server's playback event stream. The connection is
+   * re-established after drops; a fresh snapshot is sent on every connect.
+   * Returns a function that closes the stream.
+   */
+  static subscribe(handlers: EventStreamHandlers, tickMs: number = 1000): () => void {
+    let socket: WebSocket | null = null;
+    let retryTimer: ReturnType<typeof setTimeout> | null = null;
+    let closed = false;
+
+    const connect = () => {
+      socket = new WebSocket(`${EVENTS_URL}?tick=${tickMs}`);
+      socket.onmessage = (message) => {
+        handlers.onEvent(JSON.parse(message.data) as PlayerEvent);
+      };
+      socket.onclose = () => {
+        if (closed) return;
+        handlers.onError?.();
+        retryTimer = setTimeout(connect, 2000);
+      };
+    };
+
+    connect();
+
+    return () => {
+      closed = true;
+      if (retryTimer) clearTimeout(retryTimer);
+      socket?.close();
+    };
+  }
+
+
+  static async getPlaylist(query: PlaylistQuery = {}): Promise<PlaylistResponse> {
+    // The browser revalidates with If-None-Match using the ETag it cached
+    const { fields, ...params } = query;
+    const response = await apiClient.get<PlaylistResponse>('/playlist', {
+      params: { ...params, fields: fields?.join(',') },
+    });
     return response.data;
   }
 
+  /**
+   * URL for an <audio> element. Without a format the original file is
+   * served; 'opus' or 'aac' transcodes it (cached on the server).
+   */
+  static streamUrl(trackId: number, format?: 'opus' | 'aac', bitrate: number = 128): string {
+    const url = `${API_BASE_URL}/stream/${trackId}`;
+    return format ? `${url}?format=${format}&bitrate=${bitrate}` : url;
+  }
+
+  /**
+   * URL of a track's cover fitted to `size` pixels (WebP where the browser
+   * takes it), or undefined if it has none. The image name in the URL lets
+   * the browser cache it for good.
+   */
+  static artworkUrl(track: TrackInfo, size: number = 128): string | undefined {
+    if (!track.artwork) return undefined;
+    return `${API_BASE_URL}/track/${track.id}/art?size=${size}&v=${encodeURIComponent(track.artwork)}`;
+  }
+
   static async getStatus(): Promise<PlayerStatus> {
     const response = await apiClient.get<PlayerStatus>('/status');
     return response.data;
   }
 
   static async play(index?: number): Promise<void> {
-    await apiClient.post('/play', index !== undefined ? { index } : {});
+    await apiClient.post('/play', null, { params: index !== undefined ? { index } : {} });
+  }
+
+  static async playTrack(trackId: number): Promise<void> {
+    await apiClient.post('/play', null, { params: { track_id: trackId } });
   }
 
   static async pause(): Promise<void> {
@@ -60,8 +235,26 @@ export class MusicPlayerAPI {
     await apiClient.post('/previous');
   }
 
-  static async setVolume(volume: number): Promise<void> {
-    await apiClient.post('/volume', { volume });
+  static async getPlaybackSettings(): Promise<PlaybackSettings> {
+    const response = await apiClient.get<PlaybackSettings>('/settings/playback');
+    return response.data;
+  }
+
+  static async setPlaybackSettings(settings: PlaybackSettings): Promise<PlaybackSettings> {
+    const response = await apiClient.put<PlaybackSettings>('/settings/playback', settings);
+    return response.data;
+  }
+
+  static async setVolume(volume: number, normalize?: boolean): Promise<void> {
+    await apiClient.post('/volume', { volume, normalize });
+  }
+
+  /** Precomputed waveform, or null while the server is still analysing the track */
+  static async getWaveform(trackId: number, points?: number): Promise<Waveform | null> {
+    const response = await apiClient.get<Waveform>(`/track/${trackId}/waveform`, {
+      params: { points },
+    });
+    return response.status === 202 ? null : response.data;
   }
 
   static async uploadFile(file: File): Promise<{ track: TrackInfo }> {
@@ -77,8 +270,140 @@ export class MusicPlayerAPI {
     return response.data;
   }
 
-  static async downloadFromUrl(url: string): Promise<void> {
-    await apiClient.post('/download', { url });
+  static async uploadFiles(
+    files: File[],
+    onProgress?: (percent: number) => void,
+  ): Promise<{ tracks: TrackInfo[]; errors: { filename: string; detail: string }[] }> {
+    const formData = new FormData();
+    files.forEach((file) => formData.append('files', file));
+
+    const response = await apiClient.post('/upload/batch', formData, {
+      headers: {
+        'Content-Type': 'multipart/form-data',
+      },
+      timeout: 0,
+      onUploadProgress: (event) => {
+        if (onProgress && event.total) {
+          onProgress((event.loaded / event.total) * 100);
+        }
+      },
+    });
+
+    return response.data;
+  }
+
+  /**
+   * Upload a large file in chunks through a resumable session. If a chunk
+   * fails, calling this again with the same sessionId resumes from the
+   * server's offset.
+   */
+  static async uploadResumable(
+    file: File,
+    onProgress?: (percent: number) => void,
+    sessionId?: string,
+    chunkSize: number = 8 * 1024 * 1024,
+  ): Promise<{ track?: TrackInfo }> {
+    let session = sessionId
+      ? (await apiClient.get(`/upload/sessions/${sessionId}`)).data
+      : (await apiClient.post('/upload/sessions', { filename: file.name, size: file.size })).data;
+
+    let offset: number = session.offset;
+    let result: { track?: TrackInfo } = {};
+    while (offset < file.size) {
+      const end = Math.min(offset + chunkSize, file.size);
+      const response = await apiClient.put(`/upload/sessions/${session.id}`, file.slice(offset, end), {
+        headers: {
+          'Content-Type': 'application/octet-stream',
+          'Content-Range': `bytes ${offset}-${end - 1}/${file.size}`,
+        },
+        timeout: 0,
+      });
+      offset = response.data.offset;
+      result = response.data;
+      onProgress?.((offset / file.size) * 100);
+    }
+    return result;
+  }
+
+  static async downloadFromUrl(url: string): Promise<DownloadJob> {
+    const response = await apiClient.post<DownloadJob>('/download', { url });
+    return response.data;
+  }
+
+  static async downloadBatch(urls: string[], expandPlaylists: boolean = true): Promise<DownloadJob[]> {
+    const response = await apiClient.post<DownloadJob[]>('/download/batch', {
+      urls,
+      expand_playlists: expandPlaylists,
+    });
+    return response.data;
+  }
+
+  static async getDownload(jobId: string): Promise<DownloadJob> {
+    const response = await apiClient.get<DownloadJob>(`/downloads/${jobId}`);
+    return response.data;
+  }
+
+  static async cancelDownload(jobId: string): Promise<void> {
+    await apiClient.delete(`/downloads/${jobId}`);
+  }
+
+  static async scanLibrary(paths: string[], addToPlaylist: boolean = true): Promise<ScanJob> {
+    const response = await apiClient.post<ScanJob>('/library/scan', {
+      paths,
+      add_to_playlist: addToPlaylist,
+    });
+    return response.data;
+  }
+
+  static async getScan(jobId: string): Promise<ScanJob> {
+    const response = await apiClient.get<ScanJob>(`/library/scan/${jobId}`);
+    return response.data;
+  }
+
+  static async cancelScan(jobId: string): Promise<void> {
+    await apiClient.delete(`/library/scan/${jobId}`);
+  }
+
+  static async listZones(): Promise<Record<string, ZoneInfo>> {
+    const response = await apiClient.get<Record<string, ZoneInfo>>('/zones');
+    return response.data;
+  }
+
+  /** Queue library tracks in another zone; every playback route also exists under /zones/{zone} */
+  static async addToZone(zone: string, paths: string[]): Promise<number[]> {
+    const response = await apiClient.post<{ track_ids: number[] }>(
+      `/zones/${encodeURIComponent(zone)}/playlist`,
+      { paths },
+    );
+    return response.data.track_ids;
+  }
+
+  static async deleteZone(zone: string): Promise<void> {
+    await apiClient.delete(`/zones/${encodeURIComponent(zone)}`);
+  }
+
+  /** Search the library by title, artist, album and genre */
+  static async search(q: string, limit: number = 50): Promise<SearchResult[]> {
+    const response = await apiClient.get<{ results: SearchResult[] }>('/search', { params: { q, limit } });
+    return response.data.results;
+  }
+
+  static async listPlaylists(): Promise<NamedPlaylist[]> {
+    const response = await apiClient.get<NamedPlaylist[]>('/playlists');
+    return response.data;
+  }
+
+  static async savePlaylist(name: string): Promise<void> {
+    await apiClient.post('/playlist/save', { name });
+  }
+
+  /** Switch to a named playlist; later edits are saved to it */
+  static async loadPlaylist(name: string): Promise<void> {
+    await apiClient.post('/playlist/load', { name });
+  }
+
+  static async deletePlaylist(name: string): Promise<void> {
+    await apiClient.delete(`/playlists/${encodeURIComponent(name)}`);
   }
 
   static async clearPlaylist(): Promise<void> {
@@ -88,4 +413,8 @@ export class MusicPlayerAPI {
   static async removeTrack(trackId: number): Promise<void> {
     await apiClient.delete(`/track/${trackId}`);
   }
+
+  static async moveTrack(trackId: number, position: number): Promise<void> {
+    await apiClient.patch('/playlist', { track_id: trackId, position });
+  }
 }
\ No newline at end of file
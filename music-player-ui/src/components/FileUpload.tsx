@@ -28,7 +28,7 @@ const FileUpload: React.FC<FileUploadProps> = ({ onUploadComplete }) => {
   const [selectedFiles, setSelectedFiles] = useState<File[]>([]);
   const fileInputRef = useRef<HTMLInputElement>(null);
 
-  const acceptedFormats = ['.mp3', '.wav', '.flac', '.m4a'];
+  const acceptedFormats = ['.mp3', '.wav', '.flac', '.m4a', '.ogg', '.opus', '.aac', '.webm'];
   const maxFileSize = 50 * 1024 * 1024; // 50MB
 
   const handleFileSelect = (event: React.ChangeEvent<HTMLInputElement>) => {
@@ -75,12 +75,11 @@ const FileUpload: React.FC<FileUploadProps> = ({ onUploadComplete }) => {
 
     try {
       const totalFiles = selectedFiles.length;
-      let uploadedCount = 0;
 
-      for (const file of selectedFiles) {
-        await MusicPlayerAPI.uploadFile(file);
-        uploadedCount++;
-        setUploadProgress((uploadedCount / totalFiles) * 100);
+      // One multipart request; the server stores and probes files in parallel
+      const result = await MusicPlayerAPI.uploadFiles(selectedFiles, setUploadProgress);
+      if (result.errors.length > 0) {
+        throw new Error(result.errors.map((e) => `${e.filename}: ${e.detail}`).join(', '));
       }
 
       setMessage({
@@ -1,5 +1,6 @@
-import React from 'react';
+import React, { useState } from 'react';
 import {
+  Avatar,
   Box,
   List,
   ListItem,
@@ -19,12 +20,13 @@ import {
   VolumeUp,
   Clear,
 } from '@mui/icons-material';
-import { PlaylistResponse, TrackInfo } from '../api/client';
+import { MusicPlayerAPI, PlaylistResponse, TrackInfo } from '../api/client';
 
 interface PlaylistProps {
   playlist: PlaylistResponse;
   currentTrack?: TrackInfo;
-  onPlayTrack: (index: number) => void;
+  onPlayTrack: (trackId: number) => void;
+  onMoveTrack: (trackId: number, position: number) => void;
   onRemoveTrack: (trackId: number) => void;
   onClearPlaylist: () => void;
 }
@@ -33,9 +35,12 @@ const Playlist: React.FC<PlaylistProps> = ({
   playlist,
   currentTrack,
   onPlayTrack,
+  onMoveTrack,
   onRemoveTrack,
   onClearPlaylist,
 }) => {
+  const [draggedId, setDraggedId] = useState<number | null>(null);
+
   const formatDuration = (duration?: number): string => {
     if (!duration) return '--:--';
     const mins = Math.floor(duration / 60);
@@ -99,6 +104,17 @@ const Playlist: React.FC<PlaylistProps> = ({
             <ListItem
               key={track.id}
               disablePadding
+              draggable
+              onDragStart={() => setDraggedId(track.id)}
+              onDragEnd={() => setDraggedId(null)}
+              onDragOver={(e) => e.preventDefault()}
+              onDrop={(e) => {
+                e.preventDefault();
+                if (draggedId !== null && draggedId !== track.id) {
+                  onMoveTrack(draggedId, index);
+                }
+                setDraggedId(null);
+              }}
               sx={{
                 mb: 1,
                 borderRadius: 2,
@@ -110,11 +126,20 @@ const Playlist: React.FC<PlaylistProps> = ({
               }}
             >
               <ListItemButton
-                onClick={() => onPlayTrack(index)}
+                onClick={() => onPlayTrack(track.id)}
                 sx={{ borderRadius: 2 }}
               >
                 <ListItemIcon>
-                  {isCurrentTrack ? (
+                  {track.artwork ? (
+                    <Avatar
+                      variant="rounded"
+                      src={MusicPlayerAPI.artworkUrl(track, 80)}
+                      imgProps={{ loading: 'lazy' }}
+                      sx={{ width: 40, height: 40 }}
+                    >
+                      <MusicNote />
+                    </Avatar>
+                  ) : isCurrentTrack ? (
                     <VolumeUp color="primary" />
                   ) : (
                     <MusicNote color="action" />
@@ -160,7 +185,7 @@ const Playlist: React.FC<PlaylistProps> = ({
                   edge="end"
                   onClick={(e) => {
                     e.stopPropagation();
-                    onPlayTrack(index);
+                    onPlayTrack(track.id);
                   }}
                   size="small"
                   sx={{ mr: 1 }}
@@ -3,29 +3,277 @@
 Enhanced Music Player implementation using VLC
 """
 import os
+import threading
 import vlc
-from typing import List, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List, Optional, Tuple
+
+from artwork import ArtworkStore
+from database import TrackMetadata, file_signature
+from playlist import IndexedPlaylist, PlaylistEdit
+
+_shared_instance: Optional[vlc.Instance] = None
+_shared_lock = threading.Lock()
+
+
+def new_instance() -> vlc.Instance:
+    """Create a libVLC instance; this is where the plugins get loaded"""
+    return vlc.Instance('--intf', 'dummy')
+
+
+def shared_instance() -> vlc.Instance:
+    """The process-wide libVLC instance, created on first call"""
+    global _shared_instance
+    with _shared_lock:
+        if _shared_instance is None:
+            _shared_instance = new_instance()
+        return _shared_instance
+
+
+_probe_local = threading.local()
+
+
+def probe_instance() -> vlc.Instance:
+    """The calling thread's own libVLC instance, for probing files
+
+    Probe threads parse with these so they never touch the instance the
+    players are driven through.
+    """
+    instance = getattr(_probe_local, "instance", None)
+    if instance is None:
+        instance = _probe_local.instance = new_instance()
+    return instance
+
+
+# Where probing stores the covers it finds
+_artwork = ArtworkStore()
+
+# libVLC amplifies above 100; normalization gains are already limited so
+# that a track's peak can't clip
+MAX_OUTPUT_VOLUME = 200
+
+
+def probe_file(instance, file_path: str, display_name: Optional[str] = None) -> Optional[TrackMetadata]:
+    """Parse a file with libVLC and return its metadata
+
+    The cover embedded in its tags, if any, is stored in the artwork store.
+    display_name is used for the title fallback when the file is stored
+    under a name that isn't meaningful (e.g. a content hash).
+    """
+    signature = file_signature(file_path)
+    if signature is None:
+        return None
+
+    media = instance.media_new(file_path)
+    media.parse()
+    duration = media.get_duration() / 1000.0 if media.get_duration() > 0 else None
+    filename = display_name or os.path.basename(file_path)
+    title = media.get_meta(vlc.Meta.Title)
+    if not title or title in (filename, os.path.basename(file_path)):
+        title = os.path.splitext(filename)[0]
+
+    # libVLC reads ID3, Vorbis comments and MP4 atoms alike
+    tags = {
+        field: (media.get_meta(meta) or "").strip() or None
+        for field, meta in (
+            ("artist", vlc.Meta.Artist), ("album", vlc.Meta.Album), ("genre", vlc.Meta.Genre),
+        )
+    }
+
+    codec = None
+    bitrate = None
+    for track in media.tracks_get() or []:
+        if track.type == vlc.TrackType.audio:
+            codec = track.codec.to_bytes(4, "little").decode("ascii", "ignore").strip() or None
+            bitrate = track.bitrate or None
+            break
+    media.release()
+
+    mtime, size = signature
+    return TrackMetadata(
+        path=file_path,
+        mtime=mtime,
+        size=size,
+        title=title,
+        duration=duration,
+        codec=codec,
+        bitrate=bitrate,
+        artwork=_artwork.extract(file_path),
+        **tags,
+    )
+
 
 class MusicPlayer:
-    def __init__(self):
-        """Initialize the music player"""
-        self.instance = vlc.Instance('--intf', 'dummy')
-        self.player = self.instance.media_player_new()
-        self.playlist: List[str] = []
-        self.current_index = 0
+    def __init__(self, gapless: bool = False, prebuffer_seconds: float = 5.0,
+                 crossfade_seconds: float = 0.0, instance: Optional[vlc.Instance] = None,
+                 instance_factory: Optional[Callable[[], vlc.Instance]] = None):
+        """Initialize the music player
+
+        libVLC is only started on the first playback call (or probe), so
+        constructing a player is cheap. Several players can share one
+        instance, passed directly or through `instance_factory` (e.g.
+        shared_instance); each then only costs its two MediaPlayers.
+
+        In gapless mode the next track is opened and buffered on a second,
+        paused MediaPlayer `prebuffer_seconds` before the current one ends,
+        and the two players are swapped when it does. With a crossfade the
+        standby player starts early and the volumes are ramped on each
+        time-changed event.
+        """
+        self._instance = instance
+        self._instance_factory = instance_factory or new_instance
+        self._player = None
+        self._standby_player = None
+        self._vlc_lock = threading.RLock()
+        self._callbacks: List[Tuple[Any, Callable]] = []
+        self.playlist = IndexedPlaylist()
+        self.current_id: Optional[int] = None
         self.volume = 80
-        self.player.audio_set_volume(self.volume)
+        self.normalize = False
+
+        self.gapless = gapless
+        self.prebuffer_seconds = prebuffer_seconds
+        self.crossfade_seconds = crossfade_seconds
+        self.repeat = False
+        # Where play() resumes the current track after a restore
+        self._resume_ms = 0
+        self._preloaded_id: Optional[int] = None
+        self._preloading = False
+        self._fading = False
+
+        # libVLC must not be driven from inside its own event callbacks, so
+        # follow-up work is handed to a single dispatch thread
+        self._dispatcher = ThreadPoolExecutor(max_workers=1, thread_name_prefix="player")
+        self.dispatch: Callable[..., Any] = self._dispatcher.submit
+
+        self.on(vlc.EventType.MediaPlayerEndReached, self._on_end_reached)
+        self.on(vlc.EventType.MediaPlayerTimeChanged, self._on_time_changed)
+
+    @property
+    def instance(self) -> vlc.Instance:
+        if self._instance is None:
+            with self._vlc_lock:
+                if self._instance is None:
+                    self._instance = self._instance_factory()
+        return self._instance
+
+    @property
+    def player(self) -> vlc.MediaPlayer:
+        """The active MediaPlayer; libVLC is started on first access"""
+        if self._player is None:
+            self._start_vlc()
+        return self._player
+
+    @player.setter
+    def player(self, media_player: vlc.MediaPlayer):
+        self._player = media_player
+
+    @property
+    def _standby(self) -> vlc.MediaPlayer:
+        if self._standby_player is None:
+            self._start_vlc()
+        return self._standby_player
+
+    @_standby.setter
+    def _standby(self, media_player: vlc.MediaPlayer):
+        self._standby_player = media_player
+
+    @property
+    def vlc_started(self) -> bool:
+        return self._player is not None
+
+    def _start_vlc(self):
+        """Create the MediaPlayers and attach the registered callbacks"""
+        with self._vlc_lock:
+            if self._player is not None:
+                return
+            player = self.instance.media_player_new()
+            standby = self.instance.media_player_new()
+            for event_type, callback in self._callbacks:
+                self._attach(player, event_type, callback)
+                self._attach(standby, event_type, callback)
+            player.audio_set_volume(self.track_volume(self.get_current_track()))
+            self._standby_player = standby
+            self._player = player
+
+    def on(self, event_type, callback: Callable):
+        """Attach a libVLC event callback that only fires for the active player"""
+        with self._vlc_lock:
+            self._callbacks.append((event_type, callback))
+            if self._player is not None:
+                self._attach(self._player, event_type, callback)
+                self._attach(self._standby_player, event_type, callback)
+
+    def _attach(self, media_player, event_type, callback: Callable):
+        media_player.event_manager().event_attach(
+            event_type, self._forward_event, callback, media_player
+        )
+
+    def _forward_event(self, event, callback: Callable, media_player):
+        if media_player is self._player:
+            callback(event)
+
+    def track_changed(self):
+        """Called after the current track changes; subclasses hook in here"""
+
+    def playlist_edited(self, edits: List[PlaylistEdit]):
+        """Called after the playlist is edited; subclasses hook in here (e.g. to journal)"""
+
+    def track_gain(self, file_path: str) -> Optional[float]:
+        """Normalization gain in dB for a track, if known; subclasses hook in here"""
+        return None
+
+    def track_volume(self, file_path: Optional[str]) -> int:
+        """Output volume for a track, with its normalization gain when enabled"""
+        if not self.normalize or file_path is None:
+            return self.volume
+        gain = self.track_gain(file_path)
+        if gain is None:
+            return self.volume
+        return max(0, min(MAX_OUTPUT_VOLUME, round(self.volume * 10 ** (gain / 20))))
+
+    @property
+    def current_index(self) -> int:
+        """Position of the current track (0 if none has been selected)"""
+        if self.current_id is None or not self.playlist.has_id(self.current_id):
+            return 0
+        return self.playlist.position_of(self.current_id)
+
+    @current_index.setter
+    def current_index(self, index: int):
+        if 0 <= index < len(self.playlist):
+            self.current_id = self.playlist.id_at(index)
+        else:
+            self.current_id = None
         
-    def add(self, file_paths: List[str]):
-        """Add files to the playlist"""
+    def add(self, file_paths: List[str]) -> List[int]:
+        """Add files to the playlist; returns the IDs of the tracks added"""
+        new_paths = []
+        seen = set()
         for path in file_paths:
-            if os.path.exists(path) and path not in self.playlist:
-                self.playlist.append(path)
+            if path not in self.playlist and path not in seen and os.path.exists(path):
+                new_paths.append(path)
+                seen.add(path)
+        track_ids = self.playlist.extend(new_paths)
+        if track_ids:
+            self.playlist_edited([
+                ("add", track_id, path, None) for track_id, path in zip(track_ids, new_paths)
+            ])
+        return track_ids
     
-    def add_single(self, file_path: str):
-        """Add a single file to the playlist"""
-        if os.path.exists(file_path) and file_path not in self.playlist:
-            self.playlist.append(file_path)
+    def add_single(self, file_path: str) -> Optional[int]:
+        """Add a single file to the playlist; returns its track ID"""
+        if file_path in self.playlist:
+            return self.playlist.id_of_path(file_path)
+        if not os.path.exists(file_path):
+            return None
+        track_id = self.playlist.append(file_path)
+        self.playlist_edited([("add", track_id, file_path, None)])
+        return track_id
+
+    def contains(self, file_path: str) -> bool:
+        """Check whether a path is already in the playlist"""
+        return file_path in self.playlist
     
     def play_or_pause(self):
         """Toggle play/pause"""
@@ -40,46 +288,151 @@ class MusicPlayer:
             return
             
         if self.player.get_media() is None:
-            self.play_index(self.current_index)
+            start_ms, self._resume_ms = self._resume_ms, 0
+            self.play_index(self.current_index, start_ms)
         else:
             self.player.play()
     
-    def play_index(self, index: int):
-        """Play track at specific index"""
+    def play_index(self, index: int, start_ms: int = 0):
+        """Play track at specific index, optionally from start_ms in"""
         if not self.playlist or index < 0 or index >= len(self.playlist):
             return
             
+        self._discard_preload()
         self.current_index = index
+        self._resume_ms = 0
         media = self.instance.media_new(self.playlist[index])
+        if start_ms > 0:
+            media.add_option(f':start-time={start_ms / 1000:.3f}')
         self.player.set_media(media)
+        self.player.audio_set_volume(self.track_volume(self.playlist[index]))
         self.player.play()
+        self.track_changed()
+
+    def play_id(self, track_id: int):
+        """Play track with the given ID"""
+        if self.playlist.has_id(track_id):
+            self.play_index(self.playlist.position_of(track_id))
     
     def pause(self):
         """Pause playback"""
-        self.player.pause()
+        if self.vlc_started:
+            self.player.pause()
     
     def stop(self):
         """Stop playback"""
+        if not self.vlc_started:
+            return
+        self._discard_preload()
         self.player.stop()
     
     def next(self):
         """Play next track"""
         if not self.playlist:
             return
-        self.current_index = (self.current_index + 1) % len(self.playlist)
-        self.play_index(self.current_index)
+        self.play_index((self.current_index + 1) % len(self.playlist))
     
     def previous(self):
         """Play previous track"""
         if not self.playlist:
             return
-        self.current_index = (self.current_index - 1) % len(self.playlist)
-        self.play_index(self.current_index)
+        self.play_index((self.current_index - 1) % len(self.playlist))
     
-    def set_volume(self, volume: int):
-        """Set volume (0-100)"""
+    def _next_position(self) -> Optional[int]:
+        """Position auto-advance moves to, or None at the end of the playlist"""
+        if not self.playlist:
+            return None
+        position = self.current_index + 1
+        if position >= len(self.playlist):
+            return 0 if self.repeat else None
+        return position
+
+    def _on_end_reached(self, event):
+        self.dispatch(self._advance)
+
+    def _on_time_changed(self, event):
+        if not self.gapless:
+            return
+        length = self.player.get_length()
+        if length <= 0:
+            return
+        remaining = length - event.u.new_time
+        # Preloading must finish before a crossfade can start
+        lead = max(self.prebuffer_seconds, self.crossfade_seconds + 1.0) * 1000
+        if self._preloaded_id is None and not self._preloading and remaining <= lead:
+            self._preloading = True
+            self.dispatch(self._preload_next)
+        elif self.crossfade_seconds > 0 and self._preloaded_id is not None \
+                and remaining <= self.crossfade_seconds * 1000:
+            self.dispatch(self._crossfade_step, remaining)
+
+    def _preload_next(self):
+        """Open the next track paused on the standby player"""
+        try:
+            position = self._next_position()
+            if position is None:
+                return
+            media = self.instance.media_new(self.playlist[position])
+            media.add_option(':start-paused')
+            self._standby.set_media(media)
+            self._standby.audio_set_volume(
+                0 if self.crossfade_seconds > 0 else self.track_volume(self.playlist[position])
+            )
+            self._standby.play()
+            self._preloaded_id = self.playlist.id_at(position)
+        finally:
+            self._preloading = False
+
+    def _discard_preload(self):
+        if self._preloaded_id is not None or self._fading:
+            self._standby.stop()
+        self._preloaded_id = None
+        self._fading = False
+
+    def _crossfade_step(self, remaining: int):
+        if self._preloaded_id is None:
+            return
+        if not self._fading:
+            self._fading = True
+            self._standby.set_pause(0)
+        fraction = max(0.0, min(1.0, remaining / (self.crossfade_seconds * 1000)))
+        current_volume = self.track_volume(self.get_current_track())
+        next_volume = self.track_volume(self.playlist.path_of(self._preloaded_id))
+        self.player.audio_set_volume(int(current_volume * fraction))
+        self._standby.audio_set_volume(int(next_volume * (1.0 - fraction)))
+
+    def _advance(self):
+        """Move on to the next track once the current one has ended"""
+        position = self._next_position()
+        expected_id = self.playlist.id_at(position) if position is not None else None
+        if self._preloaded_id is not None and self._preloaded_id == expected_id:
+            finished = self.player
+            self.player, self._standby = self._standby, finished
+            if not self._fading:
+                self.player.set_pause(0)
+            self.player.audio_set_volume(self.track_volume(self.playlist.path_of(expected_id)))
+            self._preloaded_id = None
+            self._fading = False
+            finished.stop()
+            self.current_id = expected_id
+            self.track_changed()
+        elif position is not None:
+            self.play_index(position)
+        else:
+            self._discard_preload()
+
+    def set_volume(self, volume: int, normalize: Optional[bool] = None):
+        """Set volume (0-100)
+
+        `normalize` switches ReplayGain-style normalization on or off: each
+        track's precomputed gain (see track_gain) is applied on top of the
+        volume, so nothing is analysed at play time.
+        """
         self.volume = max(0, min(100, volume))
-        self.player.audio_set_volume(self.volume)
+        if normalize is not None:
+            self.normalize = normalize
+        if self.vlc_started:
+            self.player.audio_set_volume(self.track_volume(self.get_current_track()))
     
     def get_current_track(self) -> Optional[str]:
         """Get current track path"""
@@ -89,33 +442,84 @@ class MusicPlayer:
     
     def get_playlist(self) -> List[str]:
         """Get playlist"""
-        return self.playlist.copy()
+        return self.playlist.paths()
     
     def clear_playlist(self):
         """Clear the playlist"""
         self.stop()
         self.playlist.clear()
-        self.current_index = 0
+        self.current_id = None
+        self._resume_ms = 0
+        self.playlist_edited([("clear", None, None, None)])
     
     def remove_track(self, index: int):
         """Remove track at index"""
         if 0 <= index < len(self.playlist):
-            self.playlist.pop(index)
-            if self.current_index >= len(self.playlist):
-                self.current_index = max(0, len(self.playlist) - 1)
+            self.remove_id(self.playlist.id_at(index))
+
+    def remove_id(self, track_id: int) -> Optional[str]:
+        """Remove track by ID; returns its path"""
+        if not self.playlist.has_id(track_id):
+            return None
+        if track_id == self.current_id:
+            # The track that slides into this position becomes current
+            position = self.playlist.position_of(track_id)
+            path = self.playlist.remove(track_id)
+            self.current_index = min(position, len(self.playlist) - 1)
+            self._resume_ms = 0
+        else:
+            path = self.playlist.remove(track_id)
+        self.playlist_edited([("remove", track_id, None, None)])
+        return path
+
+    def move_track(self, track_id: int, position: int) -> bool:
+        """Move a track to a new position"""
+        if not self.playlist.has_id(track_id):
+            return False
+        self.playlist.move(track_id, position)
+        self.playlist_edited([("move", track_id, None, position)])
+        return True
     
     def is_playing(self) -> bool:
         """Check if currently playing"""
-        return self.player.get_state() == vlc.State.Playing
+        return self.vlc_started and self.player.get_state() == vlc.State.Playing
     
     def is_paused(self) -> bool:
         """Check if currently paused"""
-        return self.player.get_state() == vlc.State.Paused
+        return self.vlc_started and self.player.get_state() == vlc.State.Paused
     
     def get_position(self) -> float:
         """Get playback position (0.0 to 1.0)"""
-        return self.player.get_position()
+        return self.player.get_position() if self.vlc_started else 0.0
     
     def get_length(self) -> int:
         """Get track length in milliseconds"""
-        return self.player.get_length()
\ No newline at end of file
+        return self.player.get_length() if self.vlc_started else 0
+
+    def get_time(self) -> int:
+        """Get playback time in milliseconds"""
+        return self.player.get_time() if self.vlc_started else 0
+
+    def warm_up(self):
+        """Start libVLC ahead of the first playback call"""
+        self._start_vlc()
+
+    def is_idle(self) -> bool:
+        """Neither playing nor paused"""
+        if not self.vlc_started:
+            return True
+        return self.player.get_state() not in (vlc.State.Playing, vlc.State.Paused)
+
+    def resume_position(self) -> int:
+        """Where the current track would resume, in milliseconds"""
+        if self.vlc_started and self.player.get_media() is not None:
+            return max(0, self.get_time())
+        return self._resume_ms
+
+    def release(self):
+        """Free the libVLC players; the shared instance is left alone"""
+        if self.vlc_started:
+            self.stop()
+            self._player.release()
+            self._standby_player.release()
+        self._dispatcher.shutdown(wait=False)
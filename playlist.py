@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+"""
+Indexed playlist with stable track IDs
+"""
+import random
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+# A recorded edit: (op, track_id, path, position), op being "add", "remove",
+# "move" or "clear"; fields an op doesn't use are None
+PlaylistEdit = Tuple[str, Optional[int], Optional[str], Optional[int]]
+
+
+class _Node:
+    __slots__ = ("id", "path", "priority", "left", "right", "parent", "size")
+
+    def __init__(self, track_id: int, path: str):
+        self.id = track_id
+        self.path = path
+        self.priority = random.random()
+        self.left: Optional["_Node"] = None
+        self.right: Optional["_Node"] = None
+        self.parent: Optional["_Node"] = None
+        self.size = 1
+
+
+def _size(node: Optional[_Node]) -> int:
+    return node.size if node is not None else 0
+
+
+def _update(node: _Node):
+    node.size = 1 + _size(node.left) + _size(node.right)
+    if node.left is not None:
+        node.left.parent = node
+    if node.right is not None:
+        node.right.parent = node
+
+
+def _split(node: Optional[_Node], k: int) -> Tuple[Optional[_Node], Optional[_Node]]:
+    """Split into (first k nodes, the rest); both roots have no parent"""
+    if node is None:
+        return None, None
+    if _size(node.left) >= k:
+        left, right = _split(node.left, k)
+        node.left = right
+        _update(node)
+        node.parent = None
+        if left is not None:
+            left.parent = None
+        return left, node
+    left, right = _split(node.right, k - _size(node.left) - 1)
+    node.right = left
+    _update(node)
+    node.parent = None
+    if right is not None:
+        right.parent = None
+    return node, right
+
+
+def _merge(a: Optional[_Node], b: Optional[_Node]) -> Optional[_Node]:
+    """Concatenate two trees; every node of a comes before every node of b"""
+    if a is None:
+        return b
+    if b is None:
+        return a
+    if a.priority > b.priority:
+        a.right = _merge(a.right, b)
+        _update(a)
+        a.parent = None
+        return a
+    b.left = _merge(a, b.left)
+    _update(b)
+    b.parent = None
+    return b
+
+
+def _build(nodes: List[_Node]) -> Optional[_Node]:
+    """Build a treap from nodes already in order, in O(n)"""
+    stack: List[_Node] = []
+    for node in nodes:
+        last = None
+        while stack and stack[-1].priority < node.priority:
+            last = stack.pop()
+        node.left = last
+        if stack:
+            stack[-1].right = node
+        stack.append(node)
+    if not stack:
+        return None
+    # Sizes must be fixed bottom-up, so walk the tree in post-order
+    root = stack[0]
+    pending = [(root, False)]
+    while pending:
+        node, children_done = pending.pop()
+        if children_done:
+            _update(node)
+            continue
+        pending.append((node, True))
+        if node.left is not None:
+            pending.append((node.left, False))
+        if node.right is not None:
+            pending.append((node.right, False))
+    root.parent = None
+    return root
+
+
+class IndexedPlaylist:
+    """Ordered playlist backed by an implicit treap.
+
+    Tracks get an ID when added that never changes or gets reused, so
+    clients can refer to tracks safely while others edit the list. Lookups
+    by ID or path are O(1); position lookups, inserts, moves and removals
+    are O(log n).
+    """
+
+    def __init__(self, paths: Iterable[str] = ()):
+        self._root: Optional[_Node] = None
+        self._by_id: Dict[int, _Node] = {}
+        self._by_path: Dict[str, _Node] = {}
+        self._next_id = 0
+        # Bumped on every edit so clients can cheaply tell if anything changed
+        self.version = 0
+        self.extend(paths)
+
+    def __len__(self) -> int:
+        return _size(self._root)
+
+    def __contains__(self, path: str) -> bool:
+        return path in self._by_path
+
+    def __iter__(self) -> Iterator[str]:
+        for _, path in self.items():
+            yield path
+
+    def __getitem__(self, position: int) -> str:
+        return self._node_at(position).path
+
+    def _new_node(self, path: str) -> _Node:
+        if path in self._by_path:
+            raise ValueError(f"Already in playlist: {path}")
+        node = _Node(self._next_id, path)
+        self._next_id += 1
+        self._by_id[node.id] = node
+        self._by_path[path] = node
+        return node
+
+    def _node_at(self, position: int) -> _Node:
+        if position < 0:
+            position += len(self)
+        if not 0 <= position < len(self):
+            raise IndexError("playlist index out of range")
+        node = self._root
+        while True:
+            left = _size(node.left)
+            if position < left:
+                node = node.left
+            elif position == left:
+                return node
+            else:
+                position -= left + 1
+                node = node.right
+
+    def append(self, path: str) -> int:
+        """Add a track at the end; returns its ID"""
+        node = self._new_node(path)
+        self._root = _merge(self._root, node)
+        self.version += 1
+        return node.id
+
+    def extend(self, paths: Iterable[str]) -> List[int]:
+        """Append many tracks at once in O(n + log n); returns their IDs"""
+        nodes = [self._new_node(path) for path in paths]
+        if nodes:
+            self._root = _merge(self._root, _build(nodes))
+            self.version += 1
+        return [node.id for node in nodes]
+
+    def insert(self, position: int, path: str) -> int:
+        """Insert a track before position; returns its ID"""
+        node = self._new_node(path)
+        position = max(0, min(position, len(self)))
+        left, right = _split(self._root, position)
+        self._root = _merge(_merge(left, node), right)
+        self.version += 1
+        return node.id
+
+    def remove(self, track_id: int) -> str:
+        """Remove a track by ID; returns its path"""
+        node = self._by_id[track_id]
+        position = self.position_of(track_id)
+        left, right = _split(self._root, position)
+        _, right = _split(right, 1)
+        self._root = _merge(left, right)
+        del self._by_id[track_id]
+        del self._by_path[node.path]
+        node.left = node.right = node.parent = None
+        self.version += 1
+        return node.path
+
+    def move(self, track_id: int, position: int):
+        """Move a track so that it ends up at position"""
+        node = self._by_id[track_id]
+        current = self.position_of(track_id)
+        left, right = _split(self._root, current)
+        _, right = _split(right, 1)
+        rest = _merge(left, right)
+        node.left = node.right = node.parent = None
+        node.size = 1
+        position = max(0, min(position, _size(rest)))
+        left, right = _split(rest, position)
+        self._root = _merge(_merge(left, node), right)
+        self.version += 1
+
+    def clear(self):
+        """Remove every track; IDs are not reused"""
+        self._root = None
+        self._by_id.clear()
+        self._by_path.clear()
+        self.version += 1
+
+    @property
+    def next_id(self) -> int:
+        """The ID the next added track will get"""
+        return self._next_id
+
+    def restore(self, items: Iterable[Tuple[int, str]], next_id: int = 0, version: int = 0):
+        """Replace the contents with (id, path) pairs, keeping their IDs
+
+        `next_id` and `version` carry the counters over from the playlist
+        the items came from, so IDs are never reused and versions never
+        repeat.
+        """
+        self.clear()
+        nodes = []
+        for track_id, path in items:
+            node = _Node(track_id, path)
+            self._by_id[track_id] = node
+            self._by_path[path] = node
+            nodes.append(node)
+            self._next_id = max(self._next_id, track_id + 1)
+        self._next_id = max(self._next_id, next_id)
+        self._root = _build(nodes)
+        self.version = max(self.version, version) + 1
+
+    def apply(self, edit: PlaylistEdit):
+        """Replay a recorded edit; added tracks keep their recorded IDs"""
+        op, track_id, path, position = edit
+        if op == "add":
+            if path in self._by_path or track_id in self._by_id:
+                raise ValueError(f"Already in playlist: {path}")
+            node = _Node(track_id, path)
+            self._by_id[track_id] = node
+            self._by_path[path] = node
+            self._next_id = max(self._next_id, track_id + 1)
+            if position is None:
+                self._root = _merge(self._root, node)
+            else:
+                left, right = _split(self._root, max(0, min(position, len(self))))
+                self._root = _merge(_merge(left, node), right)
+            self.version += 1
+        elif op == "remove":
+            self.remove(track_id)
+        elif op == "move":
+            self.move(track_id, position)
+        elif op == "clear":
+            self.clear()
+        else:
+            raise ValueError(f"Unknown playlist edit: {op}")
+
+    def position_of(self, track_id: int) -> int:
+        """Current position of a track"""
+        node = self._by_id[track_id]
+        position = _size(node.left)
+        while node.parent is not None:
+            if node is node.parent.right:
+                position += _size(node.parent.left) + 1
+            node = node.parent
+        return position
+
+    def id_at(self, position: int) -> int:
+        """ID of the track at position"""
+        return self._node_at(position).id
+
+    def path_of(self, track_id: int) -> Optional[str]:
+        node = self._by_id.get(track_id)
+        return node.path if node is not None else None
+
+    def id_of_path(self, path: str) -> Optional[int]:
+        node = self._by_path.get(path)
+        return node.id if node is not None else None
+
+    def has_id(self, track_id: int) -> bool:
+        return track_id in self._by_id
+
+    def items(self, start: int = 0, stop: Optional[int] = None) -> Iterator[Tuple[int, str]]:
+        """Yield (id, path) in playlist order for positions [start, stop)"""
+        total = len(self)
+        stop = total if stop is None else min(stop, total)
+        if start >= stop:
+            return
+        # Descend to the start position, keeping the ancestors still to visit
+        stack: List[_Node] = []
+        node = self._root
+        position = start
+        while node is not None:
+            left = _size(node.left)
+            if position < left:
+                stack.append(node)
+                node = node.left
+            elif position == left:
+                stack.append(node)
+                break
+            else:
+                position -= left + 1
+                node = node.right
+        remaining = stop - start
+        while stack and remaining:
+            node = stack.pop()
+            yield node.id, node.path
+            remaining -= 1
+            node = node.right
+            while node is not None:
+                stack.append(node)
+                node = node.left
+
+    def paths(self) -> List[str]:
+        """All paths in order"""
+        return [path for _, path in self.items()]
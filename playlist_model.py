@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+"""
+Qt list model over a MusicPlayer's playlist for the desktop app
+"""
+import os
+from typing import Callable, Dict, List, Optional, Set
+
+from PySide6.QtCore import QAbstractListModel, QModelIndex, QObject, QRunnable, QThreadPool, QTimer, Qt, Signal
+from PySide6.QtGui import QFont, QImage, QPixmap
+
+from artwork import ArtworkStore
+from database import TrackMetadata
+from music_player import MusicPlayer
+
+# Rows handed to the view per fetchMore(); a view only asks for more as the
+# user scrolls towards the end
+FETCH_BATCH = 500
+
+# Paths probed per background task
+LOAD_BATCH = 32
+
+# Paths added to the player per event-loop pass; a batch takes about 15 ms
+# (mostly checking the files exist), so input keeps flowing
+ADD_BATCH = 2000
+
+# Side of the covers shown next to each row, in pixels
+COVER_SIZE = 32
+
+PathRole = Qt.UserRole
+IdRole = Qt.UserRole + 1
+
+
+def display_title(path: str, meta: Optional[TrackMetadata]) -> str:
+    if meta is None:
+        return os.path.splitext(os.path.basename(path))[0]
+    if meta.artist:
+        return f"{meta.artist} – {meta.title}"
+    return meta.title
+
+
+def load_cover(path: str) -> Optional[QImage]:
+    """A cover scaled down to COVER_SIZE; QImage, unlike QPixmap, can be built off the UI thread"""
+    image = QImage(path)
+    if image.isNull():
+        return None
+    return image.scaled(COVER_SIZE, COVER_SIZE, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+
+
+class _LoadSignals(QObject):
+    # [(path, title, artwork name, cover)], emitted from a pool thread and delivered on the model's
+    loaded = Signal(list)
+
+
+class _LoadTask(QRunnable):
+    def __init__(self, paths: List[str], load: Callable[[str], Optional[TrackMetadata]],
+                 signals: _LoadSignals, artwork: ArtworkStore, covers: Dict[str, QPixmap]):
+        super().__init__()
+        self.paths = paths
+        self.load = load
+        self.signals = signals
+        self.artwork = artwork
+        self.covers = covers
+
+    def run(self):
+        titles = []
+        loaded: Dict[str, Optional[QImage]] = {}
+        for path in self.paths:
+            try:
+                meta = self.load(path)
+            except Exception:
+                meta = None
+            name = meta.artwork if meta is not None else None
+            cover = None
+            # Tracks of an album share a cover: load it once
+            if name is not None and name not in self.covers:
+                if name not in loaded:
+                    loaded[name] = load_cover(self.artwork.path(name))
+                cover = loaded[name]
+            titles.append((path, display_title(path, meta), name, cover))
+        self.signals.loaded.emit(titles)
+
+
+class PlaylistModel(QAbstractListModel):
+    """The player's playlist as a lazily populated list model.
+
+    Rows are handed to the view FETCH_BATCH at a time through
+    canFetchMore()/fetchMore(), so adding tens of thousands of tracks
+    costs the UI thread one batch of rows rather than one item per track,
+    and the tracks themselves are added ADD_BATCH per event-loop pass.
+    A row shows its file name until `load` (run on a QThreadPool, only for
+    rows the view has actually asked for) returns its metadata; then just
+    that row is signalled as changed, with its title and cover. The current
+    track is shown in bold.
+
+    Edit the playlist through the model (add_paths, remove_rows, move_row,
+    clear) so that views hear about every change.
+    """
+
+    def __init__(self, player: MusicPlayer, load: Callable[[str], Optional[TrackMetadata]],
+                 parent: Optional[QObject] = None, max_threads: int = 2):
+        super().__init__(parent)
+        self.player = player
+        self.load = load
+        self._loaded = 0
+        self._titles: Dict[str, str] = {}
+        self._artwork = ArtworkStore()
+        # Artwork name per path, and one scaled pixmap per artwork name
+        self._cover_names: Dict[str, str] = {}
+        self._covers: Dict[str, QPixmap] = {}
+        # Shown by rows without a cover, so every row is the same height
+        self._no_cover = QPixmap(COVER_SIZE, COVER_SIZE)
+        self._no_cover.fill(Qt.transparent)
+        self._requested: Set[str] = set()
+        self._queue: List[str] = []
+        self._to_add: List[str] = []
+        self._current_id = player.current_id
+        self._pool = QThreadPool(self)
+        self._pool.setMaxThreadCount(max_threads)
+        self._signals = _LoadSignals(self)
+        self._signals.loaded.connect(self._on_loaded)
+        self._bold = QFont()
+        self._bold.setBold(True)
+
+    # ---- QAbstractListModel ----
+
+    def rowCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        return 0 if parent.isValid() else self._loaded
+
+    def canFetchMore(self, parent: QModelIndex = QModelIndex()) -> bool:
+        return not parent.isValid() and self._loaded < len(self.player.playlist)
+
+    def fetchMore(self, parent: QModelIndex = QModelIndex()):
+        if parent.isValid():
+            return
+        total = len(self.player.playlist)
+        count = min(FETCH_BATCH, total - self._loaded)
+        if count <= 0:
+            return
+        self.beginInsertRows(QModelIndex(), self._loaded, self._loaded + count - 1)
+        self._loaded += count
+        self.endInsertRows()
+
+    def data(self, index: QModelIndex, role: int = Qt.DisplayRole):
+        if not index.isValid() or not 0 <= index.row() < self._loaded:
+            return None
+        track_id = self.player.playlist.id_at(index.row())
+        path = self.player.playlist.path_of(track_id)
+        if role == Qt.DisplayRole:
+            title = self._titles.get(path)
+            if title is None:
+                self._request(path)
+                title = display_title(path, None)
+            return title
+        if role == Qt.DecorationRole:
+            return self._covers.get(self._cover_names.get(path), self._no_cover)
+        if role == Qt.ToolTipRole:
+            return path
+        if role == Qt.FontRole and track_id == self._current_id:
+            return self._bold
+        if role == PathRole:
+            return path
+        if role == IdRole:
+            return track_id
+        return None
+
+    # ---- Background metadata ----
+
+    def _request(self, path: str):
+        if path in self._requested:
+            return
+        self._requested.add(path)
+        if not self._queue:
+            # Collect every row painted in this pass into as few tasks as possible
+            QTimer.singleShot(0, self._flush)
+        self._queue.append(path)
+
+    def _flush(self):
+        queue, self._queue = self._queue, []
+        for start in range(0, len(queue), LOAD_BATCH):
+            self._pool.start(_LoadTask(
+                queue[start:start + LOAD_BATCH], self.load, self._signals, self._artwork, self._covers,
+            ))
+
+    def _on_loaded(self, titles: list):
+        rows = []
+        for path, title, name, cover in titles:
+            self._titles[path] = title
+            if name is not None:
+                self._cover_names[path] = name
+                if cover is not None and name not in self._covers:
+                    self._covers[name] = QPixmap.fromImage(cover)
+            row = self._row_of_path(path)
+            if row is not None:
+                rows.append(row)
+        self._emit_rows_changed(rows, [Qt.DisplayRole, Qt.DecorationRole])
+
+    def _row_of_path(self, path: str) -> Optional[int]:
+        track_id = self.player.playlist.id_of_path(path)
+        if track_id is None:
+            return None
+        row = self.player.playlist.position_of(track_id)
+        return row if row < self._loaded else None
+
+    def _emit_rows_changed(self, rows: List[int], roles: List[int]):
+        """One dataChanged per run of consecutive rows"""
+        rows = sorted(set(rows))
+        start = 0
+        for i in range(1, len(rows) + 1):
+            if i == len(rows) or rows[i] != rows[i - 1] + 1:
+                self.dataChanged.emit(self.index(rows[start]), self.index(rows[i - 1]), roles)
+                start = i
+
+    # ---- Edits ----
+
+    def add_paths(self, paths: List[str]):
+        """Queue files to be added to the playlist, a batch per event-loop pass"""
+        if not self._to_add:
+            QTimer.singleShot(0, self._add_batch)
+        self._to_add.extend(paths)
+
+    def _add_batch(self):
+        batch, self._to_add = self._to_add[:ADD_BATCH], self._to_add[ADD_BATCH:]
+        was_complete = self._loaded == len(self.player.playlist)
+        track_ids = self.player.add(batch)
+        if track_ids and was_complete and self._loaded < FETCH_BATCH:
+            # Views only fetch more while scrolling, so a short list shows
+            # its first new rows right away
+            self.fetchMore()
+        if self._to_add:
+            QTimer.singleShot(0, self._add_batch)
+
+    def remove_rows(self, rows: List[int]):
+        """Remove the tracks at these rows"""
+        for row in sorted(set(rows), reverse=True):
+            if not 0 <= row < self._loaded:
+                continue
+            track_id = self.player.playlist.id_at(row)
+            self.beginRemoveRows(QModelIndex(), row, row)
+            self.player.remove_id(track_id)
+            self._loaded -= 1
+            self.endRemoveRows()
+        self.refresh_current()
+
+    def move_row(self, row: int, position: int):
+        """Move the track at row so that it ends up at position"""
+        if not (0 <= row < self._loaded and 0 <= position < self._loaded) or row == position:
+            return
+        # beginMoveRows takes the destination in pre-move rows
+        destination = position + 1 if position > row else position
+        self.beginMoveRows(QModelIndex(), row, row, QModelIndex(), destination)
+        self.player.move_track(self.player.playlist.id_at(row), position)
+        self.endMoveRows()
+
+    def clear(self):
+        """Empty the playlist, including files still waiting to be added"""
+        self._to_add = []
+        self.beginResetModel()
+        self.player.clear_playlist()
+        self._loaded = 0
+        self._current_id = None
+        self.endResetModel()
+
+    def reset(self):
+        """Start over after the player's playlist was replaced wholesale"""
+        self.beginResetModel()
+        self._loaded = 0
+        self._current_id = self.player.current_id
+        self.endResetModel()
+        self.fetchMore()
+
+    def refresh_current(self):
+        """Restyle the rows of the previous and the new current track"""
+        previous, self._current_id = self._current_id, self.player.current_id
+        if previous == self._current_id:
+            return
+        rows = []
+        for track_id in (previous, self._current_id):
+            if track_id is not None and self.player.playlist.has_id(track_id):
+                row = self.player.playlist.position_of(track_id)
+                if row < self._loaded:
+                    rows.append(row)
+        self._emit_rows_changed(rows, [Qt.FontRole])
+
+    def current_row(self) -> Optional[int]:
+        """Row of the current track, if the view has loaded it"""
+        if self._current_id is None or not self.player.playlist.has_id(self._current_id):
+            return None
+        row = self.player.playlist.position_of(self._current_id)
+        return row if row < self._loaded else None
+
+    def shutdown(self):
+        """Drop queued metadata loads and wait for the running ones"""
+        self._pool.clear()
+        self._pool.waitForDone()
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Player that drives the playback daemon over its local socket
+"""
+from typing import Any, Callable, Dict, List, Optional
+
+from database import TrackMetadata
+from ipc import IPCClient
+from playlist import IndexedPlaylist
+
+
+class RemotePlayer:
+    """Stands in for a MusicPlayer whose playback runs in the daemon.
+
+    Keeps a copy of the daemon's playlist so views can read it without a
+    round trip per row. Edits are sent to the daemon and applied to the
+    copy from its reply; edits made by other clients arrive as events, and
+    handle_event() then fetches a fresh snapshot, but only if the daemon's
+    playlist version moved on from the one last seen. A reply whose
+    version isn't the one right after the last seen means another client
+    edited in between, so the copy is replaced by a snapshot at once.
+
+    `on_event(type, data)` is called on the client's reader thread; it
+    must hand events to the thread that owns this player (e.g. through a
+    Qt signal), which then calls handle_event().
+    """
+
+    def __init__(self, client: IPCClient):
+        self.client = client
+        self.playlist = IndexedPlaylist()
+        self.current_id: Optional[int] = None
+        self.volume = 80
+        self._remote_version: Optional[int] = None
+        self.on_track_changed: Callable[[], None] = lambda: None
+        self.on_resync: Callable[[], None] = lambda: None
+        # Subscribe first so no edit falls between the snapshot and the events
+        client.call("subscribe", 0)
+        self.sync()
+
+    @classmethod
+    def connect(cls, on_event: Callable[[str, Dict[str, Any]], None],
+                path: Optional[str] = None) -> Optional["RemotePlayer"]:
+        """A player for the running daemon, or None if there isn't one"""
+        client = IPCClient.connect(path, on_event=on_event)
+        if client is None:
+            return None
+        return cls(client)
+
+    # ---- Keeping the copy in step ----
+
+    def sync(self) -> bool:
+        """Fetch the daemon's playlist if it changed; returns True if it did"""
+        snapshot = self.client.call("snapshot", self._remote_version)
+        if snapshot is None:
+            return False
+        self.playlist.restore(
+            [tuple(item) for item in snapshot["items"]], snapshot["next_id"], self.playlist.version
+        )
+        self._remote_version = snapshot["version"]
+        self.current_id = snapshot["current_id"]
+        self.volume = snapshot["volume"]
+        return True
+
+    def _edited(self, result: Dict[str, Any], changed: bool = True):
+        """Take in the daemon's reply to one of our edits
+
+        Every edit that changes the playlist moves its version on by one.
+        """
+        expected = None
+        if self._remote_version is not None:
+            expected = self._remote_version + 1 if changed else self._remote_version
+        if result["version"] != expected:
+            previous = self.current_id
+            self._remote_version = None
+            self.sync()
+            self.on_resync()
+            if self.current_id != previous:
+                self.on_track_changed()
+            return
+        self._remote_version = result["version"]
+        if result["current_id"] != self.current_id:
+            self.current_id = result["current_id"]
+            self.on_track_changed()
+
+    def handle_event(self, event_type: str, data: Dict[str, Any]):
+        """Apply an event from the daemon; call on the thread that owns the player"""
+        if event_type == "playlist":
+            if self.sync():
+                self.on_resync()
+        elif event_type == "track":
+            track = data.get("current_track")
+            self.current_id = track["id"] if track else None
+            self.on_track_changed()
+        elif event_type == "volume":
+            self.volume = data["volume"]
+
+    @property
+    def connected(self) -> bool:
+        return self.client.connected
+
+    # ---- MusicPlayer interface ----
+
+    def add(self, file_paths: List[str]) -> List[int]:
+        result = self.client.call("add", list(file_paths))
+        for track_id, path in result["added"]:
+            self.playlist.apply(("add", track_id, path, None))
+        self._edited(result, changed=bool(result["added"]))
+        return [track_id for track_id, _ in result["added"]]
+
+    def remove_id(self, track_id: int) -> Optional[str]:
+        if not self.playlist.has_id(track_id):
+            return None
+        result = self.client.call("remove", track_id)
+        path = self.playlist.remove(track_id)
+        self._edited(result)
+        return path
+
+    def move_track(self, track_id: int, position: int) -> bool:
+        if not self.playlist.has_id(track_id):
+            return False
+        result = self.client.call("move", track_id, position)
+        self.playlist.move(track_id, position)
+        self._edited(result)
+        return True
+
+    def clear_playlist(self):
+        result = self.client.call("clear")
+        self.playlist.clear()
+        self._edited(result)
+
+    def play_index(self, index: int):
+        # By ID, so a row the daemon has since moved still plays the right track
+        if 0 <= index < len(self.playlist):
+            self.client.call("play_id", self.playlist.id_at(index))
+
+    def play_or_pause(self):
+        self.client.call("play_or_pause")
+
+    def stop(self):
+        self.client.call("stop")
+
+    def next(self):
+        self.client.call("next")
+
+    def previous(self):
+        self.client.call("previous")
+
+    def set_volume(self, volume: int):
+        self.client.call("volume", volume)
+        self.volume = volume
+
+    def download(self, url: str) -> Dict[str, Any]:
+        """Queue a download in the daemon; it adds the track when done"""
+        return self.client.call("download", url)
+
+    def probe(self, file_path: str) -> Optional[TrackMetadata]:
+        """Metadata from the daemon's cache, probed there if needed"""
+        meta = self.client.call("metadata", file_path)
+        return TrackMetadata(**meta) if meta is not None else None
+
+    def warm_up(self):
+        """Nothing to do: libVLC runs in the daemon"""
+
+    def release(self):
+        self.client.close()
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+API replicas: stateless worker processes in front of the one player owner
+"""
+import os
+import re
+import threading
+import time
+from typing import Any, Dict, Optional
+from urllib.parse import parse_qs
+
+from events import EventBus
+from ipc import IPCClient, runtime_path
+
+# MUSIC_PLAYER_ROLE: "standalone" serves everything from one process;
+# "owner" does the same and also publishes its players' state for
+# replicas; "replica" serves reads from that state and hands the rest over
+ROLES = ("standalone", "owner", "replica")
+
+# Position updates relayed from the owner, in ms; a WebSocket client asking
+# for a shorter tick gets this one
+RELAY_TICK = 250
+RECONNECT_DELAY = 1.0
+# Seconds a new subscriber waits for the relay before being sent a snapshot
+RELAY_WAIT = 2.0
+
+# Headers that describe one hop rather than the message
+HOP_BY_HOP = {b"connection", b"keep-alive", b"transfer-encoding", b"upgrade", b"host"}
+
+_ZONE_PREFIX = re.compile(r"^/zones/[^/]+(?=/)")
+_TRACK_CACHED = re.compile(r"^/track/\d+/(waveform|art)$")
+_ZONE = re.compile(r"^/zones/[^/]+$")
+
+
+def current_role() -> str:
+    role = os.environ.get("MUSIC_PLAYER_ROLE", "standalone")
+    if role not in ROLES:
+        raise ValueError(f"Unknown MUSIC_PLAYER_ROLE: {role}")
+    return role
+
+
+def owner_url() -> str:
+    """Where replicas reach the owner's HTTP API: http://host:port or unix:/path"""
+    return os.environ.get("MUSIC_PLAYER_OWNER_URL") or "unix:" + runtime_path("-http")
+
+
+def owner_only(method: str, path: str, query: str) -> bool:
+    """Whether a request needs state only the owner has
+
+    Uploads, downloads and scans run their jobs in the owner; transcodes,
+    waveforms and resized artwork come from its caches and worker pools; deleting zones
+    and playlists and listing live zones touch its players.
+    """
+    local = _ZONE_PREFIX.sub("", path, count=1)
+    if local.startswith(("/upload", "/download", "/library/", "/stream/cache")):
+        return True
+    if _TRACK_CACHED.match(local):
+        return True
+    if local.startswith("/stream/") and "format" in parse_qs(query):
+        return True
+    if method == "DELETE" and (path.startswith("/playlists/") or _ZONE.match(path)):
+        return True
+    return method == "GET" and path == "/zones"
+
+
+class OwnerProxy:
+    """ASGI app that forwards HTTP requests to the owner, streaming both ways"""
+
+    def __init__(self, url: str):
+        import httpx
+
+        self._httpx = httpx
+        transport = None
+        if url.startswith("unix:"):
+            transport = httpx.AsyncHTTPTransport(uds=url[len("unix:"):])
+            url = "http://owner"
+        self._client = httpx.AsyncClient(base_url=url, transport=transport, timeout=None)
+
+    async def __call__(self, scope, receive, send):
+        async def body():
+            while True:
+                message = await receive()
+                if message["type"] != "http.request":
+                    return
+                yield message.get("body", b"")
+                if not message.get("more_body"):
+                    return
+
+        target = scope.get("raw_path") or scope["path"].encode()
+        if scope.get("query_string"):
+            target += b"?" + scope["query_string"]
+        request = self._client.build_request(
+            scope["method"],
+            target.decode("latin-1"),
+            headers=[(name, value) for name, value in scope["headers"] if name.lower() not in HOP_BY_HOP],
+            content=body(),
+        )
+        try:
+            response = await self._client.send(request, stream=True)
+        except self._httpx.TransportError:
+            await send({
+                "type": "http.response.start",
+                "status": 502,
+                "headers": [(b"content-type", b"application/json")],
+            })
+            await send({"type": "http.response.body", "body": b'{"detail":"Player owner is unavailable"}'})
+            return
+        try:
+            await send({
+                "type": "http.response.start",
+                "status": response.status_code,
+                "headers": [(name, value) for name, value in response.headers.raw
+                            if name.lower() not in HOP_BY_HOP],
+            })
+            async for chunk in response.aiter_raw():
+                await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            await send({"type": "http.response.body", "body": b""})
+        finally:
+            await response.aclose()
+
+    async def close(self):
+        await self._client.aclose()
+
+
+class ReplicaEvents(EventBus):
+    """A zone's events relayed from the owner over its control socket.
+
+    The owner's stream is only subscribed to while someone here listens,
+    so a replica doesn't keep the owner's zone from being evicted.
+    """
+
+    def __init__(self, zone: str):
+        super().__init__()
+        self.zone = zone
+        self._client: Optional[IPCClient] = None
+        self._relaying = False
+        self._relay_lock = threading.Lock()
+        self._relayed = threading.Event()
+
+    def subscribe(self, tick_interval: Optional[float] = None):
+        sub = super().subscribe(tick_interval)
+        self._start_relay()
+        return sub
+
+    def wait_relayed(self, timeout: float = RELAY_WAIT) -> bool:
+        """Block until events flow from the owner, so a snapshot taken next misses none"""
+        return self._relayed.wait(timeout)
+
+    def unsubscribe(self, sub):
+        super().unsubscribe(sub)
+        if not self.has_subscribers():
+            with self._relay_lock:
+                self._relayed.clear()
+                client, self._client = self._client, None
+            if client is not None:
+                client.close()
+
+    def _start_relay(self):
+        with self._relay_lock:
+            if self._relaying or (self._client is not None and self._client.connected):
+                return
+            self._relaying = True
+        threading.Thread(target=self._relay, name=f"relay-{self.zone}", daemon=True).start()
+
+    def _relay(self):
+        try:
+            while self.has_subscribers():
+                client = IPCClient.connect(on_event=self._forward)
+                try:
+                    if client is None:
+                        raise ConnectionError("Player owner is not listening")
+                    client.call("use_zone", self.zone)
+                    client.call("subscribe", RELAY_TICK)
+                except Exception:
+                    if client is not None:
+                        client.close()
+                    time.sleep(RECONNECT_DELAY)
+                    continue
+                with self._relay_lock:
+                    if self.has_subscribers():
+                        self._client = client
+                        self._relayed.set()
+                        return
+                # The last subscriber left while this was connecting
+                client.close()
+                return
+        finally:
+            with self._relay_lock:
+                self._relaying = False
+
+    def _forward(self, event_type: str, data: Dict[str, Any]):
+        if event_type == "disconnected":
+            # The owner restarted; pick the stream up again once it's back
+            self._relayed.clear()
+            self._start_relay()
+        else:
+            self.publish(event_type, **data)
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""
+Parallel library scanner: bulk folder import with incremental rescans
+"""
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from database import MetadataCache, TrackMetadata
+from uploads import is_audio_file
+
+# Files handed to a worker process per task; large enough to amortise the
+# pickling round trip, small enough to keep progress updates flowing
+PROBE_BATCH_SIZE = 64
+
+# Minimum time between progress callbacks while walking the tree
+PROGRESS_INTERVAL = 0.25
+
+FINAL_STATUSES = ("done", "failed", "cancelled")
+
+# libVLC instance owned by each worker process
+_instance = None
+
+
+def _init_worker():
+    global _instance
+    import vlc
+    _instance = vlc.Instance('--intf', 'dummy')
+
+
+def _probe_batch(paths: List[str]) -> List[Tuple[str, Optional[TrackMetadata]]]:
+    """Probe a batch of files in a worker process"""
+    from music_player import probe_file
+
+    results = []
+    for path in paths:
+        try:
+            results.append((path, probe_file(_instance, path)))
+        except Exception:
+            results.append((path, None))
+    return results
+
+
+def walk_audio_files(root: str) -> Iterator[Tuple[str, float, int]]:
+    """Yield (path, mtime, size) for every audio file under root.
+
+    Uses os.scandir so the stat data for most entries comes with the
+    directory listing. Hidden files and directories are skipped and
+    symlinked directories are not followed.
+    """
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        try:
+            with os.scandir(directory) as it:
+                entries = sorted(it, key=lambda entry: entry.name)
+        except OSError:
+            continue
+        subdirs = []
+        for entry in entries:
+            if entry.name.startswith("."):
+                continue
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.path)
+                elif entry.is_file() and is_audio_file(entry.name):
+                    st = entry.stat()
+                    yield entry.path, st.st_mtime, st.st_size
+            except OSError:
+                continue
+        stack.extend(reversed(subdirs))
+
+
+@dataclass
+class ScanJob:
+    """A library scan and its progress"""
+    id: str
+    roots: List[str]
+    status: str = "queued"
+    discovered: int = 0
+    unchanged: int = 0
+    to_probe: int = 0
+    probed: int = 0
+    failed: int = 0
+    removed: int = 0
+    added: int = 0
+    error: Optional[str] = None
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    paths: List[str] = field(default_factory=list, repr=False)
+    cancel_requested: bool = field(default=False, repr=False)
+
+
+class LibraryScanner:
+    """Walks folders and probes new or changed files in a process pool.
+
+    Files whose mtime and size match the metadata cache are not probed
+    again, and cache entries for files that disappeared from a scanned
+    folder are dropped, so rescanning a large library only costs a
+    directory walk plus the work for what actually changed.
+    """
+
+    def __init__(self, metadata: MetadataCache, processes: Optional[int] = None,
+                 batch_size: int = PROBE_BATCH_SIZE):
+        self.metadata = metadata
+        self.processes = processes or os.cpu_count() or 2
+        self.batch_size = batch_size
+        self.jobs: Dict[str, ScanJob] = {}
+        # Scans run one at a time; a single scan already uses every core
+        self._scan_lock = threading.Lock()
+
+    def create(self, roots: List[str]) -> ScanJob:
+        """Register a new scan job"""
+        job = ScanJob(id=uuid.uuid4().hex, roots=[os.path.abspath(root) for root in roots])
+        self.jobs[job.id] = job
+        return job
+
+    def get(self, job_id: str) -> Optional[ScanJob]:
+        return self.jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> bool:
+        """Ask a scan to stop; returns False if it already finished"""
+        job = self.jobs.get(job_id)
+        if job is None or job.status in FINAL_STATUSES:
+            return False
+        job.cancel_requested = True
+        return True
+
+    def describe(self, job: ScanJob) -> Dict[str, Any]:
+        """Job fields without the path list"""
+        return {
+            "id": job.id,
+            "roots": job.roots,
+            "status": job.status,
+            "discovered": job.discovered,
+            "unchanged": job.unchanged,
+            "to_probe": job.to_probe,
+            "probed": job.probed,
+            "failed": job.failed,
+            "removed": job.removed,
+            "added": job.added,
+            "error": job.error,
+            "started_at": job.started_at,
+            "finished_at": job.finished_at,
+        }
+
+    def scan(self, job: ScanJob,
+             on_progress: Optional[Callable[[ScanJob], None]] = None) -> List[str]:
+        """Run a scan (blocking); returns every playable path found, in walk order"""
+        def report(force: bool = False):
+            nonlocal last_report
+            now = time.monotonic()
+            if on_progress is not None and (force or now - last_report >= PROGRESS_INTERVAL):
+                last_report = now
+                on_progress(job)
+
+        last_report = 0.0
+        with self._scan_lock:
+            job.started_at = time.time()
+            try:
+                job.status = "scanning"
+                report(force=True)
+                to_probe = self._walk(job, report)
+                if not job.cancel_requested and to_probe:
+                    job.status = "probing"
+                    report(force=True)
+                    self._probe(job, to_probe, report)
+                job.status = "cancelled" if job.cancel_requested else "done"
+            except Exception as e:
+                job.status = "failed"
+                job.error = str(e)
+            job.finished_at = time.time()
+            report(force=True)
+            return job.paths if job.status == "done" else []
+
+    def _walk(self, job: ScanJob, report: Callable) -> List[str]:
+        """Collect paths and split them into unchanged and to-probe"""
+        to_probe = []
+        for root in job.roots:
+            seen = set()
+            for path, mtime, size in walk_audio_files(root):
+                if job.cancel_requested:
+                    return []
+                seen.add(path)
+                job.paths.append(path)
+                job.discovered += 1
+                cached = self.metadata.peek(path)
+                if cached is not None and (cached.mtime, cached.size) == (mtime, size):
+                    job.unchanged += 1
+                else:
+                    to_probe.append(path)
+                report()
+            stale = [path for path in self.metadata.paths_under(root) if path not in seen]
+            if stale:
+                self.metadata.invalidate_many(stale)
+                job.removed += len(stale)
+        job.to_probe = len(to_probe)
+        return to_probe
+
+    def _probe(self, job: ScanJob, paths: List[str], report: Callable):
+        """Probe files in worker processes, caching results batch by batch"""
+        batches = [paths[i:i + self.batch_size] for i in range(0, len(paths), self.batch_size)]
+        failed = set()
+        # Worker processes are spawned rather than forked: forking a process
+        # that has libVLC threads running is not safe
+        executor = ProcessPoolExecutor(
+            max_workers=min(self.processes, len(batches)),
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+        )
+        try:
+            for results in executor.map(_probe_batch, batches):
+                metas = [meta for _, meta in results if meta is not None]
+                failed.update(path for path, meta in results if meta is None)
+                self.metadata.put_many(metas)
+                job.probed += len(metas)
+                job.failed += len(results) - len(metas)
+                report()
+                if job.cancel_requested:
+                    break
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+        if failed:
+            job.paths = [path for path in job.paths if path not in failed]
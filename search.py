@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+Full-text search over the library's titles and tags
+"""
+import re
+import sqlite3
+import threading
+import unicodedata
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Set
+
+from database import DEFAULT_DB_PATH, TrackMetadata
+
+# Indexed fields and their bm25 weights: a hit in the title counts most
+FIELDS = ("title", "artist", "album", "genre")
+WEIGHTS = (10.0, 5.0, 3.0, 1.0)
+
+# Words shorter than this are only prefix-matched, never corrected
+MIN_FUZZY_LENGTH = 4
+# Most vocabulary words tried in place of one misspelt word, and most
+# words (those sharing the most trigrams with it) checked to find them
+MAX_CORRECTIONS = 8
+MAX_CANDIDATES = 200
+# Queries matching more tracks than this come back in index order: ranking
+# tens of thousands of matches (e.g. for a single letter) takes tens of
+# milliseconds, and the user is still typing anyway
+MAX_RANKED = 5000
+
+# Same split as FTS5's unicode61 tokenizer: runs of letters and digits
+_WORD = re.compile(r"[^\W_]+")
+
+
+def normalize(text: str) -> str:
+    """Lowercase and strip accents, so "Beyoncé" is found by "beyonce" """
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    return "".join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def words(text: str) -> List[str]:
+    return _WORD.findall(normalize(text))
+
+
+def _trigrams(word: str) -> Set[str]:
+    padded = f" {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """Levenshtein distance, giving up with limit + 1 once it exceeds limit"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (char_a != char_b),
+            ))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+@dataclass
+class SearchHit:
+    path: str
+    score: float
+    # True if the track only matched after correcting a misspelt word
+    fuzzy: bool = False
+
+
+class SearchIndex:
+    """An FTS5 index over track titles, artists, albums and genres.
+
+    Every query word is matched as a prefix, so results show up while the
+    user is still typing. When that finds fewer hits than asked for, words
+    that aren't in the index's vocabulary are also tried as their closest
+    spellings in it (found through a trigram index kept in memory).
+    Text is normalized before it is stored, so accents and case don't
+    matter. Subscribe update() to the metadata cache to keep it current;
+    a process that only reads an index another one writes subscribes
+    learn() instead, so its spelling vocabulary keeps up.
+    """
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS track_search USING fts5("
+            f"path UNINDEXED, {', '.join(FIELDS)}, prefix='1 2 3')"
+        )
+        self._conn.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS temp.track_search_vocab "
+            "USING fts5vocab(main, track_search, row)"
+        )
+        self._conn.commit()
+        self._rowids: Dict[str, int] = {
+            path: rowid for rowid, path in self._conn.execute("SELECT rowid, path FROM track_search")
+        }
+        self._next_rowid = max(self._rowids.values(), default=0) + 1
+        # Vocabulary for spelling correction; words whose tracks are gone
+        # linger until restart, which only costs a query that finds nothing
+        self._vocabulary: Set[str] = set()
+        self._by_trigram: Dict[str, Set[str]] = {}
+        self._learn(term for term, in self._conn.execute("SELECT term FROM temp.track_search_vocab"))
+
+    def __len__(self) -> int:
+        return len(self._rowids)
+
+    def _learn(self, terms: Iterable[str]):
+        for term in terms:
+            if term in self._vocabulary or len(term) < MIN_FUZZY_LENGTH - 1:
+                continue
+            self._vocabulary.add(term)
+            for trigram in _trigrams(term):
+                self._by_trigram.setdefault(trigram, set()).add(term)
+
+    def update(self, stored: List[TrackMetadata], dropped: List[str] = ()):
+        """Index (or reindex) tracks and forget dropped paths, in one transaction"""
+        with self._lock:
+            stale = [(self._rowids.pop(path),) for path in dropped if path in self._rowids]
+            stale += [(self._rowids.pop(meta.path),) for meta in stored if meta.path in self._rowids]
+            self._conn.executemany("DELETE FROM track_search WHERE rowid = ?", stale)
+            rows = []
+            for meta in stored:
+                values = [normalize(getattr(meta, field) or "") for field in FIELDS]
+                self._rowids[meta.path] = self._next_rowid
+                rows.append((self._next_rowid, meta.path, *values))
+                self._next_rowid += 1
+                self._learn(word for value in values for word in _WORD.findall(value))
+            self._conn.executemany(
+                f"INSERT INTO track_search (rowid, path, {', '.join(FIELDS)}) "
+                f"VALUES (?, ?, {', '.join('?' for _ in FIELDS)})",
+                rows,
+            )
+            self._conn.commit()
+
+    def learn(self, stored: List[TrackMetadata], dropped: List[str] = ()):
+        """Add the words of tracks indexed elsewhere to the spelling vocabulary"""
+        with self._lock:
+            self._learn(
+                word for meta in stored for field in FIELDS
+                for word in _WORD.findall(normalize(getattr(meta, field) or ""))
+            )
+
+    def rebuild(self, metas: List[TrackMetadata]):
+        """Replace the whole index with these tracks"""
+        with self._lock:
+            self._conn.execute("DELETE FROM track_search")
+            self._rowids.clear()
+        self.update(metas)
+
+    def corrections(self, word: str) -> List[str]:
+        """Vocabulary words within one edit (two for long words) of word, closest first"""
+        limit = 1 if len(word) < 7 else 2
+        trigrams = _trigrams(word)
+        shared: Counter = Counter()
+        with self._lock:
+            for trigram in trigrams:
+                shared.update(self._by_trigram.get(trigram, ()))
+        # Each edit breaks at most three trigrams
+        needed = len(trigrams) - 3 * limit
+        scored = []
+        for term, count in shared.most_common(MAX_CANDIDATES):
+            if count < needed or term == word or abs(len(term) - len(word)) > limit:
+                continue
+            distance = edit_distance(word, term, limit)
+            if distance <= limit:
+                scored.append((distance, -count, term))
+        return [term for _, _, term in sorted(scored)[:MAX_CORRECTIONS]]
+
+    def _query(self, match: str, limit: int) -> List[SearchHit]:
+        weights = ", ".join(str(weight) for weight in WEIGHTS)
+        with self._lock:
+            matches, = self._conn.execute(
+                "SELECT COUNT(*) FROM track_search WHERE track_search MATCH ?", (match,)
+            ).fetchone()
+            order = "ORDER BY rank" if matches <= MAX_RANKED else ""
+            rows = self._conn.execute(
+                f"SELECT path, bm25(track_search, 0, {weights}) AS rank FROM track_search "
+                f"WHERE track_search MATCH ? {order} LIMIT ?",
+                (match, limit),
+            ).fetchall()
+        return [SearchHit(path, -rank) for path, rank in rows]
+
+    def search(self, query: str, limit: int = 50) -> List[SearchHit]:
+        """Tracks matching every word of query, best first"""
+        query_words = words(query)
+        if not query_words or limit <= 0:
+            return []
+        hits = self._query(" AND ".join(f'"{word}"*' for word in query_words), limit)
+        if len(hits) >= limit:
+            return hits
+
+        groups = []
+        corrected = False
+        for word in query_words:
+            options = [f'"{word}"*']
+            if len(word) >= MIN_FUZZY_LENGTH and word not in self._vocabulary:
+                fixes = self.corrections(word)
+                options += [f'"{fix}"' for fix in fixes]
+                corrected = corrected or bool(fixes)
+            groups.append(f"({' OR '.join(options)})")
+        if not corrected:
+            return hits
+        found = {hit.path for hit in hits}
+        for hit in self._query(" AND ".join(groups), limit):
+            if hit.path not in found and len(hits) < limit:
+                hit.fuzzy = True
+                hits.append(hit)
+        return hits
+
+    def close(self):
+        """Close the underlying database connection"""
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""
+Audio streaming: HTTP range responses and a disk cache of transcoded files
+"""
+import hashlib
+import os
+import shutil
+import subprocess
+import threading
+import uuid
+from collections import OrderedDict
+from typing import BinaryIO, Callable, Dict, Mapping, Optional, Tuple
+
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+from metrics import timed
+
+TRANSCODE_DIR = os.path.join("cache", "transcode")
+DEFAULT_CACHE_BYTES = 2 * 1024 ** 3
+
+# Bytes read per chunk when the server can't sendfile
+STREAM_CHUNK_SIZE = 256 * 1024
+
+# Output format name -> (ffmpeg encoder, ffmpeg muxer, file extension, content type)
+TRANSCODE_FORMATS = {
+    "opus": ("libopus", "ogg", ".opus", "audio/ogg"),
+    "aac": ("aac", "adts", ".aac", "audio/aac"),
+}
+MIN_BITRATE = 32
+MAX_BITRATE = 320
+
+CONTENT_TYPES = {
+    ".mp3": "audio/mpeg",
+    ".flac": "audio/flac",
+    ".wav": "audio/wav",
+    ".m4a": "audio/mp4",
+    ".ogg": "audio/ogg",
+    ".opus": "audio/ogg",
+    ".aac": "audio/aac",
+    ".webm": "audio/webm",
+}
+
+
+class RangeNotSatisfiable(ValueError):
+    """Raised when a Range header doesn't overlap the file"""
+
+
+class TranscodeError(RuntimeError):
+    """Raised when ffmpeg is missing or fails"""
+
+
+def content_type(path: str) -> str:
+    return CONTENT_TYPES.get(os.path.splitext(path)[1].lower(), "application/octet-stream")
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """Parse a single-range `bytes=` header into an inclusive (start, end).
+
+    Returns None when the whole file should be sent (no header, or a form
+    we don't serve such as multiple ranges). Raises RangeNotSatisfiable
+    when the range lies outside the file.
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    first, _, last = header[len("bytes="):].strip().partition("-")
+    try:
+        if first:
+            start = int(first)
+            end = int(last) if last else size - 1
+        elif last:
+            # Suffix range: the last N bytes
+            start = max(0, size - int(last))
+            end = size - 1
+        else:
+            return None
+    except ValueError:
+        return None
+    if start >= size or start > end:
+        raise RangeNotSatisfiable(f"bytes */{size}")
+    return start, min(end, size - 1)
+
+
+class RangeFileResponse(Response):
+    """Sends part or all of an open file.
+
+    The file is opened by the caller, so a cache eviction that unlinks it
+    while the response is in flight doesn't matter. When the ASGI server
+    offers the zero-copy send extension the kernel copies the bytes with
+    sendfile; otherwise they are read in chunks off the event loop.
+    """
+
+    def __init__(self, file: BinaryIO, size: int, byte_range: Optional[Tuple[int, int]],
+                 media_type: str, headers: Optional[Mapping[str, str]] = None):
+        self.file = file
+        self.background = None
+        self.media_type = media_type
+        if byte_range is None:
+            self.start, self.end = 0, size - 1
+            self.status_code = 200
+        else:
+            self.start, self.end = byte_range
+            self.status_code = 206
+        all_headers = {
+            "accept-ranges": "bytes",
+            "content-length": str(self.end - self.start + 1),
+            **(headers or {}),
+        }
+        if byte_range is not None:
+            all_headers["content-range"] = f"bytes {self.start}-{self.end}/{size}"
+        self.init_headers(all_headers)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            await send({
+                "type": "http.response.start",
+                "status": self.status_code,
+                "headers": self.raw_headers,
+            })
+            count = self.end - self.start + 1
+            if scope["method"] == "HEAD" or count <= 0:
+                await send({"type": "http.response.body", "body": b""})
+            elif "http.response.zerocopysend" in scope.get("extensions", {}):
+                await send({
+                    "type": "http.response.zerocopysend",
+                    "file": self.file,
+                    "offset": self.start,
+                    "count": count,
+                })
+            else:
+                fd = self.file.fileno()
+                offset = self.start
+                while count > 0:
+                    chunk = await run_in_threadpool(os.pread, fd, min(STREAM_CHUNK_SIZE, count), offset)
+                    if not chunk:
+                        break
+                    offset += len(chunk)
+                    count -= len(chunk)
+                    await send({"type": "http.response.body", "body": chunk, "more_body": count > 0})
+                if count > 0:
+                    # File shrank under us; end the response rather than hang
+                    await send({"type": "http.response.body", "body": b""})
+        finally:
+            self.file.close()
+
+
+class DiskCache:
+    """Size-bounded LRU of generated files on disk.
+
+    Subclasses name entries so that a name always stands for the same
+    output; concurrent requests for the same entry share a single build.
+    """
+
+    def __init__(self, root: str, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._building: Dict[str, threading.Lock] = {}
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._total = 0
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(root, exist_ok=True)
+        # Rebuild the LRU order from the files left by a previous run
+        existing = []
+        for entry in os.scandir(root):
+            if not entry.is_file():
+                continue
+            if entry.name.startswith("."):
+                # Partial output of an encode that never finished
+                os.remove(entry.path)
+                continue
+            st = entry.stat()
+            existing.append((st.st_atime, entry.name, st.st_size))
+        for _, name, size in sorted(existing):
+            self._entries[name] = size
+            self._total += size
+        with self._lock:
+            self._evict()
+
+    @property
+    def total_bytes(self) -> int:
+        return self._total
+
+    def _open_or_build(self, name: str, build: Callable[[str], None], operation: str) -> Tuple[BinaryIO, int]:
+        """Open an entry, first calling build(dest) to write it on a miss (blocking).
+
+        The build is timed as `operation`. Returns the open file and its size.
+        """
+        opened = self._open_cached(name)
+        if opened is not None:
+            return opened
+        with self._lock:
+            build_lock = self._building.setdefault(name, threading.Lock())
+        with build_lock:
+            # Another request may have built it while we waited
+            opened = self._open_cached(name)
+            if opened is not None:
+                return opened
+            with self._lock:
+                self.misses += 1
+            tmp_path = os.path.join(self.root, "." + uuid.uuid4().hex)
+            try:
+                with timed(operation):
+                    build(tmp_path)
+                size = os.path.getsize(tmp_path)
+                os.replace(tmp_path, os.path.join(self.root, name))
+                # Open before anything can evict it
+                f = open(os.path.join(self.root, name), "rb")
+                with self._lock:
+                    self._entries[name] = size
+                    self._total += size
+                    self._evict(keep=name)
+                return f, size
+            finally:
+                with self._lock:
+                    self._building.pop(name, None)
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+
+    def _open_cached(self, name: str) -> Optional[Tuple[BinaryIO, int]]:
+        with self._lock:
+            if name not in self._entries:
+                return None
+            try:
+                f = open(os.path.join(self.root, name), "rb")
+            except FileNotFoundError:
+                self._total -= self._entries.pop(name)
+                return None
+            self._entries.move_to_end(name)
+            self.hits += 1
+            return f, self._entries[name]
+
+    def _evict(self, keep: Optional[str] = None):
+        """Drop least recently used entries until under max_bytes; lock must be held"""
+        for name in list(self._entries):
+            if self._total <= self.max_bytes:
+                break
+            if name == keep:
+                continue
+            self._total -= self._entries.pop(name)
+            try:
+                os.remove(os.path.join(self.root, name))
+            except FileNotFoundError:
+                pass
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+class TranscodeCache(DiskCache):
+    """Size-bounded LRU of transcoded files on disk.
+
+    Entries are keyed on the source file's path, mtime and size plus the
+    output format and bitrate, so an edited source is never served stale.
+    Concurrent requests for the same entry share a single ffmpeg run.
+    """
+
+    def __init__(self, root: str = TRANSCODE_DIR, max_bytes: int = DEFAULT_CACHE_BYTES):
+        super().__init__(root, max_bytes)
+
+    def key(self, source: str, fmt: str, bitrate: int) -> str:
+        """Cache file name for a source rendered in a format and bitrate"""
+        st = os.stat(source)
+        digest = hashlib.sha256(
+            f"{os.path.abspath(source)}\0{st.st_mtime_ns}\0{st.st_size}\0{fmt}\0{bitrate}".encode()
+        ).hexdigest()
+        return digest + TRANSCODE_FORMATS[fmt][2]
+
+    def open(self, source: str, fmt: str, bitrate: int) -> Tuple[BinaryIO, int]:
+        """Open the transcoded file, encoding it first on a miss (blocking).
+
+        Returns the open file and its size.
+        """
+        return self._open_or_build(
+            self.key(source, fmt, bitrate),
+            lambda dest: transcode(source, dest, fmt, bitrate),
+            "transcode",
+        )
+
+
+def transcode(source: str, dest: str, fmt: str, bitrate: int):
+    """Encode source to dest with ffmpeg (blocking)"""
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg is None:
+        raise TranscodeError("ffmpeg not found")
+    encoder, muxer, _, _ = TRANSCODE_FORMATS[fmt]
+    result = subprocess.run(
+        [ffmpeg, "-nostdin", "-v", "error", "-y", "-i", source, "-vn",
+         "-c:a", encoder, "-b:a", f"{bitrate}k", "-f", muxer, dest],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+    )
+    if result.returncode != 0:
+        raise TranscodeError(result.stderr.decode(errors="replace").strip() or "ffmpeg failed")
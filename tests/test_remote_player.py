@@ -0,0 +1,105 @@
+"""RemotePlayer keeping its copy of the daemon's playlist in step"""
+import asyncio
+import os
+import sys
+import tempfile
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ipc  # noqa: E402
+from ipc import IPCClient, IPCServer  # noqa: E402
+from playlist import IndexedPlaylist  # noqa: E402
+from remote_player import RemotePlayer  # noqa: E402
+
+pytestmark = pytest.mark.skipif(not ipc.available(), reason="needs Unix-domain sockets")
+
+
+class Daemon:
+    """Just enough of the playback daemon's IPC commands, around one playlist"""
+
+    def __init__(self, path: str):
+        self.playlist = IndexedPlaylist()
+        self.subscribers = []
+        self.loop = asyncio.new_event_loop()
+        self.server = IPCServer({
+            "subscribe": self.subscribe,
+            "snapshot": self.snapshot,
+            "add": self.add,
+        }, path)
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        asyncio.run_coroutine_threadsafe(self.server.start(), self.loop).result(5)
+
+    def stop(self):
+        asyncio.run_coroutine_threadsafe(self.server.stop(), self.loop).result(5)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(5)
+
+    async def subscribe(self, conn, since):
+        self.subscribers.append(conn)
+
+    async def snapshot(self, conn, since_version=None):
+        if since_version == self.playlist.version:
+            return None
+        return {
+            "items": list(self.playlist.items()),
+            "next_id": self.playlist.next_id,
+            "version": self.playlist.version,
+            "current_id": None,
+            "volume": 80,
+        }
+
+    async def add(self, conn, paths):
+        track_ids = self.playlist.extend(paths)
+        for subscriber in self.subscribers:
+            subscriber.send_event("playlist", {"action": "reload", "version": self.playlist.version})
+        return {
+            "added": [(track_id, self.playlist.path_of(track_id)) for track_id in track_ids],
+            "version": self.playlist.version,
+            "current_id": None,
+        }
+
+
+@pytest.fixture
+def daemon():
+    with tempfile.TemporaryDirectory() as root:
+        daemon = Daemon(os.path.join(root, "daemon.sock"))
+        yield daemon
+        daemon.stop()
+
+
+def test_edit_racing_another_client_resyncs(daemon):
+    desktop = RemotePlayer(IPCClient(daemon.server.path))
+    resyncs = []
+    desktop.on_resync = lambda: resyncs.append(True)
+    other = IPCClient(daemon.server.path)
+    try:
+        # The other client's edit lands before the desktop has seen its event
+        other.call("add", ["track000000.wav"])
+        desktop.add(["track000001.wav"])
+
+        assert [path for _, path in desktop.playlist.items()] == ["track000000.wav", "track000001.wav"]
+        assert resyncs
+        # Nothing is left for the late event to fetch
+        assert not desktop.sync()
+    finally:
+        other.close()
+        desktop.release()
+
+
+def test_own_edit_keeps_the_copy_without_a_snapshot(daemon):
+    desktop = RemotePlayer(IPCClient(daemon.server.path))
+    resyncs = []
+    desktop.on_resync = lambda: resyncs.append(True)
+    try:
+        desktop.add(["a.wav", "b.wav"])
+        desktop.add([])
+
+        assert [path for _, path in desktop.playlist.items()] == ["a.wav", "b.wav"]
+        assert not resyncs
+        assert not desktop.sync()
+    finally:
+        desktop.release()
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+Streaming, resumable upload handling with hashing during the copy
+"""
+import hashlib
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, BinaryIO, Dict, Iterator, Optional, Tuple
+
+from database import MediaObject, SavedUpload, UploadSessionStore
+from media_store import MEDIA_DIR, MediaStore
+
+# Partial files live next to the store so the final move is an atomic rename
+PARTIAL_DIR = os.path.join(MEDIA_DIR, ".partial")
+# Everything libVLC plays that downloads can be stored as (see
+# downloader.DownloadPolicy); keep in step with streaming.CONTENT_TYPES
+AUDIO_EXTENSIONS = ('.mp3', '.wav', '.flac', '.m4a', '.ogg', '.opus', '.aac', '.webm')
+
+# Uploads are copied in fixed-size chunks so memory stays bounded
+CHUNK_SIZE = 1024 * 1024
+
+# Resumable uploads with no data for this long are dropped at startup
+SESSION_MAX_AGE = 24 * 3600.0
+
+
+class UploadBusyError(RuntimeError):
+    """Raised when a session is already receiving data from another request"""
+
+
+def is_audio_file(filename: str) -> bool:
+    """Check the extension against the formats the player accepts"""
+    return filename.lower().endswith(AUDIO_EXTENSIONS)
+
+
+def safe_filename(filename: str) -> str:
+    """Strip any directory components a client may have sent"""
+    return os.path.basename(filename.replace("\\", "/")) or "upload"
+
+
+def store_stream(src: BinaryIO, filename: str, store: MediaStore) -> Tuple[MediaObject, bool]:
+    """Copy a file object into the media store in chunks, hashing as it goes.
+
+    The data is written to a temporary file and only moved into the store
+    once it is complete, so readers never see a partial file. Returns
+    (object, is_new); is_new is False when identical content was already
+    stored.
+    """
+    os.makedirs(PARTIAL_DIR, exist_ok=True)
+    tmp_path = os.path.join(PARTIAL_DIR, uuid.uuid4().hex)
+    hasher = hashlib.sha256()
+    try:
+        with open(tmp_path, "wb") as f:
+            while True:
+                chunk = src.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                hasher.update(chunk)
+                f.write(chunk)
+        return store.add(tmp_path, hasher.hexdigest(), safe_filename(filename))
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+@dataclass
+class UploadSession:
+    """A resumable upload in progress"""
+    id: str
+    filename: str
+    size: int
+    offset: int = 0
+    created_at: float = field(default_factory=time.time)
+    # None for a session restored after a restart, until the data so far is hashed again
+    hasher: Any = field(default_factory=hashlib.sha256, repr=False)
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+    # Held by the request appending to the session, so two can't interleave
+    writer: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    @property
+    def partial_path(self) -> str:
+        return os.path.join(PARTIAL_DIR, self.id)
+
+    @property
+    def complete(self) -> bool:
+        return self.offset >= self.size
+
+    @contextmanager
+    def appending(self) -> Iterator[None]:
+        """Claim the session for one request's writes"""
+        if not self.writer.acquire(blocking=False):
+            raise UploadBusyError("Upload already in progress")
+        try:
+            yield
+        finally:
+            self.writer.release()
+
+    def _hasher(self) -> Any:
+        """The running hash, rebuilt from the partial file after a restart (lock held)"""
+        if self.hasher is None:
+            hasher = hashlib.sha256()
+            with open(self.partial_path, "rb") as f:
+                for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                    hasher.update(chunk)
+            self.hasher = hasher
+        return self.hasher
+
+    def write(self, chunk: bytes):
+        """Append a chunk at the current offset"""
+        with self.lock:
+            if self.offset + len(chunk) > self.size:
+                raise ValueError("Upload exceeds declared size")
+            hasher = self._hasher()
+            with open(self.partial_path, "ab") as f:
+                f.write(chunk)
+            hasher.update(chunk)
+            self.offset += len(chunk)
+
+    def finish(self, store: MediaStore) -> Tuple[MediaObject, bool]:
+        """Move the completed upload into the media store"""
+        with self.lock:
+            if not self.complete:
+                raise ValueError(f"Upload incomplete: {self.offset} of {self.size} bytes")
+            return store.add(self.partial_path, self._hasher().hexdigest(), self.filename)
+
+    def discard(self):
+        """Delete the partial data"""
+        with self.lock:
+            if os.path.exists(self.partial_path):
+                os.remove(self.partial_path)
+
+
+class UploadSessionManager:
+    """Tracks resumable uploads by session id
+
+    With a store, sessions survive restarts: on startup each comes back
+    with its offset taken from its partial file. Sessions whose file
+    hasn't grown for `max_age` seconds are dropped, and partial files no
+    session owns (including streamed uploads cut off by the restart) are
+    deleted. Blocking; create it before uploads are accepted.
+    """
+
+    def __init__(self, store: Optional[UploadSessionStore] = None, max_age: float = SESSION_MAX_AGE):
+        self.store = store
+        self._sessions: Dict[str, UploadSession] = {}
+        self._lock = threading.Lock()
+        if store is not None:
+            self._restore(max_age)
+
+    def _restore(self, max_age: float):
+        now = time.time()
+        for saved in self.store.load():
+            session = UploadSession(
+                id=saved.id, filename=saved.filename, size=saved.size,
+                created_at=saved.created_at, hasher=None,
+            )
+            try:
+                st = os.stat(session.partial_path)
+            except FileNotFoundError:
+                st = None
+            if st is None or now - st.st_mtime > max_age or st.st_size > saved.size:
+                session.discard()
+                self.store.delete(saved.id)
+                continue
+            session.offset = st.st_size
+            self._sessions[session.id] = session
+        if os.path.isdir(PARTIAL_DIR):
+            for name in os.listdir(PARTIAL_DIR):
+                if name not in self._sessions:
+                    os.remove(os.path.join(PARTIAL_DIR, name))
+
+    def create(self, filename: str, size: int) -> UploadSession:
+        """Start a new upload session"""
+        os.makedirs(PARTIAL_DIR, exist_ok=True)
+        session = UploadSession(id=uuid.uuid4().hex, filename=safe_filename(filename), size=size)
+        open(session.partial_path, "wb").close()
+        if self.store is not None:
+            self.store.save(SavedUpload(session.id, session.filename, session.size, session.created_at))
+        with self._lock:
+            self._sessions[session.id] = session
+        return session
+
+    def get(self, session_id: str) -> Optional[UploadSession]:
+        with self._lock:
+            return self._sessions.get(session_id)
+
+    def remove(self, session_id: str) -> Optional[UploadSession]:
+        """Forget a session (blocking); deleting its data is up to the caller"""
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+        if session is not None and self.store is not None:
+            self.store.delete(session_id)
+        return session
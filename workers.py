@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Bounded worker pools that keep blocking libVLC / yt-dlp work off the event loop
+"""
+import asyncio
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+
+class PoolFullError(RuntimeError):
+    """Raised when a pool's queue is at capacity"""
+
+
+class WorkerPool:
+    """A thread pool with a concurrency limit and queue-depth accounting"""
+
+    def __init__(self, name: str, max_workers: int, max_queue: int = 0):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._active = 0
+        self._completed = 0
+        self._failed = 0
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        """Queue a call; raises PoolFullError if max_queue jobs are already waiting"""
+        with self._lock:
+            if self.max_queue and self._queued >= self.max_queue:
+                raise PoolFullError(f"{self.name} queue is full ({self.max_queue} pending)")
+            self._queued += 1
+        return self._executor.submit(self._wrap, fn, args, kwargs)
+
+    async def run(self, fn: Callable, *args, **kwargs) -> Any:
+        """Run a blocking call in the pool and await its result"""
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    def _wrap(self, fn: Callable, args, kwargs) -> Any:
+        with self._lock:
+            self._queued -= 1
+            self._active += 1
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException:
+            with self._lock:
+                self._active -= 1
+                self._failed += 1
+            raise
+        with self._lock:
+            self._active -= 1
+            self._completed += 1
+        return result
+
+    def stats(self) -> Dict[str, int]:
+        """Current queue depth and counters"""
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "queued": self._queued,
+                "active": self._active,
+                "completed": self._completed,
+                "failed": self._failed,
+            }
+
+    def shutdown(self, wait: bool = True):
+        """Stop accepting work and optionally wait for running jobs"""
+        self._executor.shutdown(wait=wait, cancel_futures=not wait)
+
+
+# libVLC objects are driven from a single control thread so player state
+# is only ever touched by one thread at a time.
+control = WorkerPool("control", max_workers=1)
+probe = WorkerPool("probe", max_workers=4, max_queue=10000)
+ingest = WorkerPool("ingest", max_workers=4, max_queue=1000)
+download = WorkerPool("download", max_workers=3, max_queue=1000)
+transcode = WorkerPool("transcode", max_workers=os.cpu_count() or 2, max_queue=100)
+# Background waveform/loudness analysis; kept small so it never starves playback
+analysis = WorkerPool("analysis", max_workers=2, max_queue=10000)
+# Library searches; separate so a query never waits behind a scan's probes
+search = WorkerPool("search", max_workers=2, max_queue=1000)
+
+POOLS = (control, probe, ingest, download, transcode, analysis, search)
+
+
+def stats() -> Dict[str, Dict[str, int]]:
+    """Stats for every pool, keyed by name"""
+    return {pool.name: pool.stats() for pool in POOLS}
+
+
+def shutdown(wait: bool = True):
+    """Shut down every pool"""
+    for pool in POOLS:
+        pool.shutdown(wait=wait)
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Player pool: independent playback zones sharing one libVLC instance
+"""
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from music_player import MusicPlayer
+
+DEFAULT_ZONE = "default"
+ZONE_NAME = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+# When the pool is full, idle zones unused for this long are evicted early;
+# the grace keeps a player a request has just looked up from going away
+FORCED_EVICTION_GRACE = 5.0
+
+
+class ZoneLimitError(RuntimeError):
+    """Raised when every player slot is taken by a zone in use"""
+
+
+class PlayerPool:
+    """One player per zone, created on first use and evicted when idle.
+
+    The factory is expected to hand every player the same libVLC instance
+    (e.g. music_player.shared_instance), so a zone only costs its
+    MediaPlayers. A zone that has been idle (stopped, and unused for
+    `idle_timeout` seconds) gives its players back. Keeping a zone's
+    playlist and settings is left to the players: the factory is expected
+    to restore what release() saved (as APIPlayer does with its
+    PlaylistStore), and `saved_zones` lists the zones that have such state,
+    so memory follows the zones in use rather than the number of zones
+    ever created.
+
+    get(), evict() and evict_idle() touch libVLC and must run on the
+    control thread; peek() may be called from anywhere.
+    """
+
+    def __init__(self, factory: Callable[[str], MusicPlayer],
+                 idle_timeout: float = 600.0, max_active: int = 32,
+                 pinned: tuple = (DEFAULT_ZONE,),
+                 saved_zones: Callable[[], Iterable[str]] = tuple):
+        self.factory = factory
+        self.saved_zones = saved_zones
+        self.idle_timeout = idle_timeout
+        self.max_active = max_active
+        self.pinned = set(pinned)
+        self._lock = threading.Lock()
+        self._players: Dict[str, MusicPlayer] = {}
+        self._last_used: Dict[str, float] = {}
+
+    def peek(self, zone: str) -> Optional[MusicPlayer]:
+        """The zone's player if it is live, marking it as used"""
+        with self._lock:
+            player = self._players.get(zone)
+            if player is not None:
+                self._last_used[zone] = time.monotonic()
+            return player
+
+    def get(self, zone: str) -> MusicPlayer:
+        """The zone's player, creating (or restoring) it if needed"""
+        player = self.peek(zone)
+        if player is not None:
+            return player
+        if len(self._players) >= self.max_active:
+            self.evict_idle(idle_timeout=min(self.idle_timeout, FORCED_EVICTION_GRACE))
+            if len(self._players) >= self.max_active:
+                raise ZoneLimitError(f"All {self.max_active} players are in use")
+        player = self.factory(zone)
+        with self._lock:
+            # Another caller may have created the zone while the factory ran
+            existing = self._players.get(zone)
+            if existing is None:
+                self._players[zone] = player
+            self._last_used[zone] = time.monotonic()
+        if existing is not None:
+            player.release()
+            return existing
+        return player
+
+    def evict(self, zone: str) -> bool:
+        """Release a zone's player; it saves its own state for later"""
+        if zone in self.pinned:
+            return False
+        with self._lock:
+            player = self._players.pop(zone, None)
+            self._last_used.pop(zone, None)
+        if player is None:
+            return False
+        player.release()
+        return True
+
+    def evict_idle(self, idle_timeout: Optional[float] = None) -> List[str]:
+        """Evict every unpinned zone that is idle; returns their names"""
+        timeout = self.idle_timeout if idle_timeout is None else idle_timeout
+        now = time.monotonic()
+        evicted = []
+        for zone in list(self._players):
+            if zone in self.pinned:
+                continue
+            # Checked and removed under one lock so a concurrent peek()
+            # either keeps the player alive or doesn't see it at all
+            with self._lock:
+                player = self._players.get(zone)
+                if player is None or now - self._last_used.get(zone, now) < timeout \
+                        or not player.is_idle():
+                    continue
+                del self._players[zone]
+                self._last_used.pop(zone, None)
+            player.release()
+            evicted.append(zone)
+        return evicted
+
+    def remove(self, zone: str) -> bool:
+        """Release a zone's player; returns False if the zone isn't known
+
+        Deleting its saved state is up to whoever owns it.
+        """
+        if zone in self.pinned:
+            return False
+        found = self.evict(zone)
+        return found or zone in self.saved_zones()
+
+    def live(self) -> List[MusicPlayer]:
+        """Every live player"""
+        with self._lock:
+            return list(self._players.values())
+
+    def zones(self) -> Dict[str, Dict[str, Any]]:
+        """Every known zone and whether its player is live"""
+        with self._lock:
+            live = dict(self._last_used)
+        now = time.monotonic()
+        result = {
+            zone: {"active": True, "idle_seconds": round(now - last_used, 1)}
+            for zone, last_used in live.items()
+        }
+        for zone in self.saved_zones():
+            result.setdefault(zone, {"active": False, "idle_seconds": None})
+        return result